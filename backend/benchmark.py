@@ -0,0 +1,157 @@
+"""Throughput of the hot list endpoints with one worker vs. several.
+
+Starts launcher.py once per worker count and seeds a dataset through the API when
+it is missing. Each endpoint then gets BENCH_SECONDS of load from BENCH_CONCURRENCY client
+threads, and the script prints requests/s with latency percentiles and the speedup
+over the first worker count:
+
+    MONGO_URL=mongodb://localhost:27017 python benchmark.py
+    BENCH_WORKERS=1,2,4 BENCH_SECONDS=20 python benchmark.py
+
+Multi-worker runs need a real MongoDB. With STORAGE_ENGINE=memory the launcher runs a
+single worker, so only the single-worker baseline is meaningful.
+"""
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT = int(os.environ.get("BENCH_PORT", "8101"))
+BASE_URL = f"http://127.0.0.1:{PORT}"
+WORKER_COUNTS = [int(n) for n in os.environ.get("BENCH_WORKERS", f"1,{os.cpu_count() or 1}").split(",")]
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "32"))
+SECONDS = float(os.environ.get("BENCH_SECONDS", "10"))
+SEED_CONTRACTS = int(os.environ.get("BENCH_CONTRACTS", "50"))
+SEED_TASKS_PER_CONTRACT = int(os.environ.get("BENCH_TASKS_PER_CONTRACT", "20"))
+OUTPUT = os.environ.get("BENCH_OUTPUT")
+
+# Hot read paths; heavy_route endpoints are left out since they shed load by design
+ENDPOINTS = [
+    "/api/contracts",
+    "/api/tasks",
+    "/api/activities?limit=50",
+    "/api/dashboard/my-tasks",
+]
+
+def start_server(workers: int) -> subprocess.Popen:
+    env = {**os.environ, "PORT": str(PORT), "WEB_CONCURRENCY": str(workers), "ACCESS_LOG": "false"}
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "launcher.py")], cwd=HERE, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{BASE_URL}/api/health/ready", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"Server with {workers} worker(s) did not become ready")
+
+def stop_server(process: subprocess.Popen):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def login() -> str:
+    # The default CEO is seeded in the background after startup
+    for _ in range(30):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": "ceo@arc.com", "password": "admin123"})
+        if response.status_code == 200:
+            return response.json()["access_token"]
+        time.sleep(1)
+    raise RuntimeError(f"Login failed: {response.text}")
+
+def seed(token: str):
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    existing = len(session.get(f"{BASE_URL}/api/contracts").json())
+    me = session.get(f"{BASE_URL}/api/auth/me").json()
+    for i in range(existing, SEED_CONTRACTS):
+        contract = session.post(f"{BASE_URL}/api/contracts", json={
+            "client_name": f"Bench Client {i}", "project_name": f"Bench Project {i}", "contract_value": 1_000_000 + i
+        }).json()
+        for j in range(SEED_TASKS_PER_CONTRACT):
+            session.post(f"{BASE_URL}/api/tasks", json={
+                "title": f"Bench task {i}-{j}", "contract_id": contract["id"], "assigned_to": me["id"]
+            })
+    if existing < SEED_CONTRACTS:
+        print(f"Seeded {SEED_CONTRACTS - existing} contracts with {SEED_TASKS_PER_CONTRACT} tasks each")
+
+def load(endpoint: str, token: str, seconds: float = SECONDS) -> dict:
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {token}"
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = session.get(f"{BASE_URL}{endpoint}", timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(CONCURRENCY)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    def percentile(p):
+        return round(statistics.quantiles(latencies, n=100)[p - 1] * 1000, 1) if len(latencies) > 1 else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+def main():
+    results = {}
+    for workers in WORKER_COUNTS:
+        process = start_server(workers)
+        try:
+            token = login()
+            seed(token)
+            for endpoint in ENDPOINTS:
+                load(endpoint, token, min(2, SECONDS))  # warm-up, discarded
+                results[(workers, endpoint)] = load(endpoint, token)
+        finally:
+            stop_server(process)
+
+    baseline = WORKER_COUNTS[0]
+    print(f"\n{'workers':>7}  {'endpoint':<28} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8}")
+    for (workers, endpoint), row in results.items():
+        speedup = row["rps"] / results[(baseline, endpoint)]["rps"] if results[(baseline, endpoint)]["rps"] else 0
+        print(f"{workers:>7}  {endpoint:<28} {row['rps']:>9} {row['p50_ms']!s:>8} {row['p95_ms']!s:>8} "
+              f"{row['p99_ms']!s:>8} {row['errors']:>7} {speedup:>7.2f}x")
+    if OUTPUT:
+        with open(OUTPUT, "w") as f:
+            json.dump([{"workers": w, "endpoint": e, **row} for (w, e), row in results.items()], f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Change-data-capture export of contracts, tasks, users and activities to columnar files,
+so analysts query local Parquet/Arrow files instead of the production database:
+
+    MONGO_URL=mongodb://... python cdc_export.py            # run continuously
+    python cdc_export.py --once                             # catch up, flush and exit
+    CDC_MODE=poll CDC_FORMAT=arrow python cdc_export.py
+
+Reads go through the analytics client (MONGO_ANALYTICS_*), never the API's primary pool.
+A first run snapshots every document, then follows changes: a change stream when the
+deployment is a replica set (CDC_MODE=auto|stream), otherwise the changed_at
+high-watermark the API stamps on writes that change a document (CDC_MODE=poll). Deletes
+are taken from tombstones and, for the tasks and activities the reaper removes along with
+a deleted contract or task, from cascade_deletes; documents moved by tenant relocation
+aren't reported as deleted.
+
+Files are written under CDC_DIR as
+
+    <collection>/tenant_id=<tenant>/date=<YYYY-MM-DD>/part-<time>-<n>.parquet
+
+Each row is one document version keyed by the document's id: _op
+(snapshot/insert/update/replace/delete), _changed_at and the document's top-level fields,
+with nested values as JSON and passwords dropped. Delete rows carry only id and tenant_id. A partition with CDC_COMPACT_FILES parts is rewritten as a single file
+holding only the latest version of each document. The checkpoint (_checkpoint.json) is
+saved after the files it covers, so a restart resumes without gaps; rows written just
+before a crash may repeat, and compaction drops them.
+
+Needs pyarrow (pip install -r requirements-cdc.txt) and a real MongoDB.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+import server
+
+CDC_DIR = os.environ.get("CDC_DIR", "cdc")
+CDC_MODE = os.environ.get("CDC_MODE", "auto")
+CDC_FORMAT = os.environ.get("CDC_FORMAT", "parquet")
+CDC_BATCH_SIZE = int(os.environ.get("CDC_BATCH_SIZE", "1000"))
+# Buffered rows are written once either limit is reached
+CDC_FLUSH_ROWS = int(os.environ.get("CDC_FLUSH_ROWS", "20000"))
+CDC_FLUSH_SECONDS = float(os.environ.get("CDC_FLUSH_SECONDS", "30"))
+CDC_POLL_SECONDS = float(os.environ.get("CDC_POLL_SECONDS", "10"))
+# Re-read this far behind the watermark so writes from workers with skewed clocks aren't missed
+CDC_OVERLAP_SECONDS = float(os.environ.get("CDC_OVERLAP_SECONDS", "5"))
+CDC_COMPACT_FILES = int(os.environ.get("CDC_COMPACT_FILES", "16"))
+
+COLLECTIONS = sorted(server.CHANGE_TRACKED_COLLECTIONS)
+TOMBSTONE_COLLECTIONS = {"contract": "contracts", "task": "tasks"}
+EXCLUDED_FIELDS = {"password"}
+EXTENSION = {"parquet": "parquet", "arrow": "arrow"}
+CHECKPOINT_PATH = os.path.join(CDC_DIR, "_checkpoint.json")
+
+def column_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=json_util.default, sort_keys=True)
+    return value
+
+def change_row(op: str, document: dict, changed_at: datetime) -> dict:
+    row = {"_op": op, "_changed_at": changed_at}
+    for field, value in document.items():
+        if field not in EXCLUDED_FIELDS:
+            row[field] = column_value(value)
+    return row
+
+def column_array(values: list):
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # A field holding different types across documents is kept as text
+        return pyarrow.array([None if value is None else str(value) for value in values])
+
+def read_table(path: str):
+    if path.endswith(".parquet"):
+        return pyarrow.parquet.read_table(path)
+    return pyarrow.feather.read_table(path)
+
+def write_table(rows: list, path: str):
+    # Documents of one collection don't all share the same fields; the file gets their union
+    columns = list(dict.fromkeys(field for row in rows for field in row))
+    table = pyarrow.Table.from_pydict({field: column_array([row.get(field) for row in rows]) for field in columns})
+    if CDC_FORMAT == "parquet":
+        pyarrow.parquet.write_table(table, path + ".tmp", compression="zstd")
+    else:
+        pyarrow.feather.write_feather(table, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+class PartitionWriter:
+    """Buffers rows per (collection, tenant, day) and writes each buffer as one part file"""
+
+    def __init__(self):
+        self.buffers = {}
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+        self.written = 0
+
+    def add(self, collection: str, row: dict):
+        partition = (collection, row.get("tenant_id") or server.DEFAULT_TENANT, row["_changed_at"].date().isoformat())
+        self.buffers.setdefault(partition, []).append(row)
+        self.buffered += 1
+
+    def due(self) -> bool:
+        return self.buffered >= CDC_FLUSH_ROWS or (self.buffered and time.monotonic() - self.last_flush >= CDC_FLUSH_SECONDS)
+
+    def flush(self):
+        for (collection, tenant_id, day), rows in self.buffers.items():
+            directory = os.path.join(CDC_DIR, collection, f"tenant_id={tenant_id}", f"date={day}")
+            os.makedirs(directory, exist_ok=True)
+            write_table(rows, os.path.join(directory, f"part-{time.time_ns()}-{uuid.uuid4().hex[:6]}.{EXTENSION[CDC_FORMAT]}"))
+            self.written += len(rows)
+            compact_partition(directory)
+        self.buffers.clear()
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+def compact_partition(directory: str, force: bool = False):
+    """Rewrite a partition's parts as one file with the latest version of each document"""
+    parts = sorted(name for name in os.listdir(directory) if not name.endswith(".tmp"))
+    if len(parts) < 2 or (len(parts) < CDC_COMPACT_FILES and not force):
+        return
+    latest = {}
+    for name in parts:
+        for row in read_table(os.path.join(directory, name)).to_pylist():
+            current = latest.get(row["id"])
+            # Parts sort by write time, so later rows win ties on _changed_at
+            if current is None or row["_changed_at"] >= current["_changed_at"]:
+                latest[row["id"]] = row
+    write_table(sorted(latest.values(), key=lambda row: row["_changed_at"]),
+                os.path.join(directory, f"compacted-{time.time_ns()}.{EXTENSION[CDC_FORMAT]}"))
+    for name in parts:
+        os.remove(os.path.join(directory, name))
+
+def load_checkpoint() -> dict:
+    if not os.path.exists(CHECKPOINT_PATH):
+        return {"snapshot": {}, "watermarks": {}}
+    with open(CHECKPOINT_PATH) as f:
+        return json_util.loads(f.read())
+
+def save_checkpoint(state: dict):
+    os.makedirs(CDC_DIR, exist_ok=True)
+    with open(CHECKPOINT_PATH + ".tmp", "w") as f:
+        f.write(json_util.dumps(state))
+    os.replace(CHECKPOINT_PATH + ".tmp", CHECKPOINT_PATH)
+
+def commit(writer: PartitionWriter, state: dict):
+    """Files first, then the checkpoint that covers them"""
+    writer.flush()
+    save_checkpoint(state)
+
+async def snapshot(writer: PartitionWriter, state: dict):
+    """Initial load of every document, resumable per collection by _id"""
+    for database_name in server.tenant_databases():
+        for name in COLLECTIONS:
+            key = f"{database_name}.{name}"
+            progress = state["snapshot"].setdefault(key, {"last_id": None, "done": False})
+            if progress["done"]:
+                continue
+            collection = server.analytics_client[database_name][name]
+            while not progress["done"]:
+                query = {"_id": {"$gt": progress["last_id"]}} if progress["last_id"] is not None else {}
+                batch = await collection.find(query).sort("_id", 1).to_list(CDC_BATCH_SIZE)
+                for document in batch:
+                    writer.add(name, change_row("snapshot", document, document.get("changed_at") or document.get("created_at") or datetime.utcnow()))
+                if batch:
+                    progress["last_id"] = batch[-1]["_id"]
+                else:
+                    progress["done"] = True
+                if writer.due() or progress["done"]:
+                    commit(writer, state)
+            print(f"Snapshot of {key} complete")
+
+def delete_row(deletion: dict) -> dict:
+    """Delete row from a tombstone or a cascade_deletes record"""
+    return change_row("delete", {"id": deletion["entity_id"], "tenant_id": deletion.get("tenant_id")}, deletion["deleted_at"])
+
+# ---------- watermark polling ----------
+
+async def poll_collection(writer: PartitionWriter, state: dict, database_name: str, name: str, field: str, emit) -> int:
+    key = f"{database_name}.{name}"
+    watermark = state["watermarks"].get(key) or state["started_at"]
+    collection = server.analytics_client[database_name][name]
+    lower = watermark - timedelta(seconds=CDC_OVERLAP_SECONDS)
+    seen = state.setdefault("recent", {}).setdefault(key, {})
+    query = {field: {"$gte": lower}}
+    emitted = 0
+    while True:
+        batch = await collection.find(query).sort([(field, 1), ("_id", 1)]).to_list(CDC_BATCH_SIZE)
+        for document in batch:
+            marker = str(document["_id"])
+            # Rows inside the overlap window that were already exported on the previous poll
+            if seen.get(marker) == document[field]:
+                continue
+            seen[marker] = document[field]
+            emit(document)
+            emitted += 1
+            watermark = max(watermark, document[field])
+        if len(batch) < CDC_BATCH_SIZE:
+            break
+        last = batch[-1]
+        query = {"$or": [{field: {"$gt": last[field]}}, {field: last[field], "_id": {"$gt": last["_id"]}}]}
+    state["watermarks"][key] = watermark
+    cutoff = watermark - timedelta(seconds=CDC_OVERLAP_SECONDS)
+    state["recent"][key] = {marker: at for marker, at in seen.items() if at >= cutoff}
+    return emitted
+
+async def poll_once(writer: PartitionWriter, state: dict) -> int:
+    changes = 0
+    for database_name in server.tenant_databases():
+        for name in COLLECTIONS:
+            changes += await poll_collection(writer, state, database_name, name, "changed_at",
+                                             lambda document, name=name: writer.add(name, change_row("update", document, document["changed_at"])))
+        changes += await poll_collection(writer, state, database_name, "tombstones", "deleted_at", emit_tombstone(writer))
+        changes += await poll_collection(writer, state, database_name, "cascade_deletes", "deleted_at", emit_cascade_delete(writer))
+    return changes
+
+def emit_tombstone(writer: PartitionWriter):
+    def emit(tombstone: dict):
+        if tombstone.get("entity_type") in TOMBSTONE_COLLECTIONS:
+            writer.add(TOMBSTONE_COLLECTIONS[tombstone["entity_type"]], delete_row(tombstone))
+    return emit
+
+def emit_cascade_delete(writer: PartitionWriter):
+    def emit(deletion: dict):
+        if deletion["collection"] in COLLECTIONS:
+            writer.add(deletion["collection"], delete_row(deletion))
+    return emit
+
+async def run_poll(writer: PartitionWriter, state: dict, once: bool):
+    while True:
+        changes = await poll_once(writer, state)
+        if once or writer.due():
+            commit(writer, state)
+        if once:
+            return
+        if not changes:
+            await asyncio.sleep(CDC_POLL_SECONDS)
+
+# ---------- change streams ----------
+
+async def run_stream(writer: PartitionWriter, state: dict, once: bool):
+    pipeline = [{"$match": {
+        "operationType": {"$in": ["insert", "update", "replace"]},
+        "ns.coll": {"$in": [*COLLECTIONS, "tombstones", "cascade_deletes"]}
+    }}]
+    options = {"full_document": "updateLookup"}
+    if state.get("resume_token"):
+        options["resume_after"] = state["resume_token"]
+    else:
+        options["start_at_operation_time"] = state["stream_start"]
+    async with server.analytics_client.watch(pipeline, **options) as stream:
+        while True:
+            change = await stream.try_next()
+            if change is not None:
+                document = change.get("fullDocument")
+                name = change["ns"]["coll"]
+                # fullDocument is None when the document was deleted before the lookup
+                if document is not None and name == "tombstones":
+                    if change["operationType"] == "insert":
+                        emit_tombstone(writer)(document)
+                elif document is not None and name == "cascade_deletes":
+                    if change["operationType"] == "insert":
+                        emit_cascade_delete(writer)(document)
+                elif document is not None:
+                    writer.add(name, change_row(change["operationType"], document, document.get("changed_at") or datetime.utcnow()))
+            state["resume_token"] = stream.resume_token
+            if writer.due() or (change is None and once):
+                commit(writer, state)
+            if change is None:
+                if once:
+                    return
+                await asyncio.sleep(1)
+
+async def supports_change_streams() -> bool:
+    hello = await server.analytics_client.admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+async def main(once: bool):
+    if pyarrow is None:
+        raise SystemExit("cdc_export.py needs pyarrow: pip install -r requirements-cdc.txt")
+    if server.STORAGE_ENGINE == "memory":
+        raise SystemExit("cdc_export.py reads from MongoDB; the memory engine keeps data inside the API process")
+    if CDC_FORMAT not in EXTENSION:
+        raise SystemExit(f"CDC_FORMAT must be one of {', '.join(EXTENSION)}")
+
+    await server.refresh_tenants()
+    state = load_checkpoint()
+    mode = CDC_MODE if CDC_MODE != "auto" else ("stream" if await supports_change_streams() else "poll")
+    if state.get("mode") not in (None, mode):
+        raise SystemExit(f"Checkpoint was written in {state['mode']} mode; remove {CHECKPOINT_PATH} to switch")
+    if "mode" not in state:
+        # Changes made while the snapshot runs are picked up afterwards from these positions
+        state["mode"] = mode
+        state["started_at"] = datetime.utcnow()
+        if mode == "stream":
+            state["stream_start"] = (await server.analytics_client.admin.command("hello"))["operationTime"]
+        save_checkpoint(state)
+
+    writer = PartitionWriter()
+    await snapshot(writer, state)
+    print(f"Following changes ({mode} mode)")
+    try:
+        if mode == "stream":
+            await run_stream(writer, state, once)
+        else:
+            await run_poll(writer, state, once)
+    finally:
+        commit(writer, state)
+        print(f"Exported {writer.written} rows to {CDC_DIR}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="catch up, flush and exit instead of following changes")
+    asyncio.run(main(parser.parse_args().once))
@@ -0,0 +1,52 @@
+"""Production entry point for the API: `python launcher.py`.
+
+Runs server:app under uvicorn with one worker process per CPU, uvloop and httptools
+when they are installed, and a graceful shutdown window. On SIGTERM each worker stops
+accepting connections, lets in-flight requests finish within GRACEFUL_SHUTDOWN_SECONDS,
+then drains queued background writes (see drain_background_work in server.py).
+
+Process-local state (rate limit buckets with RATE_LIMIT_BACKEND=memory, the token
+version cache, heavy-route semaphores, profiling targets) is per worker. The memory
+storage engine cannot be shared, so it always runs a single worker.
+"""
+import importlib.util
+import os
+import sys
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def launcher_options() -> dict:
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+    if os.environ.get("STORAGE_ENGINE", "mongo") == "memory" and workers > 1:
+        print("STORAGE_ENGINE=memory is per-process; running a single worker")
+        workers = 1
+    limit_concurrency = int(os.environ.get("LIMIT_CONCURRENCY", "0"))
+    return {
+        "host": os.environ.get("HOST", "0.0.0.0"),
+        "port": int(os.environ.get("PORT", "8001")),
+        "workers": max(1, workers),
+        "loop": "uvloop" if available("uvloop") else "asyncio",
+        "http": "httptools" if available("httptools") else "h11",
+        "backlog": int(os.environ.get("BACKLOG", "2048")),
+        "timeout_keep_alive": int(os.environ.get("KEEPALIVE_TIMEOUT_SECONDS", "5")),
+        "timeout_graceful_shutdown": int(os.environ.get("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        # Beyond this many concurrent connections per worker uvicorn answers 503
+        "limit_concurrency": limit_concurrency or None,
+        "proxy_headers": os.environ.get("TRUST_FORWARDED_FOR", "false").lower() == "true",
+        "forwarded_allow_ips": os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "access_log": os.environ.get("ACCESS_LOG", "true").lower() == "true",
+    }
+
+def main():
+    options = launcher_options()
+    print(f"Starting {options['workers']} worker(s) on {options['host']}:{options['port']} "
+          f"(loop={options['loop']}, http={options['http']})")
+    uvicorn.run("server:app", **options)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Unit tests for launcher.py options and the shutdown drain in server.py.
+
+Imports server with the memory storage engine, so no Mongo is needed. Run from backend/:
+    python -m pytest launcher_test.py
+"""
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+
+import server
+from launcher import launcher_options
+
+
+class LauncherOptionsTest(unittest.TestCase):
+    def test_memory_engine_forces_a_single_worker(self):
+        with mock.patch.dict(os.environ, {"STORAGE_ENGINE": "memory", "WEB_CONCURRENCY": "4"}):
+            self.assertEqual(launcher_options()["workers"], 1)
+
+    def test_worker_count_and_socket_settings_come_from_env(self):
+        env = {"STORAGE_ENGINE": "mongo", "WEB_CONCURRENCY": "3", "BACKLOG": "128", "KEEPALIVE_TIMEOUT_SECONDS": "9",
+               "GRACEFUL_SHUTDOWN_SECONDS": "12", "LIMIT_CONCURRENCY": "50"}
+        with mock.patch.dict(os.environ, env):
+            options = launcher_options()
+        self.assertEqual(
+            (options["workers"], options["backlog"], options["timeout_keep_alive"], options["timeout_graceful_shutdown"], options["limit_concurrency"]),
+            (3, 128, 9, 12, 50)
+        )
+
+    def test_concurrency_limit_is_off_by_default(self):
+        with mock.patch.dict(os.environ, {"LIMIT_CONCURRENCY": "0"}):
+            self.assertIsNone(launcher_options()["limit_concurrency"])
+
+
+class ShutdownDrainTest(unittest.IsolatedAsyncioTestCase):
+    async def test_drain_flushes_queued_fanouts_then_stops_background_loops(self):
+        with server.tenant_context(server.DEFAULT_TENANT):
+            await server.db.contracts.insert_one({"id": "drain-contract", "contract_number": "ARC-DRAIN", "project_name": "Renamed"})
+            await server.db.tasks.insert_one({"id": "drain-task", "contract_id": "drain-contract", "contract_number": "ARC-DRAIN", "project_name": "Old"})
+            server.start_background(server.summary_fanout_worker())
+            idle_loop = server.start_background(asyncio.sleep(3600))
+            server.enqueue_summary_fanout("contract", "drain-contract")
+
+            await server.drain_background_work()
+
+            task = await server.db.tasks.find_one({"id": "drain-task"})
+        self.assertEqual(task["project_name"], "Renamed")
+        self.assertEqual(server.summary_fanout_pending, {})
+        self.assertTrue(idle_loop.cancelled())
+        self.assertEqual(server.background_tasks, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
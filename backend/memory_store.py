@@ -0,0 +1,1071 @@
+"""In-process stand-in for the Motor client used by server.py (STORAGE_ENGINE=memory).
+
+Implements the slice of the Motor collection API the app relies on: filters, projections,
+update operators (including pipeline updates and array filters), unique and partial
+indexes, find_one_and_update, bulk_write and the aggregation stages used by the routes.
+Indexed fields get hash lookups on their first two keys, so equality filters on ids stay
+cheap as collections grow. Data lives only for the life of the process and every call
+runs synchronously on the event loop, which makes each operation atomic like a single
+document write in Mongo.
+"""
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from itertools import product
+from pymongo import ReturnDocument
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+MISSING = object()
+
+# ==================== VALUES ====================
+
+def _normalize(value):
+    """Copy a value the way a BSON round-trip would: naive UTC datetimes at ms precision"""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+def _freeze(value):
+    """Hashable form of a value, for group keys and index entries"""
+    if isinstance(value, dict):
+        return ("d", tuple((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return ("l", tuple(_freeze(v) for v in value))
+    return value
+
+def _type_rank(value) -> int:
+    # BSON comparison order, for sorting and cross-type comparisons
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank in (4, 5, 10):
+        return (rank, repr(value))
+    return (rank, value)
+
+def _eq(a, b) -> bool:
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+def _compare(a, b):
+    """-1/0/1, or None when the types are not comparable (Mongo type bracketing)"""
+    if _type_rank(a) != _type_rank(b) or _type_rank(a) in (4, 5, 10):
+        return None
+    if a is None or a is MISSING:
+        return 0
+    return (a > b) - (a < b)
+
+def _resolve(value, parts: list) -> list:
+    """Every value reachable at a dotted path, walking through arrays of subdocuments"""
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        return _resolve(value[parts[0]], parts[1:]) if parts[0] in value else []
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return _resolve(value[index], parts[1:]) if index < len(value) else []
+        found = []
+        for item in value:
+            if isinstance(item, dict):
+                found.extend(_resolve(item, parts))
+        return found
+    return []
+
+def _get_path(doc, path: str):
+    """Value at a dotted path as an aggregation expression sees it; arrays map element-wise"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list):
+            value = [item.get(part, MISSING) for item in value if isinstance(item, dict)]
+            value = [item for item in value if item is not MISSING]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+# ==================== QUERIES ====================
+
+def _expand(candidates: list) -> list:
+    expanded = []
+    for candidate in candidates:
+        expanded.append(candidate)
+        if isinstance(candidate, list):
+            expanded.extend(candidate)
+    return expanded
+
+def _match_operator(candidates: list, op: str, target) -> bool:
+    values = _expand(candidates)
+    if op == "$eq":
+        return any(_eq(v, target) for v in values) or (target is None and not candidates)
+    if op == "$ne":
+        return not _match_operator(candidates, "$eq", target)
+    if op == "$in":
+        return any(_match_operator(candidates, "$eq", t) for t in target)
+    if op == "$nin":
+        return not _match_operator(candidates, "$in", target)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        for value in values:
+            result = _compare(value, target)
+            if result is None:
+                continue
+            if (op == "$gt" and result > 0) or (op == "$gte" and result >= 0) or \
+               (op == "$lt" and result < 0) or (op == "$lte" and result <= 0):
+                return True
+        return False
+    if op == "$exists":
+        return bool(candidates) == bool(target)
+    if op == "$size":
+        return any(isinstance(c, list) and len(c) == target for c in candidates)
+    if op == "$elemMatch":
+        return any(
+            isinstance(c, list) and any(
+                matches(item, target) if isinstance(item, dict) else _match_conditions([item], target)
+                for item in c
+            )
+            for c in candidates
+        )
+    if op == "$not":
+        return not _match_conditions(candidates, target)
+    raise OperationFailure(f"Query operator {op} is not supported by the memory engine")
+
+def _is_operator_dict(cond) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+def _match_conditions(candidates: list, cond) -> bool:
+    if _is_operator_dict(cond):
+        return all(_match_operator(candidates, op, target) for op, target in cond.items())
+    return _match_operator(candidates, "$eq", cond)
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, cond in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, clause) for clause in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, clause) for clause in cond):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, clause) for clause in cond):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"Query operator {key} is not supported by the memory engine")
+        elif not _match_conditions(_resolve(doc, key.split(".")), cond):
+            return False
+    return True
+
+# ==================== PROJECTIONS ====================
+
+def _path_tree(paths) -> dict:
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[parts[-1]] = True
+    return tree
+
+def _include(value, tree: dict):
+    if isinstance(value, list):
+        return [_include(item, tree) for item in value if isinstance(item, (dict, list))]
+    if not isinstance(value, dict):
+        return MISSING
+    out = {}
+    for key in value:
+        sub = tree.get(key)
+        if sub is None:
+            continue
+        if sub is True:
+            out[key] = _copy(value[key])
+        else:
+            included = _include(value[key], sub)
+            if included is not MISSING:
+                out[key] = included
+    return out
+
+def _exclude(value, tree: dict):
+    if isinstance(value, list):
+        for item in value:
+            _exclude(item, tree)
+        return
+    if not isinstance(value, dict):
+        return
+    for key, sub in tree.items():
+        if key not in value:
+            continue
+        if sub is True:
+            del value[key]
+        else:
+            _exclude(value[key], sub)
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return _copy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", 1))
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if any(fields.values()):
+        out = _include(doc, _path_tree(k for k, v in fields.items() if v))
+        if include_id and "_id" in doc:
+            out = {"_id": doc["_id"], **out}
+        return out
+    out = _copy(doc)
+    _exclude(out, _path_tree(fields))
+    if not include_id:
+        out.pop("_id", None)
+    return out
+
+# ==================== EXPRESSIONS ====================
+
+def _expression_compare(op: str, a, b) -> bool:
+    result = _compare(a, b)
+    if result is None:
+        result = (_sort_key(a) > _sort_key(b)) - (_sort_key(a) < _sort_key(b))
+    return {"$eq": result == 0, "$ne": result != 0, "$gt": result > 0, "$gte": result >= 0, "$lt": result < 0, "$lte": result <= 0}[op]
+
+def _truthy(value) -> bool:
+    return value not in (None, False, 0, MISSING)
+
+def _number_or_date_sum(values):
+    total, base = 0, None
+    for value in values:
+        if value is None or value is MISSING:
+            return None
+        if isinstance(value, datetime):
+            base = value
+        else:
+            total += value
+    return base + timedelta(milliseconds=total) if base is not None else total
+
+def evaluate(expr, doc: dict):
+    """Aggregation expression against one document"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        if expr == "$$ROOT" or expr == "$$CURRENT":
+            return doc
+        return _get_path(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(item, doc) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {key: evaluate(value, doc) for key, value in expr.items()}
+    
+    op, arg = next(iter(expr.items()))
+    if op == "$literal":
+        return arg
+    if op == "$cond":
+        if isinstance(arg, dict):
+            arg = [arg["if"], arg["then"], arg["else"]]
+        return evaluate(arg[1] if _truthy(evaluate(arg[0], doc)) else arg[2], doc)
+    if op == "$ifNull":
+        for item in arg:
+            value = evaluate(item, doc)
+            if value is not None and value is not MISSING:
+                return value
+        return None
+    
+    args = [evaluate(item, doc) for item in arg] if isinstance(arg, list) else [evaluate(arg, doc)]
+    if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        return _expression_compare(op, args[0], args[1])
+    if op == "$and":
+        return all(_truthy(value) for value in args)
+    if op == "$or":
+        return any(_truthy(value) for value in args)
+    if op == "$not":
+        return not _truthy(args[0])
+    if op == "$in":
+        return any(_eq(args[0], value) for value in args[1])
+    if op == "$add":
+        return _number_or_date_sum(args)
+    if op == "$subtract":
+        a, b = args
+        if a is None or b is None or a is MISSING or b is MISSING:
+            return None
+        if isinstance(a, datetime) and isinstance(b, datetime):
+            return int((a - b).total_seconds() * 1000)
+        if isinstance(a, datetime):
+            return a - timedelta(milliseconds=b)
+        return a - b
+    if op == "$multiply":
+        if any(value is None or value is MISSING for value in args):
+            return None
+        result = 1
+        for value in args:
+            result *= value
+        return result
+    if op == "$divide":
+        if any(value is None or value is MISSING for value in args):
+            return None
+        return args[0] / args[1]
+    if op in ("$min", "$max"):
+        values = args[0] if len(args) == 1 and isinstance(args[0], list) else args
+        values = [value for value in values if value is not None and value is not MISSING]
+        if not values:
+            return None
+        return (min if op == "$min" else max)(values, key=_sort_key)
+    if op == "$size":
+        return len(args[0])
+    if op == "$sum":
+        values = args[0] if len(args) == 1 and isinstance(args[0], list) else args
+        return sum(value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool))
+    if op == "$toString":
+        return None if args[0] in (None, MISSING) else str(args[0])
+    raise OperationFailure(f"Expression operator {op} is not supported by the memory engine")
+
+# ==================== UPDATES ====================
+
+def _set_path(doc: dict, parts: list, apply, array_filters: dict):
+    """Call apply(container, key) for every location a (possibly $[ident]) path names"""
+    head, rest = parts[0], parts[1:]
+    if isinstance(doc, list):
+        if head == "$[]":
+            targets = range(len(doc))
+        elif head.startswith("$[") and head.endswith("]"):
+            condition = array_filters.get(head[2:-1])
+            if condition is None:
+                raise OperationFailure(f"No array filter found for identifier '{head[2:-1]}'")
+            targets = [i for i, item in enumerate(doc) if _element_matches(item, condition)]
+        elif head.isdigit():
+            index = int(head)
+            while len(doc) <= index:
+                doc.append(None)
+            targets = [index]
+        else:
+            raise OperationFailure(f"Cannot create field '{head}' in an array")
+        for index in targets:
+            if rest:
+                _set_path(doc[index], rest, apply, array_filters)
+            else:
+                apply(doc, index)
+        return
+    if not isinstance(doc, dict):
+        raise OperationFailure(f"Cannot create field '{head}' in a non-document value")
+    if rest:
+        if head not in doc or doc[head] is None:
+            doc[head] = {}
+        _set_path(doc[head], rest, apply, array_filters)
+    else:
+        apply(doc, head)
+
+def _element_matches(item, condition: dict) -> bool:
+    # Array filter conditions are keyed "<ident>" or "<ident>.<field>"
+    element_query = {}
+    for key, value in condition.items():
+        field = key.split(".", 1)[1] if "." in key else None
+        if field is None:
+            if not _match_conditions([item], value):
+                return False
+        else:
+            element_query[field] = value
+    return not element_query or (isinstance(item, dict) and matches(item, element_query))
+
+def _apply_operator(doc: dict, op: str, fields: dict, array_filters: dict, is_insert: bool):
+    for path, value in fields.items():
+        parts = path.split(".")
+        if op in ("$set", "$setOnInsert"):
+            if op == "$setOnInsert" and not is_insert:
+                continue
+            def apply(container, key, value=value):
+                container[key] = _normalize(value)
+        elif op == "$unset":
+            def apply(container, key):
+                if isinstance(container, dict):
+                    container.pop(key, None)
+                else:
+                    container[key] = None
+        elif op == "$inc":
+            def apply(container, key, value=value):
+                current = container.get(key, 0) if isinstance(container, dict) else container[key]
+                container[key] = (current or 0) + value
+        elif op in ("$max", "$min"):
+            def apply(container, key, value=value, op=op):
+                current = container.get(key, MISSING) if isinstance(container, dict) else container[key]
+                if current is MISSING or current is None:
+                    container[key] = _normalize(value)
+                    return
+                better = _sort_key(_normalize(value)) > _sort_key(current) if op == "$max" else _sort_key(_normalize(value)) < _sort_key(current)
+                if better:
+                    container[key] = _normalize(value)
+        elif op in ("$push", "$addToSet"):
+            items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+            def apply(container, key, items=items, op=op):
+                current = container.get(key) if isinstance(container, dict) else container[key]
+                if current is None:
+                    current = container[key] = []
+                for item in items:
+                    item = _normalize(item)
+                    if op == "$push" or not any(_eq(existing, item) for existing in current):
+                        current.append(item)
+        elif op == "$pull":
+            def apply(container, key, value=value):
+                current = container.get(key) if isinstance(container, dict) else container[key]
+                if isinstance(current, list):
+                    container[key] = [
+                        item for item in current
+                        if not (matches(item, value) if isinstance(value, dict) and not _is_operator_dict(value) and isinstance(item, dict) else _match_conditions([item], value))
+                    ]
+        else:
+            raise OperationFailure(f"Update operator {op} is not supported by the memory engine")
+        _set_path(doc, parts, apply, array_filters)
+
+def apply_update(doc: dict, update, array_filters=None, is_insert: bool = False):
+    """Mutate doc in place with an operator document or an aggregation pipeline update"""
+    if isinstance(update, list):
+        for stage in update:
+            op, fields = next(iter(stage.items()))
+            if op in ("$set", "$addFields"):
+                computed = {path: evaluate(expr, doc) for path, expr in fields.items()}
+                for path, value in computed.items():
+                    if value is MISSING:
+                        continue
+                    _apply_operator(doc, "$set", {path: value}, {}, is_insert)
+            elif op == "$unset":
+                _apply_operator(doc, "$unset", {path: "" for path in ([fields] if isinstance(fields, str) else fields)}, {}, is_insert)
+            else:
+                raise OperationFailure(f"Pipeline update stage {op} is not supported by the memory engine")
+        return
+    filters = {}
+    for condition in array_filters or []:
+        ident = next(iter(condition)).split(".", 1)[0]
+        filters.setdefault(ident, {}).update(condition)
+    for op, fields in update.items():
+        if not op.startswith("$"):
+            raise OperationFailure("Update document must contain only update operators")
+        _apply_operator(doc, op, fields, filters, is_insert)
+
+def _upsert_seed(query: dict) -> dict:
+    """Fields an upsert copies from its filter: the plain equality conditions"""
+    seed = {}
+    for key, cond in (query or {}).items():
+        if key == "$and":
+            for clause in cond:
+                for k, v in _upsert_seed(clause).items():
+                    seed[k] = v
+        elif key.startswith("$"):
+            continue
+        elif _is_operator_dict(cond):
+            if "$eq" in cond:
+                _apply_operator(seed, "$set", {key: cond["$eq"]}, {}, True)
+        else:
+            _apply_operator(seed, "$set", {key: cond}, {}, True)
+    return seed
+
+# ==================== AGGREGATION ====================
+
+def _accumulate(op: str, arg, docs: list):
+    if op == "$count":
+        return len(docs)
+    values = [evaluate(arg, doc) for doc in docs]
+    if op == "$sum":
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if op == "$avg":
+        numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        return sum(numbers) / len(numbers) if numbers else None
+    if op in ("$min", "$max"):
+        present = [v for v in values if v is not None and v is not MISSING]
+        if not present:
+            return None
+        return (min if op == "$min" else max)(present, key=_sort_key)
+    if op == "$first":
+        return None if not values or values[0] is MISSING else values[0]
+    if op == "$last":
+        return None if not values or values[-1] is MISSING else values[-1]
+    if op == "$push":
+        return [v for v in values if v is not MISSING]
+    if op == "$addToSet":
+        unique = {}
+        for v in values:
+            if v is not MISSING:
+                unique.setdefault(_freeze(v), v)
+        return list(unique.values())
+    raise OperationFailure(f"Accumulator {op} is not supported by the memory engine")
+
+def _group(docs: list, spec: dict) -> list:
+    groups = {}
+    for doc in docs:
+        key = evaluate(spec["_id"], doc)
+        if key is MISSING:
+            key = None
+        groups.setdefault(_freeze(key), (key, []))[1].append(doc)
+    out = []
+    for key, members in groups.values():
+        row = {"_id": key}
+        for field, accumulator in spec.items():
+            if field != "_id":
+                op, arg = next(iter(accumulator.items()))
+                row[field] = _accumulate(op, arg, members)
+        out.append(row)
+    return out
+
+def _project_stage(doc: dict, spec: dict) -> dict:
+    computed = {k: v for k, v in spec.items() if not isinstance(v, (bool, int, float))}
+    flags = {k: v for k, v in spec.items() if k not in computed}
+    if not computed and not any(v for k, v in flags.items() if k != "_id"):
+        return project(doc, spec)
+    out = project(doc, {k: 1 for k, v in flags.items() if v and k != "_id"} or {"_id": 1})
+    out.pop("_id", None)
+    if "_id" in computed:
+        value = evaluate(computed.pop("_id"), doc)
+        if value is not MISSING:
+            out = {"_id": value, **out}
+    elif flags.get("_id", 1) and "_id" in doc:
+        out = {"_id": doc["_id"], **out}
+    for path, expr in computed.items():
+        value = evaluate(expr, doc)
+        if value is not MISSING:
+            _apply_operator(out, "$set", {path: value}, {}, False)
+    return out
+
+def _sort_value(doc: dict, path: str, direction: int):
+    values = [v for v in _expand(_resolve(doc, path.split("."))) if not isinstance(v, list)]
+    if not values:
+        return _sort_key(None)
+    keys = [_sort_key(v) for v in values]
+    return min(keys) if direction >= 0 else max(keys)
+
+def sort_documents(docs: list, spec) -> list:
+    for path, direction in reversed(list(spec)):
+        docs = sorted(docs, key=lambda doc: _sort_value(doc, path, direction), reverse=direction < 0)
+    return docs
+
+def run_pipeline(database, docs: list, pipeline: list) -> list:
+    for stage in pipeline:
+        op, spec = next(iter(stage.items()))
+        if op == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif op == "$group":
+            docs = _group(docs, spec)
+        elif op == "$project":
+            docs = [_project_stage(doc, spec) for doc in docs]
+        elif op in ("$set", "$addFields"):
+            for doc in docs:
+                for path, expr in spec.items():
+                    value = evaluate(expr, doc)
+                    if value is not MISSING:
+                        _apply_operator(doc, "$set", {path: value}, {}, False)
+        elif op == "$unset":
+            docs = [project(doc, {path: 0 for path in ([spec] if isinstance(spec, str) else spec)}) for doc in docs]
+        elif op == "$sort":
+            docs = sort_documents(docs, spec.items())
+        elif op == "$limit":
+            docs = docs[:spec]
+        elif op == "$skip":
+            docs = docs[spec:]
+        elif op == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif op == "$unwind":
+            path = spec if isinstance(spec, str) else spec["path"]
+            keep_empty = isinstance(spec, dict) and spec.get("preserveNullAndEmptyArrays", False)
+            unwound = []
+            for doc in docs:
+                value = _get_path(doc, path[1:])
+                if isinstance(value, list) and value:
+                    for item in value:
+                        copy = _copy(doc)
+                        _apply_operator(copy, "$set", {path[1:]: item}, {}, False)
+                        unwound.append(copy)
+                elif isinstance(value, list) or value is None or value is MISSING:
+                    if keep_empty:
+                        unwound.append(doc)
+                else:
+                    unwound.append(doc)
+            docs = unwound
+        elif op == "$lookup":
+            foreign = database[spec["from"]]
+            for doc in docs:
+                local = _get_path(doc, spec["localField"])
+                local_values = local if isinstance(local, list) else [None if local is MISSING else local]
+                found = foreign._find({spec["foreignField"]: {"$in": local_values}})
+                doc[spec["as"]] = [_copy(item) for item in found]
+        elif op == "$facet":
+            docs = [{name: run_pipeline(database, [_copy(doc) for doc in docs], sub) for name, sub in spec.items()}]
+        else:
+            raise OperationFailure(f"Aggregation stage {op} is not supported by the memory engine")
+    return docs
+
+# ==================== COLLECTIONS ====================
+
+def _index_name(keys: list) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def _is_scalar(value) -> bool:
+    return not isinstance(value, (dict, list))
+
+def _equality_terms(query: dict):
+    """(field, values) pairs a document must equal one of; what the hash lookups can serve"""
+    for key, cond in (query or {}).items():
+        if key == "$and":
+            for clause in cond:
+                yield from _equality_terms(clause)
+        elif key.startswith("$"):
+            continue
+        elif _is_scalar(cond):
+            yield key, [cond]
+        elif _is_operator_dict(cond):
+            if "$eq" in cond and _is_scalar(cond["$eq"]):
+                yield key, [cond["$eq"]]
+            elif "$in" in cond and all(_is_scalar(v) for v in cond["$in"]):
+                yield key, list(cond["$in"])
+
+def _field_keys(doc: dict, field: str) -> set:
+    candidates = _resolve(doc, field.split("."))
+    if not candidates:
+        return {None}
+    keys = set()
+    for candidate in candidates:
+        if isinstance(candidate, list):
+            keys.update(_freeze(item) for item in candidate)
+            if not candidate:
+                keys.add(None)
+        keys.add(_freeze(candidate))
+    return keys
+
+class MemoryCursor:
+    def __init__(self, collection, query: dict, projection=None, sort=None, limit: int = 0, skip: int = 0):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort = list(sort) if sort else []
+        self._limit = limit
+        self._skip = skip
+
+    def sort(self, key, direction=None):
+        self._sort = [(key, direction if direction is not None else 1)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def _results(self) -> list:
+        docs = self.collection._find(self.query)
+        if self._sort:
+            docs = sort_documents(docs, self._sort)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(doc, self.projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results():
+            yield doc
+
+class MemoryAggregateCursor:
+    def __init__(self, collection, pipeline: list):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    def _results(self) -> list:
+        docs = [_copy(doc) for doc in self.collection._find({})]
+        return run_pipeline(self.collection.database, docs, self.pipeline)
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results():
+            yield doc
+
+class MemoryCollection:
+    """One collection: documents by _id, hash lookups on the first two fields of each index
+    (the second so indexes led by a partition key such as tenant_id stay selective) and key
+    sets for unique indexes. TTL options are recorded but never expire documents."""
+
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._order = {}
+        self._sequence = 0
+        self._indexes = {"_id_": {"key": [("_id", 1)]}}
+        self._lookups = {}
+        self._unique = {}
+
+    # ----- index maintenance -----
+
+    def _unique_keys(self, name: str, doc: dict) -> list:
+        spec = self._indexes[name]
+        partial = spec.get("partialFilterExpression")
+        if partial and not matches(doc, partial):
+            return []
+        fields = [field for field, _ in spec["key"]]
+        if spec.get("sparse") and not any(_resolve(doc, f.split(".")) for f in fields):
+            return []
+        return list(product(*[_field_keys(doc, field) for field in fields]))
+
+    def _add_entries(self, key, doc: dict):
+        for field, lookup in self._lookups.items():
+            for value in _field_keys(doc, field):
+                lookup.setdefault(value, set()).add(key)
+        for name, entries in self._unique.items():
+            for unique_key in self._unique_keys(name, doc):
+                entries[unique_key] = key
+
+    def _remove_entries(self, key, doc: dict):
+        for field, lookup in self._lookups.items():
+            for value in _field_keys(doc, field):
+                bucket = lookup.get(value)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del lookup[value]
+        for name, entries in self._unique.items():
+            for unique_key in self._unique_keys(name, doc):
+                if entries.get(unique_key) == key:
+                    del entries[unique_key]
+
+    def _check_unique(self, key, doc: dict):
+        for name, entries in self._unique.items():
+            for unique_key in self._unique_keys(name, doc):
+                owner = entries.get(unique_key)
+                if owner is not None and owner != key:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.database.name}.{self.name} index: {name} dup key: {unique_key}",
+                        11000
+                    )
+
+    def _store(self, key, old, new: dict):
+        """Swap a document in, keeping lookups consistent and enforcing unique indexes"""
+        if old is not None:
+            self._remove_entries(key, old)
+        elif key in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.database.name}.{self.name} index: _id_ dup key: {key}", 11000)
+        try:
+            self._check_unique(key, new)
+        except DuplicateKeyError:
+            if old is not None:
+                self._add_entries(key, old)
+            raise
+        if old is None:
+            self._sequence += 1
+            self._order[key] = self._sequence
+        self._docs[key] = new
+        self._add_entries(key, new)
+
+    def _delete(self, key):
+        doc = self._docs.pop(key)
+        self._order.pop(key, None)
+        self._remove_entries(key, doc)
+
+    def _find(self, query: dict) -> list:
+        """Matching stored documents (not copies) in insertion order"""
+        best = None
+        for field, values in _equality_terms(query):
+            if field == "_id":
+                keys = {_freeze(v) for v in values if _freeze(v) in self._docs}
+            elif field in self._lookups:
+                lookup = self._lookups[field]
+                keys = set().union(*[lookup.get(_freeze(v), ()) for v in values]) if values else set()
+            else:
+                continue
+            if best is None or len(keys) < len(best):
+                best = keys
+        if best is None:
+            return [doc for doc in self._docs.values() if matches(doc, query)]
+        docs = [(self._order[key], self._docs[key]) for key in best if key in self._docs]
+        docs.sort(key=lambda item: item[0])
+        return [doc for _, doc in docs if matches(doc, query)]
+
+    # ----- reads -----
+
+    def find(self, filter: dict = None, projection=None, sort=None, limit: int = 0, skip: int = 0, **kwargs):
+        return MemoryCursor(self, filter, projection, sort, limit, skip)
+
+    async def find_one(self, filter: dict = None, projection=None, sort=None, **kwargs):
+        results = await MemoryCursor(self, filter, projection, sort, 1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter: dict, limit: int = 0, skip: int = 0, **kwargs) -> int:
+        count = max(0, len(self._find(filter)) - skip)
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter: dict = None, **kwargs) -> list:
+        values = {}
+        for doc in self._find(filter or {}):
+            for value in _expand(_resolve(doc, key.split("."))):
+                if not isinstance(value, list):
+                    values.setdefault(_freeze(value), value)
+        return list(values.values())
+
+    def aggregate(self, pipeline: list, **kwargs):
+        return MemoryAggregateCursor(self, pipeline)
+
+    # ----- writes -----
+
+    def _insert(self, document: dict):
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        self._store(_freeze(document["_id"]), None, _normalize(document))
+        return document["_id"]
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> InsertManyResult:
+        return InsertManyResult([self._insert(document) for document in documents], True)
+
+    def _update(self, filter: dict, update, upsert: bool, many: bool, array_filters=None, replacement: bool = False) -> dict:
+        targets = self._find(filter)
+        if not many:
+            targets = targets[:1]
+        modified = 0
+        for old in targets:
+            if replacement:
+                new = {"_id": old["_id"], **_normalize(update)}
+            else:
+                new = _copy(old)
+                apply_update(new, update, array_filters)
+            if new != old:
+                self._store(_freeze(old["_id"]), old, new)
+                modified += 1
+        result = {"n": len(targets), "nModified": modified}
+        if not targets and upsert:
+            seed = _upsert_seed(filter)
+            if replacement:
+                seed = {**({"_id": seed["_id"]} if "_id" in seed else {}), **_normalize(update)}
+            else:
+                apply_update(seed, update, array_filters, is_insert=True)
+            result.update({"n": 1, "upserted": self._insert(seed)})
+        return result
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, array_filters=None, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, False, array_filters), True)
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, array_filters=None, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, True, array_filters), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, False, replacement=True), True)
+
+    def _remove(self, filter: dict, many: bool) -> int:
+        targets = self._find(filter)
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            self._delete(_freeze(doc["_id"]))
+        return len(targets)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._remove(filter, False)}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._remove(filter, True)}, True)
+
+    async def find_one_and_update(self, filter: dict, update, projection=None, sort=None, upsert: bool = False,
+                                  return_document: bool = ReturnDocument.BEFORE, array_filters=None, **kwargs):
+        targets = self._find(filter)
+        if sort:
+            targets = sort_documents(targets, sort)
+        if targets:
+            old = targets[0]
+            new = _copy(old)
+            apply_update(new, update, array_filters)
+            if new != old:
+                self._store(_freeze(old["_id"]), old, new)
+            return project(new if return_document else old, projection)
+        if not upsert:
+            return None
+        seed = _upsert_seed(filter)
+        apply_update(seed, update, array_filters, is_insert=True)
+        inserted = self._docs[_freeze(self._insert(seed))]
+        return project(inserted, projection) if return_document else None
+
+    async def find_one_and_delete(self, filter: dict, projection=None, sort=None, **kwargs):
+        targets = self._find(filter)
+        if sort:
+            targets = sort_documents(targets, sort)
+        if not targets:
+            return None
+        doc = targets[0]
+        self._delete(_freeze(doc["_id"]))
+        return project(doc, projection)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        summary = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0, "nRemoved": 0, "upserted": [], "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    summary["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    result = self._update(
+                        request._filter, request._doc, request._upsert, isinstance(request, UpdateMany),
+                        getattr(request, "_array_filters", None), replacement=isinstance(request, ReplaceOne)
+                    )
+                    if "upserted" in result:
+                        summary["nUpserted"] += 1
+                        summary["upserted"].append({"index": index, "_id": result["upserted"]})
+                    else:
+                        summary["nMatched"] += result["n"]
+                        summary["nModified"] += result["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    summary["nRemoved"] += self._remove(request._filter, isinstance(request, DeleteMany))
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation {type(request).__name__}")
+            except DuplicateKeyError as e:
+                summary["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+        if summary["writeErrors"]:
+            raise BulkWriteError(summary)
+        return BulkWriteResult(summary, True)
+
+    # ----- indexes -----
+
+    async def create_index(self, keys, **options) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else [tuple(key) for key in keys]
+        name = options.pop("name", None) or _index_name(keys)
+        if name in self._indexes:
+            return name
+        spec = {"key": keys, **options}
+        self._indexes[name] = spec
+        if options.get("unique"):
+            entries = self._unique[name] = {}
+            for key, doc in self._docs.items():
+                for unique_key in self._unique_keys(name, doc):
+                    if unique_key in entries:
+                        del self._indexes[name], self._unique[name]
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.database.name}.{self.name} index: {name} dup key: {unique_key}", 11000)
+                    entries[unique_key] = key
+        for field, _ in keys[:2]:
+            if field != "_id" and field not in self._lookups:
+                lookup = self._lookups[field] = {}
+                for key, doc in self._docs.items():
+                    for value in _field_keys(doc, field):
+                        lookup.setdefault(value, set()).add(key)
+        return name
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list:
+        return [await self.create_index(index.document["key"].items(), **{k: v for k, v in index.document.items() if k != "key"}) for index in indexes]
+
+    async def index_information(self) -> dict:
+        return {name: {"v": 2, **spec} for name, spec in self._indexes.items()}
+
+    async def drop_index(self, index_or_name):
+        name = index_or_name if isinstance(index_or_name, str) else _index_name(index_or_name)
+        if name not in self._indexes or name == "_id_":
+            raise OperationFailure(f"index not found with name [{name}]")
+        dropped = self._indexes.pop(name)["key"][:2]
+        self._unique.pop(name, None)
+        for field, _ in dropped:
+            if not any(field in [f for f, _ in spec["key"][:2]] for spec in self._indexes.values()):
+                self._lookups.pop(field, None)
+
+    async def drop(self):
+        self.__init__(self.database, self.name)
+
+class MemoryDatabase:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> list:
+        return list(self._collections)
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "ismaster", "hello", "buildinfo"):
+            return {"ok": 1.0}
+        raise OperationFailure(f"Command {name} is not supported by the memory engine")
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient; databases are created on first access"""
+
+    def __init__(self, *args, **kwargs):
+        self._databases = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name, None)
+
+    def close(self):
+        pass
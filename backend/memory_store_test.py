@@ -0,0 +1,227 @@
+"""Unit tests for the in-memory Motor stand-in (memory_store.py).
+
+Covers the behaviour server.py relies on when STORAGE_ENGINE=memory. Run from backend/:
+    python -m pytest memory_store_test.py
+"""
+import unittest
+from datetime import datetime, timedelta
+
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from memory_store import MemoryClient, apply_update, matches, project
+
+
+class MatchingTest(unittest.TestCase):
+    doc = {
+        "id": "c1",
+        "status": "active",
+        "staff_list": [{"user_id": "u1", "payment_amount": 100}, {"user_id": "u2", "payment_amount": 50}],
+        "tags": ["a", "b"],
+        "due_date": datetime(2026, 1, 10),
+        "assigned_to": None
+    }
+
+    def test_dotted_paths_reach_into_arrays(self):
+        self.assertTrue(matches(self.doc, {"staff_list.user_id": "u2"}))
+        self.assertFalse(matches(self.doc, {"staff_list.user_id": "u3"}))
+        self.assertTrue(matches(self.doc, {"tags": "a"}))
+
+    def test_elem_match_needs_one_element_to_satisfy_every_condition(self):
+        self.assertTrue(matches(self.doc, {"staff_list": {"$elemMatch": {"user_id": "u1", "payment_amount": {"$gte": 100}}}}))
+        self.assertFalse(matches(self.doc, {"staff_list": {"$elemMatch": {"user_id": "u2", "payment_amount": {"$gte": 100}}}}))
+
+    def test_comparison_operators(self):
+        self.assertTrue(matches(self.doc, {"due_date": {"$lte": datetime(2026, 1, 10), "$gt": datetime(2026, 1, 1)}}))
+        self.assertTrue(matches(self.doc, {"status": {"$in": ["active", "paused"]}}))
+        self.assertTrue(matches(self.doc, {"status": {"$nin": ["done"]}}))
+        self.assertTrue(matches(self.doc, {"tags": {"$size": 2}}))
+
+    def test_null_and_missing_fields(self):
+        self.assertTrue(matches(self.doc, {"assigned_to": None}))
+        self.assertTrue(matches(self.doc, {"missing": None}))
+        self.assertTrue(matches(self.doc, {"missing": {"$exists": False}}))
+        self.assertTrue(matches(self.doc, {"assigned_to": {"$exists": True}}))
+        self.assertTrue(matches(self.doc, {"is_overdue": {"$ne": True}}))
+
+    def test_logical_operators(self):
+        self.assertTrue(matches(self.doc, {"$or": [{"status": "done"}, {"tags": "b"}]}))
+        self.assertFalse(matches(self.doc, {"$and": [{"status": "active"}, {"tags": "c"}]}))
+        self.assertTrue(matches(self.doc, {"$nor": [{"status": "done"}]}))
+        self.assertTrue(matches(self.doc, {"status": {"$not": {"$in": ["done"]}}}))
+
+
+class ProjectionTest(unittest.TestCase):
+    doc = {"_id": 1, "id": "c1", "tax": 5, "staff_list": [{"user_id": "u1", "payment_amount": 100}]}
+
+    def test_inclusion_keeps_id_and_named_nested_fields(self):
+        self.assertEqual(project(self.doc, {"id": 1, "staff_list.user_id": 1}), {"_id": 1, "id": "c1", "staff_list": [{"user_id": "u1"}]})
+        self.assertEqual(project(self.doc, {"_id": 0, "id": 1}), {"id": "c1"})
+
+    def test_exclusion_drops_nested_fields(self):
+        self.assertEqual(project(self.doc, {"tax": 0, "staff_list.payment_amount": 0}), {"_id": 1, "id": "c1", "staff_list": [{"user_id": "u1"}]})
+
+    def test_projection_returns_a_copy(self):
+        projected = project(self.doc, None)
+        projected["staff_list"][0]["user_id"] = "changed"
+        self.assertEqual(self.doc["staff_list"][0]["user_id"], "u1")
+
+
+class UpdateOperatorTest(unittest.TestCase):
+    def test_field_operators(self):
+        doc = {"count": 1, "last": datetime(2026, 1, 1), "old": True}
+        apply_update(doc, {
+            "$inc": {"count": 2, "fresh": 1},
+            "$max": {"last": datetime(2026, 2, 1)},
+            "$unset": {"old": ""},
+            "$set": {"nested.value": 3}
+        })
+        self.assertEqual(doc, {"count": 3, "fresh": 1, "last": datetime(2026, 2, 1), "nested": {"value": 3}})
+        apply_update(doc, {"$max": {"last": datetime(2025, 1, 1)}, "$min": {"count": 0}})
+        self.assertEqual((doc["last"], doc["count"]), (datetime(2026, 2, 1), 0))
+
+    def test_array_operators(self):
+        doc = {"depends_on": ["a"]}
+        apply_update(doc, {"$push": {"depends_on": {"$each": ["b", "c"]}}})
+        apply_update(doc, {"$addToSet": {"depends_on": "a"}})
+        apply_update(doc, {"$pull": {"depends_on": {"$in": ["b"]}}})
+        self.assertEqual(doc["depends_on"], ["a", "c"])
+
+    def test_set_on_insert_only_applies_to_inserts(self):
+        doc = {}
+        apply_update(doc, {"$setOnInsert": {"created": 1}})
+        self.assertEqual(doc, {})
+        apply_update(doc, {"$setOnInsert": {"created": 1}}, is_insert=True)
+        self.assertEqual(doc, {"created": 1})
+
+    def test_array_filters_update_matching_elements(self):
+        doc = {"staff_list": [{"user_id": "u1", "user_name": "Old"}, {"user_id": "u2", "user_name": "Other"}]}
+        apply_update(doc, {"$set": {"staff_list.$[member].user_name": "New"}}, array_filters=[{"member.user_id": "u1"}])
+        self.assertEqual([s["user_name"] for s in doc["staff_list"]], ["New", "Other"])
+
+    def test_pipeline_update_refills_a_token_bucket(self):
+        # The shape of MongoRateLimitStore.take
+        now = datetime(2026, 1, 1, 0, 0, 10)
+        doc = {"tokens": 0.0, "updated_at": now - timedelta(seconds=4)}
+        elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        apply_update(doc, [
+            {"$set": {"tokens": {"$min": [5, {"$add": [{"$ifNull": ["$tokens", 5]}, {"$multiply": [elapsed_seconds, 0.5]}]}]}, "updated_at": now}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}}
+        ])
+        self.assertEqual(doc, {"tokens": 1.0, "updated_at": now, "allowed": True})
+
+
+class CollectionTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.db = MemoryClient()["test"]
+
+    async def test_find_sort_skip_limit_and_count(self):
+        await self.db.tasks.insert_many([{"id": str(i), "rank": i % 3, "n": i} for i in range(6)])
+        docs = await self.db.tasks.find({"rank": {"$lt": 2}}, {"_id": 0, "n": 1}).sort([("rank", -1), ("n", 1)]).skip(1).limit(2).to_list(None)
+        self.assertEqual(docs, [{"n": 4}, {"n": 0}])
+        self.assertEqual(await self.db.tasks.count_documents({"rank": 0}), 2)
+        self.assertEqual(await self.db.tasks.count_documents({}, limit=1), 1)
+        self.assertEqual(sorted(await self.db.tasks.distinct("rank")), [0, 1, 2])
+
+    async def test_indexed_lookups_follow_updates_and_deletes(self):
+        await self.db.tasks.create_index([("tenant_id", 1), ("assigned_to", 1)])
+        await self.db.tasks.insert_one({"id": "t1", "tenant_id": "x", "assigned_to": "u1"})
+        await self.db.tasks.update_one({"id": "t1"}, {"$set": {"assigned_to": "u2"}})
+        self.assertIsNone(await self.db.tasks.find_one({"tenant_id": "x", "assigned_to": "u1"}))
+        self.assertEqual((await self.db.tasks.find_one({"tenant_id": "x", "assigned_to": "u2"}))["id"], "t1")
+        await self.db.tasks.delete_one({"id": "t1"})
+        self.assertIsNone(await self.db.tasks.find_one({"assigned_to": "u2"}))
+
+    async def test_unique_index_rejects_duplicates_and_keeps_the_old_document(self):
+        await self.db.users.create_index([("email", 1)], unique=True)
+        await self.db.users.insert_one({"id": "a", "email": "a@x.com"})
+        await self.db.users.insert_one({"id": "b", "email": "b@x.com"})
+        with self.assertRaises(DuplicateKeyError):
+            await self.db.users.insert_one({"id": "c", "email": "a@x.com"})
+        with self.assertRaises(DuplicateKeyError):
+            await self.db.users.update_one({"id": "b"}, {"$set": {"email": "a@x.com"}})
+        self.assertEqual((await self.db.users.find_one({"email": "b@x.com"}))["id"], "b")
+        self.assertIsNone(await self.db.users.find_one({"id": "c"}))
+
+    async def test_partial_unique_index_only_covers_matching_documents(self):
+        await self.db.idempotency_keys.create_index([("key", 1)], unique=True, partialFilterExpression={"status": "done"})
+        await self.db.idempotency_keys.insert_one({"key": "k", "status": "pending"})
+        await self.db.idempotency_keys.insert_one({"key": "k", "status": "done"})
+        with self.assertRaises(DuplicateKeyError):
+            await self.db.idempotency_keys.insert_one({"key": "k", "status": "done"})
+
+    async def test_update_results_count_only_real_changes(self):
+        await self.db.tasks.insert_one({"id": "t1", "status": "todo"})
+        result = await self.db.tasks.update_one({"id": "t1"}, {"$set": {"status": "todo"}})
+        self.assertEqual((result.matched_count, result.modified_count), (1, 0))
+        result = await self.db.tasks.update_many({}, {"$set": {"status": "done"}})
+        self.assertEqual(result.modified_count, 1)
+
+    async def test_upserts_seed_from_filter_equalities(self):
+        result = await self.db.counters.update_one({"_id": "contract_number", "tenant_id": "x"}, {"$inc": {"seq": 1}}, upsert=True)
+        self.assertEqual(result.upserted_id, "contract_number")
+        self.assertEqual(await self.db.counters.find_one({}), {"_id": "contract_number", "tenant_id": "x", "seq": 1})
+
+    async def test_find_one_and_update_returns_before_or_after_and_upserts(self):
+        await self.db.counters.insert_one({"_id": "n", "seq": 1})
+        before = await self.db.counters.find_one_and_update({"_id": "n"}, {"$inc": {"seq": 1}})
+        after = await self.db.counters.find_one_and_update({"_id": "n"}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+        self.assertEqual((before["seq"], after["seq"]), (1, 3))
+        created = await self.db.counters.find_one_and_update({"_id": "m"}, {"$setOnInsert": {"seq": 0}}, upsert=True, return_document=ReturnDocument.AFTER)
+        self.assertEqual(created, {"_id": "m", "seq": 0})
+
+    async def test_lease_claim_upsert_conflicts_while_held(self):
+        # The shape of claim_scheduler_tick: a held lease fails the filter, and the upsert collides on _id
+        now = datetime(2026, 1, 1)
+        lease = {"_id": "tick", "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]}
+        claimed = await self.db.scheduler_state.find_one_and_update(lease, {"$set": {"lease_until": now + timedelta(seconds=30)}}, upsert=True, return_document=ReturnDocument.AFTER)
+        self.assertEqual(claimed["_id"], "tick")
+        with self.assertRaises(DuplicateKeyError):
+            await self.db.scheduler_state.find_one_and_update(lease, {"$set": {"lease_until": now}}, upsert=True)
+
+    async def test_bulk_write_mixes_operations_and_stops_on_duplicate_when_ordered(self):
+        await self.db.tasks.create_index([("id", 1)], unique=True)
+        await self.db.tasks.insert_one({"id": "t1", "n": 0})
+        result = await self.db.tasks.bulk_write([
+            UpdateOne({"id": "t1"}, {"$set": {"n": 1}}),
+            UpdateOne({"id": "t2"}, {"$set": {"n": 2}}, upsert=True),
+            InsertOne({"id": "t3"}),
+            DeleteOne({"id": "t3"})
+        ])
+        self.assertEqual((result.modified_count, result.upserted_count, result.inserted_count, result.deleted_count), (1, 1, 1, 1))
+        with self.assertRaises(BulkWriteError) as raised:
+            await self.db.tasks.bulk_write([InsertOne({"id": "t1"}), InsertOne({"id": "t4"})])
+        self.assertEqual(raised.exception.details["writeErrors"][0]["code"], 11000)
+        self.assertIsNone(await self.db.tasks.find_one({"id": "t4"}))
+
+    async def test_group_facet_and_lookup(self):
+        await self.db.tasks.insert_many([
+            {"id": "t1", "contract_id": "c1", "status": "done"},
+            {"id": "t2", "contract_id": "c1", "status": "todo"},
+            {"id": "t3", "contract_id": "c2", "status": "todo"}
+        ])
+        await self.db.contracts.insert_many([{"id": "c1", "contract_number": "ARC-1"}, {"id": "c2", "contract_number": "ARC-2"}])
+        grouped = await self.db.tasks.aggregate([
+            {"$group": {"_id": "$contract_id", "total": {"$sum": 1}, "done": {"$sum": {"$cond": [{"$eq": ["$status", "done"]}, 1, 0]}}}},
+            {"$sort": {"_id": 1}}
+        ]).to_list(None)
+        self.assertEqual(grouped, [{"_id": "c1", "total": 2, "done": 1}, {"_id": "c2", "total": 1, "done": 0}])
+
+        facets = await self.db.tasks.aggregate([{"$facet": {
+            "todo": [{"$match": {"status": "todo"}}, {"$count": "count"}],
+            "overdue": [{"$match": {"is_overdue": True}}, {"$count": "count"}]
+        }}]).to_list(None)
+        self.assertEqual(facets, [{"todo": [{"count": 2}], "overdue": []}])
+
+        joined = await self.db.tasks.aggregate([
+            {"$match": {"id": "t3"}},
+            {"$lookup": {"from": "contracts", "localField": "contract_id", "foreignField": "id", "as": "contract"}},
+            {"$unwind": "$contract"},
+            {"$project": {"_id": 0, "id": 1, "contract_number": "$contract.contract_number"}}
+        ]).to_list(None)
+        self.assertEqual(joined, [{"id": "t3", "contract_number": "ARC-2"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
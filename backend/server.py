@@ -1,14 +1,38 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateMany, UpdateOne, monitoring
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import asyncio
+import base64
+import cProfile
+import contextlib
+import contextvars
+import hashlib
+import json
+import math
 import os
+import pymongo
+import random
+import re
+import shutil
+import threading
+import time
 import uuid
+from collections import OrderedDict
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
 
 app = FastAPI(title="ARC Project Management System", version="2.0.0")
 
@@ -19,17 +43,436 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "Idempotent-Replayed", "Retry-After"],
 )
 
 # Database connection
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.arc_project_management
+# Heavy dashboard/report reads get their own pool, optionally on a different URL (e.g. an analytics node)
+MONGO_ANALYTICS_URL = os.environ.get("MONGO_ANALYTICS_URL", MONGO_URL)
+# "mongo", or "memory" for an in-process engine (tests, benchmarks) that keeps no data across restarts
+STORAGE_ENGINE = os.environ.get("STORAGE_ENGINE", "mongo")
+# Upper bound for a single dashboard/report query so one slow count can't pin a pooled connection
+DB_OP_TIMEOUT_SECONDS = float(os.environ.get("DB_OP_TIMEOUT_SECONDS", "5"))
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool utilization for one client. Pool events fire on Motor's
+    executor threads, so counters are guarded by a lock and checkout wait time is
+    measured per thread."""
+
+    def __init__(self, name: str, max_pool_size: int):
+        self.name = name
+        self.max_pool_size = max_pool_size
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pools = {}
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}"
+        if key not in self.pools:
+            self.pools[key] = {
+                "open": 0, "checked_out": 0, "peak_checked_out": 0,
+                "checkouts": 0, "checkout_failures": 0, "checkout_timeouts": 0,
+                "total_wait_ms": 0.0, "max_wait_ms": 0.0
+            }
+        return self.pools[key]
+
+    def _wait_ms(self):
+        started = getattr(self.local, "checkout_started", None)
+        self.local.checkout_started = None
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def connection_ready(self, event): pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self._pool(event.address)["checked_out"] = 0
+
+    def pool_closed(self, event):
+        with self.lock:
+            self.pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        with self.lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(0, pool["open"] - 1)
+
+    def connection_check_out_started(self, event):
+        self.local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._wait_ms()
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["checkout_failures"] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                pool["checkout_timeouts"] += 1
+            pool["max_wait_ms"] = max(pool["max_wait_ms"], wait_ms)
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms()
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["checkouts"] += 1
+            pool["checked_out"] += 1
+            pool["peak_checked_out"] = max(pool["peak_checked_out"], pool["checked_out"])
+            pool["total_wait_ms"] += wait_ms
+            pool["max_wait_ms"] = max(pool["max_wait_ms"], wait_ms)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] = max(0, pool["checked_out"] - 1)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            pools = {}
+            for address, pool in self.pools.items():
+                pools[address] = {
+                    **pool,
+                    "utilization": round(pool["checked_out"] / self.max_pool_size, 3) if self.max_pool_size else None,
+                    "avg_wait_ms": round(pool["total_wait_ms"] / pool["checkouts"], 3) if pool["checkouts"] else 0.0,
+                    "total_wait_ms": round(pool["total_wait_ms"], 3),
+                    "max_wait_ms": round(pool["max_wait_ms"], 3)
+                }
+            return {"max_pool_size": self.max_pool_size, "pools": pools}
+
+def mongo_client_options(prefix: str, defaults: dict) -> dict:
+    """Client settings from <prefix>_* env vars, e.g. MONGO_MAX_POOL_SIZE or MONGO_ANALYTICS_READ_PREFERENCE"""
+    def env(name, default):
+        return os.environ.get(f"{prefix}_{name}", default)
+    
+    options = {
+        "maxPoolSize": int(env("MAX_POOL_SIZE", defaults.get("max_pool_size", 100))),
+        "minPoolSize": int(env("MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(env("MAX_IDLE_TIME_MS", 300000)),
+        "waitQueueTimeoutMS": int(env("WAIT_QUEUE_TIMEOUT_MS", 5000)),
+        "serverSelectionTimeoutMS": int(env("SERVER_SELECTION_TIMEOUT_MS", 10000)),
+        "connectTimeoutMS": int(env("CONNECT_TIMEOUT_MS", 10000)),
+        "readPreference": env("READ_PREFERENCE", defaults.get("read_preference", "primary")),
+        "appname": env("APP_NAME", defaults.get("appname", "arc-backend"))
+    }
+    compressors = env("COMPRESSORS", "")
+    if compressors:
+        options["compressors"] = compressors
+    max_staleness = int(env("MAX_STALENESS_SECONDS", defaults.get("max_staleness_seconds", -1)))
+    if max_staleness != -1 and options["readPreference"] != "primary":
+        # MongoDB requires at least 90 seconds so the staleness estimate is meaningful
+        options["maxStalenessSeconds"] = max(max_staleness, 90)
+    return options
+
+mongo_options = mongo_client_options("MONGO", {})
+analytics_mongo_options = mongo_client_options("MONGO_ANALYTICS", {
+    "max_pool_size": 20,
+    "read_preference": "secondaryPreferred",
+    "max_staleness_seconds": 120,
+    "appname": "arc-backend-analytics"
+})
+pool_metrics = PoolMetricsListener("primary", mongo_options["maxPoolSize"])
+analytics_pool_metrics = PoolMetricsListener("analytics", analytics_mongo_options["maxPoolSize"])
+
+if STORAGE_ENGINE == "memory":
+    from memory_store import MemoryClient
+    client = analytics_client = MemoryClient()
+else:
+    client = AsyncIOMotorClient(MONGO_URL, event_listeners=[pool_metrics], **mongo_options)
+    analytics_client = AsyncIOMotorClient(MONGO_ANALYTICS_URL, event_listeners=[analytics_pool_metrics], **analytics_mongo_options)
+
+# ==================== TENANCY ====================
+
+# Every tenant-owned document carries tenant_id, and `db`/`analytics_db` route each call to
+# the current tenant: filters, inserts and pipelines are scoped to its tenant_id and sent to
+# its database. Tenants share the control database until one is relocated to its own with
+# tenants.py. The current tenant comes from the token, or X-Tenant-ID before login.
+CONTROL_DB_NAME = "arc_project_management"
+DEFAULT_TENANT = os.environ.get("DEFAULT_TENANT", "default")
+TENANT_REFRESH_SECONDS = float(os.environ.get("TENANT_REFRESH_SECONDS", "10"))
+# Operations slower than this count as slow in the per-tenant query metrics
+TENANT_SLOW_QUERY_MS = float(os.environ.get("TENANT_SLOW_QUERY_MS", "100"))
+
+current_tenant = contextvars.ContextVar("current_tenant", default=DEFAULT_TENANT)
+# tenant_id -> registry document ({"database", "status", ...}), refreshed from control_db.tenants
+tenant_registry = {DEFAULT_TENANT: {"_id": DEFAULT_TENANT, "name": DEFAULT_TENANT, "database": CONTROL_DB_NAME, "status": "active"}}
+# tenant_id -> collection -> operation counters for this worker since startup
+tenant_query_stats = {}
+# Writes to these stamp changed_at, the high-watermark cdc_export.py polls when change
+# streams aren't available. Background writers that only maintain derived fields (risk
+# scores, overdue flags, embedded summaries, schedule forecasts, backfills, migrations)
+# pass stamp=False, so a document is re-exported when someone changes it rather than
+# each time a re-score or sweep touches it.
+CHANGE_TRACKED_COLLECTIONS = {"contracts", "tasks", "users", "activities"}
+
+# The tenant registry itself is the only unscoped collection
+control_db = client[CONTROL_DB_NAME]
+
+def tenant_key(name: str) -> str:
+    """_id for per-tenant singleton documents (scheduler leases, migration state, counters)"""
+    return f"{current_tenant.get()}:{name}"
+
+def tenant_database_name(tenant_id: str) -> str:
+    tenant = tenant_registry.get(tenant_id)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="Unknown tenant")
+    if tenant["status"] != "active":
+        raise HTTPException(status_code=503, detail="Tenant is being relocated, please retry", headers={"Retry-After": str(max(1, math.ceil(TENANT_REFRESH_SECONDS)))})
+    return tenant["database"]
+
+def active_tenants() -> list:
+    return [tenant_id for tenant_id, tenant in tenant_registry.items() if tenant["status"] == "active"]
+
+@contextlib.contextmanager
+def tenant_context(tenant_id: str):
+    """Make tenant_id current for the enclosed block (background loops iterate tenants with this)"""
+    token = current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+def record_tenant_query(tenant_id: str, collection: str, elapsed: float):
+    stats = tenant_query_stats.setdefault(tenant_id, {}).get(collection)
+    if stats is None:
+        stats = tenant_query_stats[tenant_id][collection] = {"ops": 0, "total_ms": 0.0, "max_ms": 0.0, "slow": 0}
+    elapsed_ms = elapsed * 1000
+    stats["ops"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    if elapsed_ms >= TENANT_SLOW_QUERY_MS:
+        stats["slow"] += 1
+
+class TenantCursor:
+    """Cursor wrapper that times the round trips of one find/aggregate into the tenant's metrics"""
+    
+    def __init__(self, tenant_id: str, collection: str, cursor):
+        self.tenant_id = tenant_id
+        self.collection = collection
+        self.cursor = cursor
+    
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+    
+    def limit(self, limit: int):
+        self.cursor = self.cursor.limit(limit)
+        return self
+    
+    def skip(self, skip: int):
+        self.cursor = self.cursor.skip(skip)
+        return self
+    
+    async def to_list(self, length=None):
+        started = time.perf_counter()
+        try:
+            return await self.cursor.to_list(length)
+        finally:
+            record_tenant_query(self.tenant_id, self.collection, time.perf_counter() - started)
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        # Only time spent waiting on the cursor counts, not the caller's loop body
+        elapsed = 0.0
+        iterator = self.cursor.__aiter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    doc = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield doc
+        finally:
+            record_tenant_query(self.tenant_id, self.collection, elapsed)
+
+class TenantCollection:
+    """One collection as seen by the current tenant. Exposes the subset of the Motor API the
+    app uses; anything unscoped (index management) goes through the client directly."""
+    
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+    
+    def _target(self):
+        tenant_id = current_tenant.get()
+        return tenant_id, self.client[tenant_database_name(tenant_id)][self.name]
+    
+    @staticmethod
+    def _scoped(tenant_id: str, filter: Optional[dict]) -> dict:
+        return {"tenant_id": tenant_id, **(filter or {})}
+    
+    @staticmethod
+    def _hide_tenant(projection):
+        # Exclusion projections (or none) would otherwise hand tenant_id to API clients
+        if projection is None:
+            return {"tenant_id": 0}
+        if isinstance(projection, dict) and projection and not any(projection.values()):
+            return {**projection, "tenant_id": 0}
+        return projection
+    
+    def _scoped_document(self, tenant_id: str, document: dict) -> dict:
+        if self.name in CHANGE_TRACKED_COLLECTIONS:
+            return {**document, "tenant_id": tenant_id, "changed_at": datetime.utcnow()}
+        return {**document, "tenant_id": tenant_id}
+    
+    def _stamped(self, update, stamp: bool = True):
+        if not stamp or self.name not in CHANGE_TRACKED_COLLECTIONS:
+            return update
+        if isinstance(update, list):
+            return [*update, {"$set": {"changed_at": datetime.utcnow()}}]
+        return {**update, "$set": {**update.get("$set", {}), "changed_at": datetime.utcnow()}}
+    
+    def _scoped_request(self, tenant_id: str, request, stamp: bool):
+        if isinstance(request, InsertOne):
+            return InsertOne(self._scoped_document(tenant_id, request._doc))
+        if isinstance(request, (UpdateOne, UpdateMany)):
+            return type(request)(self._scoped(tenant_id, request._filter), self._stamped(request._doc, stamp), upsert=request._upsert, array_filters=request._array_filters)
+        if isinstance(request, (DeleteOne, DeleteMany)):
+            return type(request)(self._scoped(tenant_id, request._filter))
+        raise TypeError(f"Unsupported bulk operation {type(request).__name__}")
+    
+    async def _timed(self, tenant_id: str, operation):
+        started = time.perf_counter()
+        try:
+            return await operation
+        finally:
+            record_tenant_query(tenant_id, self.name, time.perf_counter() - started)
+    
+    def find(self, filter: Optional[dict] = None, projection=None, **kwargs):
+        tenant_id, collection = self._target()
+        return TenantCursor(tenant_id, self.name, collection.find(self._scoped(tenant_id, filter), self._hide_tenant(projection), **kwargs))
+    
+    def aggregate(self, pipeline: list, **kwargs):
+        tenant_id, collection = self._target()
+        return TenantCursor(tenant_id, self.name, collection.aggregate([{"$match": {"tenant_id": tenant_id}}, *pipeline], **kwargs))
+    
+    async def find_one(self, filter: Optional[dict] = None, projection=None, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.find_one(self._scoped(tenant_id, filter), self._hide_tenant(projection), **kwargs))
+    
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.count_documents(self._scoped(tenant_id, filter), **kwargs))
+    
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> list:
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.distinct(key, self._scoped(tenant_id, filter), **kwargs))
+    
+    async def insert_one(self, document: dict, **kwargs):
+        tenant_id, collection = self._target()
+        # Insert a copy so tenant_id never leaks into the caller's (often returned) document
+        scoped = self._scoped_document(tenant_id, document)
+        result = await self._timed(tenant_id, collection.insert_one(scoped, **kwargs))
+        document.setdefault("_id", scoped["_id"])
+        return result
+    
+    async def insert_many(self, documents: list, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.insert_many([self._scoped_document(tenant_id, document) for document in documents], **kwargs))
+    
+    async def update_one(self, filter: dict, update, stamp: bool = True, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.update_one(self._scoped(tenant_id, filter), self._stamped(update, stamp), **kwargs))
+    
+    async def update_many(self, filter: dict, update, stamp: bool = True, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.update_many(self._scoped(tenant_id, filter), self._stamped(update, stamp), **kwargs))
+    
+    async def delete_one(self, filter: dict, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.delete_one(self._scoped(tenant_id, filter), **kwargs))
+    
+    async def delete_many(self, filter: dict, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.delete_many(self._scoped(tenant_id, filter), **kwargs))
+    
+    async def find_one_and_update(self, filter: dict, update, stamp: bool = True, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.find_one_and_update(self._scoped(tenant_id, filter), self._stamped(update, stamp), **kwargs))
+    
+    async def find_one_and_delete(self, filter: dict, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.find_one_and_delete(self._scoped(tenant_id, filter), **kwargs))
+    
+    async def bulk_write(self, requests: list, stamp: bool = True, **kwargs):
+        tenant_id, collection = self._target()
+        return await self._timed(tenant_id, collection.bulk_write([self._scoped_request(tenant_id, request, stamp) for request in requests], **kwargs))
+
+class TenantDatabase:
+    def __init__(self, client):
+        self.client = client
+        self._collections = {}
+    
+    def __getitem__(self, name: str) -> TenantCollection:
+        if name not in self._collections:
+            self._collections[name] = TenantCollection(self.client, name)
+        return self._collections[name]
+    
+    def __getattr__(self, name: str) -> TenantCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+db = TenantDatabase(client)
+# Dashboard and report reads only; may lag the primary by up to the configured max staleness
+analytics_db = TenantDatabase(analytics_client)
+
+async def refresh_tenants():
+    tenants = {DEFAULT_TENANT: tenant_registry[DEFAULT_TENANT]}
+    async for tenant in control_db.tenants.find({}):
+        tenants[tenant["_id"]] = tenant
+    tenant_registry.clear()
+    tenant_registry.update(tenants)
+
+async def tenant_refresher():
+    while True:
+        await asyncio.sleep(TENANT_REFRESH_SECONDS)
+        try:
+            await refresh_tenants()
+        except Exception as e:
+            print(f"Tenant registry refresh failed: {e}")
+
+class TenantMiddleware:
+    """Plain ASGI middleware: the X-Tenant-ID header picks the tenant for unauthenticated
+    routes (login, signup). get_current_user replaces it with the tenant in the token."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        tenant_id = next((value.decode() for name, value in scope["headers"] if name == b"x-tenant-id"), DEFAULT_TENANT)
+        with tenant_context(tenant_id):
+            await self.app(scope, receive, send)
+
+app.add_middleware(TenantMiddleware)
+
+def db_timeout(seconds: Optional[float] = None):
+    """Bound every Mongo operation inside the block (client-side operation timeout)"""
+    return pymongo.timeout(seconds if seconds is not None else DB_OP_TIMEOUT_SECONDS)
+
+@app.exception_handler(PyMongoError)
+async def mongo_error_handler(request, exc: PyMongoError):
+    if exc.timeout:
+        return JSONResponse(status_code=503, content={"detail": "Database timeout, please retry"}, headers={"Retry-After": "1"})
+    return JSONResponse(status_code=500, content={"detail": "Database error"})
 
 # Security
 SECRET_KEY = os.environ.get("SECRET_KEY", "arc-secret-key-2025")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+# Stateless tokens carry role/name/version claims so most requests authorize without a DB read
+STATELESS_AUTH = os.environ.get("STATELESS_AUTH", "false").lower() == "true"
+TOKEN_VERSION_REFRESH_SECONDS = float(os.environ.get("TOKEN_VERSION_REFRESH_SECONDS", "5"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -60,6 +503,12 @@ class ContractCreate(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
 
+class ContractUpdate(BaseModel):
+    client_name: Optional[str] = None
+    project_name: Optional[str] = None
+    project_type: Optional[str] = None
+    description: Optional[str] = None
+
 # Finance allocation
 class FinanceAllocation(BaseModel):
     staff_count: int = 0
@@ -89,6 +538,8 @@ class TaskCreate(BaseModel):
     assigned_to: Optional[str] = None
     priority: str = "medium"
     due_date: Optional[datetime] = None
+    depends_on: List[str] = []
+    duration_days: float = Field(default=1.0, ge=0)
 
 class TaskUpdate(BaseModel):
     title: Optional[str] = None
@@ -97,6 +548,8 @@ class TaskUpdate(BaseModel):
     assigned_to: Optional[str] = None
     priority: Optional[str] = None
     due_date: Optional[datetime] = None
+    depends_on: Optional[List[str]] = None
+    duration_days: Optional[float] = Field(default=None, ge=0)
 
 class CommentCreate(BaseModel):
     task_id: str
@@ -116,15 +569,94 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def token_claims(user: dict) -> dict:
+    claims = {"sub": user["id"], "tenant": current_tenant.get()}
+    if STATELESS_AUTH:
+        claims.update({
+            "role": user["role"],
+            "name": user["name"],
+            "email": user["email"],
+            "active": user.get("is_active", True),
+            "ver": user.get("token_version", 0)
+        })
+    return claims
+
+# user_id -> token_version for every user whose role or status has changed. Users
+# missing from the table are at version 0. Kept in sync across workers by polling.
+token_versions = {}
+token_versions_synced_at = None
+
+async def bump_token_version(user_id: str):
+    """Invalidate claims in outstanding stateless tokens for a user"""
+    now = datetime.utcnow()
+    user = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {"token_version": 1}, "$set": {"token_version_updated_at": now}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        token_versions[user_id] = user["token_version"]
+
+async def sync_token_versions():
+    global token_versions_synced_at
+    started = datetime.utcnow()
+    query = {"token_version": {"$gt": 0}}
+    if token_versions_synced_at:
+        # Overlap the window slightly so a bump racing the previous poll isn't missed
+        query = {"token_version_updated_at": {"$gte": token_versions_synced_at - timedelta(seconds=TOKEN_VERSION_REFRESH_SECONDS)}}
+    for tenant_id in active_tenants():
+        with tenant_context(tenant_id):
+            async for user in db.users.find(query, {"id": 1, "token_version": 1}):
+                token_versions[user["id"]] = max(token_versions.get(user["id"], 0), user.get("token_version", 0))
+    token_versions_synced_at = started
+
+async def token_version_refresher():
+    while True:
+        try:
+            await sync_token_versions()
+        except Exception as e:
+            print(f"Token version sync failed: {e}")
+        await asyncio.sleep(TOKEN_VERSION_REFRESH_SECONDS)
+
+def token_versions_fresh() -> bool:
+    if token_versions_synced_at is None:
+        return False
+    return datetime.utcnow() - token_versions_synced_at < timedelta(seconds=TOKEN_VERSION_REFRESH_SECONDS * 3)
+
+def user_from_claims(payload: dict) -> Optional[dict]:
+    """Build the current user from token claims, or None when the DB must be consulted"""
+    if not STATELESS_AUTH or "ver" not in payload or not token_versions_fresh():
+        return None
+    if payload["ver"] != token_versions.get(payload["sub"], 0) or not payload.get("active", True):
+        return None
+    return {
+        "id": payload["sub"],
+        "role": payload["role"],
+        "name": payload["name"],
+        "email": payload["email"],
+        "is_active": True,
+        "from_token": True
+    }
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
+        # Tokens issued before tenancy carry no tenant claim and belong to the default tenant
+        tenant_id = payload.get("tenant", DEFAULT_TENANT)
+        tenant_database_name(tenant_id)
+        current_tenant.set(tenant_id)
+        user = user_from_claims(payload)
+        if user is not None:
+            return user
         user = await db.users.find_one({"id": user_id})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
+        if not user.get("is_active", True):
+            raise HTTPException(status_code=403, detail="Account is deactivated. Contact your administrator.")
         return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -144,67 +676,1638 @@ def calculate_profits(contract_value: float, staff_cost: float, commission: floa
     
     return target_profit, actual_profit, profit_status
 
-def calculate_contract_status(start_date: str, end_date: str, manual_status: str = None):
+def parse_datetime(value) -> Optional[datetime]:
+    """Naive UTC datetime from the ISO strings / datetimes stored on contracts and tasks"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def calculate_contract_status(start_date, end_date, manual_status: str = None):
     if manual_status == "inactive":
         return "Inactive"
     
     now = datetime.utcnow()
+    # Datetimes once schema migrations have run; parse_datetime still covers legacy strings
+    start = parse_datetime(start_date)
+    end = parse_datetime(end_date)
+    
+    if start and end:
+        if now > end:
+            return "Expired"
+        elif now >= start:
+            return "Active"
+    
+    return "Pending"
+
+# ==================== ROLE SCOPING ====================
+
+# What each role may read from list endpoints, applied as Mongo filters and projections
+# so workers never download company-wide data. CEO and finance see full contracts.
+OPERATIONS_CONTRACT_PROJECTION = {
+    "tax": 0, "overhead_cost": 0, "commission": 0, "admin_fee": 0, "staff_cost": 0,
+    "finance_officer_id": 0, "staff_list.payment_amount": 0
+}
+WORKER_CONTRACT_PROJECTION = {
+    "id": 1, "contract_number": 1, "client_name": 1, "project_name": 1, "project_type": 1, "description": 1,
+    "project_start_date": 1, "project_end_date": 1, "project_status": 1, "manual_status": 1, "duration_type": 1,
+    "staff_list.user_id": 1, "staff_list.user_name": 1, "staff_list.user_avatar": 1, "staff_list.role_in_project": 1,
+    "created_at": 1
+}
+# Roles that see per-user task stats and contact details in the user list
+USER_STATS_ROLES = ["ceo", "operations"]
+
+def contract_projection(role: str) -> Optional[dict]:
+    if role == "worker":
+        return WORKER_CONTRACT_PROJECTION
+    if role == "operations":
+        return OPERATIONS_CONTRACT_PROJECTION
+    return None
+
+def contract_scope(current_user: dict) -> dict:
+    if current_user["role"] == "worker":
+        return {"staff_list.user_id": current_user["id"]}
+    return {}
+
+async def staffed_contract_ids(user_id: str) -> list:
+    return [contract["id"] async for contract in db.contracts.find({"staff_list.user_id": user_id}, {"id": 1, "_id": 0})]
+
+# ==================== IDEMPOTENCY ====================
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long a duplicate waits for the first request to finish before getting a 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# An in-progress key older than this is assumed orphaned by a crashed worker and can be taken over
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "30"))
+
+# Requests executing in this worker, so same-worker duplicates await the result instead of polling
+idempotency_inflight = {}
+
+def idempotency_request_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+async def claim_idempotency_key(key: str, request_hash: str) -> Optional[dict]:
+    """Returns None when this request owns the key, otherwise the existing record"""
+    now = datetime.utcnow()
+    record = {
+        "key": key,
+        "request_hash": request_hash,
+        "status": "in_progress",
+        "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "created_at": now,
+        "expires_at": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    }
+    try:
+        await db.idempotency_keys.insert_one(record)
+        return None
+    except DuplicateKeyError:
+        pass
     
-    if start_date and end_date:
+    taken_over = await db.idempotency_keys.find_one_and_update(
+        {"key": key, "status": "in_progress", "locked_until": {"$lt": now}},
+        {"$set": {"request_hash": request_hash, "locked_until": record["locked_until"]}}
+    )
+    if taken_over:
+        return None
+    return await db.idempotency_keys.find_one({"key": key})
+
+async def wait_for_idempotent_result(key: str, request_hash: str) -> Optional[dict]:
+    inflight = idempotency_inflight.get(key)
+    if inflight:
         try:
-            start = datetime.fromisoformat(start_date.replace('Z', '+00:00')) if isinstance(start_date, str) else start_date
-            end = datetime.fromisoformat(end_date.replace('Z', '+00:00')) if isinstance(end_date, str) else end_date
-            
-            if now > end:
-                return "Expired"
-            elif now >= start:
-                return "Active"
-        except:
+            await asyncio.wait_for(asyncio.shield(inflight), IDEMPOTENCY_WAIT_SECONDS)
+        except Exception:
             pass
     
-    return "Pending"
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        record = await db.idempotency_keys.find_one({"key": key})
+        if record is None or record["status"] == "done":
+            return record
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress", headers={"Retry-After": "1"})
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
 
-# ==================== INITIALIZATION ====================
+def replay_idempotent_response(record: dict, response: Response):
+    response.headers["Idempotent-Replayed"] = "true"
+    if record["response_status"] != 200:
+        raise HTTPException(status_code=record["response_status"], detail=record["response_body"].get("detail"), headers={"Idempotent-Replayed": "true"})
+    return record["response_body"]
 
-@app.on_event("startup")
-async def startup_db_client():
-    # Create indexes
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("id", unique=True)
-    await db.contracts.create_index("id", unique=True)
-    await db.contracts.create_index("contract_number", unique=True)
-    await db.tasks.create_index("id", unique=True)
-    await db.tasks.create_index("contract_id")
-    await db.comments.create_index("task_id")
-    await db.activities.create_index([("created_at", -1)])
-    
-    # ONLY create default CEO - no other mock users
-    existing_ceo = await db.users.find_one({"email": "ceo@arc.com"})
-    if not existing_ceo:
-        ceo_user = {
+async def run_idempotent(idempotency_key: Optional[str], route: str, payload, current_user: dict, response: Response, handler):
+    """Run `handler` at most once per (user, route, Idempotency-Key). Replays return the stored
+    first response; concurrent duplicates wait for the in-flight request rather than racing it."""
+    if not idempotency_key:
+        return await handler()
+    
+    key = f"{current_user['id']}:{route}:{idempotency_key}"
+    request_hash = idempotency_request_hash(payload)
+    
+    record = await claim_idempotency_key(key, request_hash)
+    while record is not None:
+        if record["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+        if record["status"] == "in_progress":
+            record = await wait_for_idempotent_result(key, request_hash)
+            if record is None:
+                # The first attempt failed and released the key; try to run it ourselves
+                record = await claim_idempotency_key(key, request_hash)
+            continue
+        return replay_idempotent_response(record, response)
+    
+    inflight = asyncio.get_running_loop().create_future()
+    idempotency_inflight[key] = inflight
+    try:
+        try:
+            result = await handler()
+            status_code, body = 200, jsonable_encoder(result)
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            # Client errors are deterministic for a given payload, so they are replayed as well
+            status_code, body, result = e.status_code, {"detail": e.detail}, e
+        await db.idempotency_keys.update_one({"key": key}, {"$set": {
+            "status": "done",
+            "response_status": status_code,
+            "response_body": body,
+            "completed_at": datetime.utcnow()
+        }})
+    except BaseException:
+        await db.idempotency_keys.delete_one({"key": key, "status": "in_progress"})
+        raise
+    finally:
+        idempotency_inflight.pop(key, None)
+        inflight.set_result(None)
+    
+    if isinstance(result, HTTPException):
+        raise result
+    return result
+
+# ==================== BACKGROUND DELETION ====================
+
+# Deleting a task or contract only removes the document itself and records a tombstone
+# (with a snapshot of the document); the reaper removes dependents in throttled batches.
+# Dependents in change-tracked collections are listed in cascade_deletes before they go,
+# since their tombstone only names the root entity and cdc_export.py must report them too.
+REAPER_BATCH_SIZE = int(os.environ.get("REAPER_BATCH_SIZE", "500"))
+REAPER_BATCH_PAUSE_SECONDS = float(os.environ.get("REAPER_BATCH_PAUSE_SECONDS", "0.05"))
+REAPER_IDLE_SECONDS = float(os.environ.get("REAPER_IDLE_SECONDS", "5"))
+REAPER_LEASE_SECONDS = int(os.environ.get("REAPER_LEASE_SECONDS", "300"))
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", "30"))
+# 0 disables the periodic orphan scan; it can still be run on demand
+CONSISTENCY_SCAN_INTERVAL_SECONDS = float(os.environ.get("CONSISTENCY_SCAN_INTERVAL_SECONDS", "0"))
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-run
+background_tasks = set()
+
+def start_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def create_tombstone(entity_type: str, entity_id: str, document: Optional[dict], deleted_by: Optional[dict], reason: str = "deleted"):
+    if document is not None:
+        document = {k: v for k, v in document.items() if k != "_id"}
+    now = datetime.utcnow()
+    await db.tombstones.update_one(
+        {"entity_type": entity_type, "entity_id": entity_id, "status": {"$ne": "done"}},
+        {"$setOnInsert": {
             "id": str(uuid.uuid4()),
-            "email": "ceo@arc.com",
-            "password": get_password_hash("admin123"),
-            "name": "CEO Administrator",
-            "role": "ceo",
-            "department": "Executive",
-            "is_active": True,
-            "is_approved": True,
-            "created_at": datetime.utcnow(),
-            "avatar": f"https://ui-avatars.com/api/?name=CEO&background=B22222&color=fff&bold=true"
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "document": document,
+            "reason": reason,
+            "deleted_by": deleted_by["id"] if deleted_by else None,
+            "deleted_by_name": deleted_by["name"] if deleted_by else None,
+            "deleted_at": now,
+            "status": "pending",
+            "claimed_until": now,
+            "removed": {}
+        }},
+        upsert=True
+    )
+
+async def record_cascade_deletes(collection_name: str, entity_ids: list):
+    if collection_name not in CHANGE_TRACKED_COLLECTIONS or not entity_ids:
+        return
+    now = datetime.utcnow()
+    await db.cascade_deletes.insert_many([{
+        "collection": collection_name,
+        "entity_id": entity_id,
+        "deleted_at": now,
+        "expires_at": now + timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    } for entity_id in entity_ids])
+
+async def reap_batches(collection, query: dict) -> int:
+    """Delete everything matching query, one small batch at a time so the reaper
+    never holds long locks or starves foreground traffic of connections"""
+    removed = 0
+    while True:
+        docs = await collection.find(query, {"_id": 1, "id": 1}).limit(REAPER_BATCH_SIZE).to_list(None)
+        if not docs:
+            return removed
+        ids = [doc["_id"] for doc in docs]
+        await record_cascade_deletes(collection.name, [doc["id"] for doc in docs if "id" in doc])
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        removed += result.deleted_count
+        await asyncio.sleep(REAPER_BATCH_PAUSE_SECONDS)
+
+async def reap_task_dependents(task_ids: list) -> dict:
+    return {
+        "comments": await reap_batches(db.comments, {"task_id": {"$in": task_ids}}),
+        "activities": await reap_batches(db.activities, {"entity_type": "task", "entity_id": {"$in": task_ids}})
+    }
+
+async def reap_contract_dependents(contract_id: str) -> dict:
+    removed = {"tasks": 0, "comments": 0, "activities": 0}
+    while True:
+        task_ids = [task["id"] async for task in db.tasks.find({"contract_id": contract_id}, {"id": 1}).limit(REAPER_BATCH_SIZE)]
+        if not task_ids:
+            break
+        for key, count in (await reap_task_dependents(task_ids)).items():
+            removed[key] += count
+        await record_cascade_deletes("tasks", task_ids)
+        removed["tasks"] += (await db.tasks.delete_many({"id": {"$in": task_ids}})).deleted_count
+        await asyncio.sleep(REAPER_BATCH_PAUSE_SECONDS)
+    removed["activities"] += await reap_batches(db.activities, {"$or": [
+        {"contract_id": contract_id},
+        {"entity_type": "contract", "entity_id": contract_id}
+    ]})
+    return removed
+
+async def reap_next_tombstone() -> bool:
+    now = datetime.utcnow()
+    tombstone = await db.tombstones.find_one_and_update(
+        {"status": {"$in": ["pending", "reaping"]}, "claimed_until": {"$lte": now}},
+        {"$set": {"status": "reaping", "claimed_until": now + timedelta(seconds=REAPER_LEASE_SECONDS)}},
+        sort=[("deleted_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+    if not tombstone:
+        return False
+    
+    if tombstone["entity_type"] == "contract":
+        removed = await reap_contract_dependents(tombstone["entity_id"])
+    else:
+        removed = await reap_task_dependents([tombstone["entity_id"]])
+    
+    await db.tombstones.update_one({"id": tombstone["id"]}, {"$set": {
+        "status": "done",
+        "removed": removed,
+        "reaped_at": datetime.utcnow(),
+        "expires_at": datetime.utcnow() + timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    }})
+    return True
+
+async def tombstone_reaper():
+    while True:
+        # One tombstone per tenant per round, so a tenant's mass delete can't starve the others
+        reaped = False
+        for tenant_id in active_tenants():
+            with tenant_context(tenant_id):
+                try:
+                    reaped = await reap_next_tombstone() or reaped
+                except Exception as e:
+                    print(f"Tombstone reaper failed for tenant {tenant_id}: {e}")
+        if not reaped:
+            await asyncio.sleep(REAPER_IDLE_SECONDS)
+
+async def find_orphans() -> dict:
+    """Comments whose task is gone and tasks whose contract is gone, grouped by missing parent"""
+    def orphan_pipeline(parent_field: str, parent_collection: str):
+        # Group first so the $lookup runs once per parent rather than once per child
+        return [
+            {"$group": {"_id": f"${parent_field}", "count": {"$sum": 1}}},
+            {"$lookup": {"from": parent_collection, "localField": "_id", "foreignField": "id", "as": "parent"}},
+            {"$match": {"parent": {"$size": 0}}},
+            {"$project": {"_id": 0, "parent_id": "$_id", "count": 1}}
+        ]
+    
+    with db_timeout(60):
+        orphan_comments = await analytics_db.comments.aggregate(orphan_pipeline("task_id", "tasks")).to_list(None)
+        orphan_tasks = await analytics_db.tasks.aggregate(orphan_pipeline("contract_id", "contracts")).to_list(None)
+    return {"comments_by_missing_task": orphan_comments, "tasks_by_missing_contract": orphan_tasks}
+
+async def run_consistency_scan(repair: bool = False) -> dict:
+    orphans = await find_orphans()
+    if repair:
+        # Orphans are cleaned up by the reaper like any other delete
+        for orphan in orphans["comments_by_missing_task"]:
+            await create_tombstone("task", orphan["parent_id"], None, None, reason="orphan_scan")
+        for orphan in orphans["tasks_by_missing_contract"]:
+            await create_tombstone("contract", orphan["parent_id"], None, None, reason="orphan_scan")
+    return {
+        "scanned_at": datetime.utcnow(),
+        "orphan_comments": sum(o["count"] for o in orphans["comments_by_missing_task"]),
+        "orphan_tasks": sum(o["count"] for o in orphans["tasks_by_missing_contract"]),
+        "repair_queued": repair,
+        **orphans
+    }
+
+async def consistency_scanner():
+    while True:
+        await asyncio.sleep(CONSISTENCY_SCAN_INTERVAL_SECONDS)
+        for tenant_id in active_tenants():
+            with tenant_context(tenant_id):
+                try:
+                    result = await run_consistency_scan(repair=True)
+                    if result["orphan_comments"] or result["orphan_tasks"]:
+                        print(f"Consistency scan queued cleanup for tenant {tenant_id}: {result['orphan_comments']} comments, {result['orphan_tasks']} tasks")
+                except Exception as e:
+                    print(f"Consistency scan failed for tenant {tenant_id}: {e}")
+
+# ==================== TASK READ MODEL ====================
+
+# Tasks embed the assignee summary (assigned_user) and contract_number/project_name so task
+# lists are a single indexed find. Changes to users/contracts fan out to their tasks (and to
+# contract staff_list entries) from a background queue; pending keys are coalesced.
+SUMMARY_FANOUT_BATCH_SIZE = int(os.environ.get("SUMMARY_FANOUT_BATCH_SIZE", "1000"))
+
+summary_fanout_queue = asyncio.Queue()
+summary_fanout_pending = {}
+summary_fanout_stats = {"processed": 0, "failed": 0, "tasks_updated": 0, "last_lag_ms": None, "max_lag_ms": 0.0, "total_lag_ms": 0.0}
+# Risk re-scores share the queue but not the counters, so they don't skew summary lag
+risk_refresh_stats = {"processed": 0, "failed": 0, "contracts_updated": 0, "last_lag_ms": None, "max_lag_ms": 0.0, "total_lag_ms": 0.0}
+
+def user_summary(user: Optional[dict]) -> Optional[dict]:
+    if not user:
+        return None
+    return {"id": user["id"], "name": user["name"], "avatar": user.get("avatar")}
+
+def contract_summary(contract: dict) -> dict:
+    return {"contract_number": contract["contract_number"], "project_name": contract.get("project_name")}
+
+def enqueue_summary_fanout(kind: str, entity_id: str):
+    key = (current_tenant.get(), kind, entity_id)
+    if key in summary_fanout_pending:
+        return
+    summary_fanout_pending[key] = time.monotonic()
+    summary_fanout_queue.put_nowait(key)
+
+async def fanout_updates(collection, query: dict, update: dict, **kwargs) -> int:
+    # Batch by _id so a user assigned thousands of tasks doesn't become one long-running write
+    modified = 0
+    while True:
+        ids = [doc["_id"] async for doc in collection.find(query, {"_id": 1}).limit(SUMMARY_FANOUT_BATCH_SIZE)]
+        if not ids:
+            return modified
+        result = await collection.update_many({"_id": {"$in": ids}}, update, stamp=False, **kwargs)
+        modified += result.modified_count
+        if result.modified_count == 0:
+            return modified
+
+async def fanout_user_summary(user_id: str) -> int:
+    user = await db.users.find_one({"id": user_id}, {"id": 1, "name": 1, "avatar": 1})
+    if not user:
+        return 0
+    summary = user_summary(user)
+    # Matching only stale copies makes re-running a fan-out a no-op
+    stale = {"$or": [{"assigned_user.name": {"$ne": summary["name"]}}, {"assigned_user.avatar": {"$ne": summary["avatar"]}}]}
+    updated = await fanout_updates(db.tasks, {"assigned_to": user_id, **stale}, {"$set": {"assigned_user": summary}})
+    await db.contracts.update_many(
+        {"staff_list": {"$elemMatch": {"user_id": user_id, "$or": [{"user_name": {"$ne": summary["name"]}}, {"user_avatar": {"$ne": summary["avatar"]}}]}}},
+        {"$set": {"staff_list.$[staff].user_name": summary["name"], "staff_list.$[staff].user_avatar": summary["avatar"]}},
+        array_filters=[{"staff.user_id": user_id}],
+        stamp=False
+    )
+    return updated
+
+async def fanout_contract_summary(contract_id: str) -> int:
+    contract = await db.contracts.find_one({"id": contract_id}, {"contract_number": 1, "project_name": 1})
+    if not contract:
+        return 0
+    summary = contract_summary(contract)
+    stale = {"$or": [{"contract_number": {"$ne": summary["contract_number"]}}, {"project_name": {"$ne": summary["project_name"]}}]}
+    return await fanout_updates(db.tasks, {"contract_id": contract_id, **stale}, {"$set": summary})
+
+async def summary_fanout_worker():
+    while True:
+        tenant_id, kind, entity_id = await summary_fanout_queue.get()
+        enqueued_at = summary_fanout_pending.pop((tenant_id, kind, entity_id), time.monotonic())
+        stats, updated_key = (risk_refresh_stats, "contracts_updated") if kind == "risk" else (summary_fanout_stats, "tasks_updated")
+        try:
+            with tenant_context(tenant_id):
+                if kind == "user":
+                    updated = await fanout_user_summary(entity_id)
+                elif kind == "risk":
+                    updated = await refresh_contract_risk(entity_id)
+                else:
+                    updated = await fanout_contract_summary(entity_id)
+            lag_ms = (time.monotonic() - enqueued_at) * 1000
+            stats["processed"] += 1
+            stats[updated_key] += updated
+            stats["last_lag_ms"] = round(lag_ms, 3)
+            stats["max_lag_ms"] = round(max(stats["max_lag_ms"], lag_ms), 3)
+            stats["total_lag_ms"] += lag_ms
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"Summary fan-out failed for {kind} {entity_id}: {e}")
+        finally:
+            summary_fanout_queue.task_done()
+
+async def attach_missing_task_summaries(tasks: list):
+    """Fill summaries for tasks written before they were embedded, with one batched lookup per collection"""
+    legacy = [task for task in tasks if "contract_number" not in task]
+    if not legacy:
+        return
+    user_ids = list({task["assigned_to"] for task in legacy if task.get("assigned_to")})
+    contract_ids = list({task["contract_id"] for task in legacy})
+    users = {user["id"]: user async for user in db.users.find({"id": {"$in": user_ids}}, {"id": 1, "name": 1, "avatar": 1})}
+    contracts = {contract["id"]: contract async for contract in db.contracts.find({"id": {"$in": contract_ids}}, {"id": 1, "contract_number": 1, "project_name": 1})}
+    for task in legacy:
+        if task.get("assigned_to") in users:
+            task["assigned_user"] = user_summary(users[task["assigned_to"]])
+        if task["contract_id"] in contracts:
+            task.update(contract_summary(contracts[task["contract_id"]]))
+
+async def backfill_task_summaries():
+    """One-off migration for tasks created before summaries were embedded"""
+    while True:
+        tasks = await db.tasks.find({"contract_number": {"$exists": False}}, {"_id": 1, "id": 1, "assigned_to": 1, "contract_id": 1}).to_list(SUMMARY_FANOUT_BATCH_SIZE)
+        if not tasks:
+            return
+        await attach_missing_task_summaries(tasks)
+        await db.tasks.bulk_write([
+            UpdateOne({"_id": task["_id"]}, {"$set": {
+                "assigned_user": task.get("assigned_user"),
+                "contract_number": task.get("contract_number"),
+                "project_name": task.get("project_name")
+            }})
+            for task in tasks
+        ], ordered=False, stamp=False)
+        await asyncio.sleep(REAPER_BATCH_PAUSE_SECONDS)
+
+# ==================== OVERDUE SCHEDULER ====================
+
+# Tasks carry is_overdue so overdue counts are lookups on a small partial index. Each tick
+# only examines tasks whose due_date passed since the previous tick; writes that change
+# status or due_date recompute the flag themselves.
+OVERDUE_TICK_SECONDS = float(os.environ.get("OVERDUE_TICK_SECONDS", "60"))
+OVERDUE_BATCH_SIZE = int(os.environ.get("OVERDUE_BATCH_SIZE", "1000"))
+NOTIFICATION_SINK = os.environ.get("NOTIFICATION_SINK", "log")
+NOTIFICATION_FILE = os.environ.get("NOTIFICATION_FILE", "notifications.jsonl")
+
+class LogNotificationSink:
+    async def send(self, recipient: dict, subject: str, body: str, payload: dict):
+        print(f"[notification] to {recipient.get('email')}: {subject}")
+
+class FileNotificationSink:
+    """Appends one JSON line per notification; stand-in for an email/SMS provider"""
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    async def send(self, recipient: dict, subject: str, body: str, payload: dict):
+        line = json.dumps(jsonable_encoder({
+            "sent_at": datetime.utcnow(),
+            "to": {"id": recipient["id"], "email": recipient.get("email"), "name": recipient.get("name")},
+            "subject": subject,
+            "body": body,
+            "payload": payload
+        }))
+        await asyncio.to_thread(self._append, line)
+    
+    def _append(self, line: str):
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+
+notification_sink = FileNotificationSink(NOTIFICATION_FILE) if NOTIFICATION_SINK == "file" else LogNotificationSink()
+
+def task_is_overdue(due_date, status: Optional[str], now: Optional[datetime] = None) -> bool:
+    due = parse_datetime(due_date)
+    return due is not None and status != "done" and due < (now or datetime.utcnow())
+
+async def claim_scheduler_tick(name: str, lease_seconds: float) -> Optional[dict]:
+    """Lease a named scheduler so only one worker runs each tick for the current tenant"""
+    now = datetime.utcnow()
+    try:
+        return await db.scheduler_state.find_one_and_update(
+            {"_id": tenant_key(name), "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=lease_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None
+
+async def send_overdue_digests(newly_overdue: list):
+    by_assignee = {}
+    for task in newly_overdue:
+        if task.get("assigned_to"):
+            by_assignee.setdefault(task["assigned_to"], []).append(task)
+    
+    def summary_lines(tasks):
+        return "\n".join(f"- {task['title']} ({task.get('contract_number') or task['contract_id']}), due {task['due_date']:%Y-%m-%d %H:%M}" for task in tasks)
+    
+    def task_payload(tasks):
+        return [{"id": task["id"], "title": task["title"], "contract_id": task["contract_id"], "due_date": task["due_date"]} for task in tasks]
+    
+    recipients = {user["id"]: user async for user in db.users.find(
+        {"$or": [{"id": {"$in": list(by_assignee)}}, {"role": "operations"}], "is_active": True},
+        {"id": 1, "name": 1, "email": 1, "role": 1}
+    )}
+    for user_id, tasks in by_assignee.items():
+        if user_id in recipients:
+            await notification_sink.send(recipients[user_id], f"{len(tasks)} of your tasks became overdue", summary_lines(tasks), {"tasks": task_payload(tasks)})
+    for user in recipients.values():
+        if user["role"] == "operations":
+            await notification_sink.send(user, f"{len(newly_overdue)} tasks became overdue", summary_lines(newly_overdue), {"tasks": task_payload(newly_overdue)})
+
+async def run_overdue_tick() -> int:
+    state = await claim_scheduler_tick("overdue_sweep", OVERDUE_TICK_SECONDS * 5)
+    if state is None:
+        return 0
+    now = datetime.utcnow()
+    window = {"$lte": now}
+    if state.get("last_tick"):
+        window["$gt"] = state["last_tick"]
+    
+    newly_overdue = []
+    try:
+        while True:
+            batch = await db.tasks.find(
+                {"due_date": window, "status": {"$ne": "done"}, "is_overdue": {"$ne": True}},
+                {"_id": 1, "id": 1, "title": 1, "assigned_to": 1, "contract_id": 1, "contract_number": 1, "due_date": 1}
+            ).sort("due_date", 1).to_list(OVERDUE_BATCH_SIZE)
+            if not batch:
+                break
+            await db.tasks.update_many(
+                {"_id": {"$in": [task["_id"] for task in batch]}, "status": {"$ne": "done"}},
+                {"$set": {"is_overdue": True, "overdue_since": now}},
+                stamp=False
+            )
+            newly_overdue.extend(batch)
+            await asyncio.sleep(0)
+        if newly_overdue:
+            await send_overdue_digests(newly_overdue)
+            for contract_id in {task["contract_id"] for task in newly_overdue}:
+                enqueue_risk_refresh(contract_id)
+        await queue_stale_risk_scores()
+        await db.scheduler_state.update_one({"_id": tenant_key("overdue_sweep")}, {"$set": {"last_tick": now, "lease_until": now, "last_marked": len(newly_overdue)}})
+    except Exception:
+        await db.scheduler_state.update_one({"_id": tenant_key("overdue_sweep")}, {"$set": {"lease_until": now}})
+        raise
+    return len(newly_overdue)
+
+async def overdue_scheduler():
+    while True:
+        for tenant_id in active_tenants():
+            with tenant_context(tenant_id):
+                try:
+                    await run_overdue_tick()
+                except Exception as e:
+                    print(f"Overdue tick failed for tenant {tenant_id}: {e}")
+        await asyncio.sleep(OVERDUE_TICK_SECONDS)
+
+# ==================== CONTRACT RISK ====================
+
+# Contracts store risk_score (0-100) with its breakdown, so "most at risk" is one read of the
+# (tenant_id, risk_score) index. Writes that change an input (finance allocation, payroll
+# reconcile, project dates, task create/delete and status/due dates, overdue marking by the
+# tick or the tasks_v2 migration) queue a re-score of that contract on the fan-out queue,
+# and the overdue tick re-scores contracts last scored before today since days-to-deadline
+# moves on its own.
+RISK_DEADLINE_WINDOW_DAYS = int(os.environ.get("RISK_DEADLINE_WINDOW_DAYS", "30"))
+# Points each factor contributes at its worst; factors are 0..1
+RISK_WEIGHTS = {"profit": 35, "overdue": 25, "schedule": 25, "deadline": 15}
+PROFIT_STATUS_RISK = {"green": 0.0, "orange": 0.5, "red": 1.0}
+
+def contract_risk(contract: dict, stats: dict, now: Optional[datetime] = None) -> dict:
+    """Fields to $set on a contract, from its profit status, task stats and project dates"""
+    now = now or datetime.utcnow()
+    total, completed, overdue = stats.get("total", 0), stats.get("completed", 0), stats.get("overdue", 0)
+    remaining = 1 - completed / total if total else 0.0
+    start = parse_datetime(contract.get("project_start_date"))
+    end = parse_datetime(contract.get("project_end_date"))
+    days_to_end = round((end - now).total_seconds() / 86400, 1) if end else None
+    
+    elapsed = 0.0
+    if start and end and end > start:
+        elapsed = min(1.0, max(0.0, (now - start) / (end - start)))
+    deadline = 0.0
+    if days_to_end is not None and remaining:
+        deadline = 1.0 if days_to_end <= 0 else max(0.0, 1 - days_to_end / RISK_DEADLINE_WINDOW_DAYS)
+    factors = {
+        "profit": PROFIT_STATUS_RISK.get(contract.get("profit_status"), 0.0),
+        "overdue": overdue / total if total else 0.0,
+        # Share of the schedule used up beyond the share of tasks completed
+        "schedule": max(0.0, elapsed - (1 - remaining)) if total else 0.0,
+        "deadline": deadline
+    }
+    score = 0.0 if contract.get("manual_status") == "inactive" else sum(RISK_WEIGHTS[name] * value for name, value in factors.items())
+    return {
+        "risk_score": round(score, 1),
+        "risk": {
+            "factors": {name: round(value, 3) for name, value in factors.items()},
+            "tasks": {"total": total, "completed": completed, "overdue": overdue},
+            "days_to_end": days_to_end
+        },
+        "risk_as_of": now
+    }
+
+async def refresh_contract_risk(contract_id: str) -> int:
+    contract = await db.contracts.find_one(
+        {"id": contract_id},
+        {"id": 1, "profit_status": 1, "project_start_date": 1, "project_end_date": 1, "manual_status": 1}
+    )
+    if not contract:
+        return 0
+    stats = (await contract_task_stats(db, [contract_id])).get(contract_id, {})
+    result = await db.contracts.update_one({"id": contract_id}, {"$set": contract_risk(contract, stats)}, stamp=False)
+    return result.modified_count
+
+def enqueue_risk_refresh(contract_id: str):
+    enqueue_summary_fanout("risk", contract_id)
+
+async def queue_stale_risk_scores() -> int:
+    """Contracts scored before today (or never), up to one batch per tick"""
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    queued = 0
+    async for contract in db.contracts.find({"$or": [{"risk_as_of": {"$lt": today}}, {"risk_as_of": None}]}, {"id": 1}).limit(OVERDUE_BATCH_SIZE):
+        enqueue_risk_refresh(contract["id"])
+        queued += 1
+    return queued
+
+# ==================== TASK DEPENDENCIES ====================
+
+# Tasks list the tasks of the same contract they wait on in depends_on; the multikey
+# depends_on index is the reverse adjacency, so a task's dependents are one indexed find.
+# Each task stores its place in the contract schedule:
+#   forecast_finish  completed_at once done, otherwise the later of its due_date and the
+#                    latest forecast_finish among its dependencies plus duration_days
+#   tail_days        the longest chain of duration_days that still has to follow it
+#   path_end         forecast_finish + tail_days, the earliest the contract can end via it
+# The contract's projected end is its largest path_end, the critical path is the tasks that
+# reach it and a task's slack is the gap, so reads are range scans on (contract_id,
+# path_end). Status and due_date changes only move forecast_finish, which is recomputed for
+# the task and its downstream subgraph; tail_days depends on durations and edges alone, so
+# only dependency and duration changes also walk upstream. Walks go one level per query:
+# downstream through the depends_on index, upstream by id through depends_on itself, so
+# they read only the subgraph they reach (plus its direct neighbours) and rewrite only it.
+# Path ends within this much of the projected end count as critical (stored times are
+# truncated to milliseconds, so chains don't always add up exactly)
+CRITICAL_PATH_TOLERANCE = timedelta(seconds=1)
+SCHEDULE_PROJECTION = {
+    "_id": 0, "id": 1, "depends_on": 1, "duration_days": 1, "status": 1, "due_date": 1, "completed_at": 1,
+    "created_at": 1, "updated_at": 1, "forecast_finish": 1, "tail_days": 1, "path_end": 1
+}
+
+def to_millis(value: datetime) -> datetime:
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+def task_duration(task: dict) -> float:
+    # Tasks created before dependencies existed take the default of a day
+    return task.get("duration_days", 1.0)
+
+def task_forecast(task: dict, dependency_finishes: list) -> datetime:
+    if task.get("status") == "done":
+        return parse_datetime(task.get("completed_at") or task.get("updated_at") or task["created_at"])
+    start = max(dependency_finishes) if dependency_finishes else parse_datetime(task["created_at"])
+    finish = start + timedelta(days=task_duration(task))
+    due = parse_datetime(task.get("due_date"))
+    return to_millis(max(finish, due) if due else finish)
+
+def topological_order(tasks: dict) -> tuple:
+    """(tasks ordered after their dependencies within the dict, dependents by task id)"""
+    dependents = {}
+    waiting = {}
+    for task_id, task in tasks.items():
+        dependencies = [dep for dep in task.get("depends_on", []) if dep in tasks]
+        waiting[task_id] = len(dependencies)
+        for dep in dependencies:
+            dependents.setdefault(dep, []).append(task_id)
+    ready = [task_id for task_id, count in waiting.items() if count == 0]
+    order = []
+    while ready:
+        task_id = ready.pop()
+        order.append(tasks[task_id])
+        for child in dependents.get(task_id, []):
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                ready.append(child)
+    # Only tasks on a cycle are left; writes reject cycles, so this is just a guard
+    order.extend(tasks[task_id] for task_id, count in waiting.items() if count > 0)
+    return order, dependents
+
+def schedule_update(task: dict, forecast: Optional[datetime], tail: float) -> Optional[UpdateOne]:
+    fields = {
+        "forecast_finish": forecast,
+        "tail_days": round(tail, 4),
+        "path_end": to_millis(forecast + timedelta(days=tail)) if forecast else None
+    }
+    if all(task.get(name) == value for name, value in fields.items()):
+        return None
+    return UpdateOne({"id": task["id"]}, {"$set": fields})
+
+async def save_schedule(updates: list) -> int:
+    updates = [update for update in updates if update is not None]
+    for start in range(0, len(updates), SUMMARY_FANOUT_BATCH_SIZE):
+        await db.tasks.bulk_write(updates[start:start + SUMMARY_FANOUT_BATCH_SIZE], ordered=False, stamp=False)
+    return len(updates)
+
+async def contract_schedule(contract_id: str) -> dict:
+    """Schedule fields of every task of the contract by id, for whole-contract rebuilds"""
+    return {task["id"]: task async for task in db.tasks.find({"contract_id": contract_id}, SCHEDULE_PROJECTION)}
+
+async def schedule_fields(query: dict) -> dict:
+    return {task["id"]: task async for task in db.tasks.find(query, SCHEDULE_PROJECTION)}
+
+async def downstream_tasks(task_ids: list) -> dict:
+    """The tasks and everything that transitively depends on them, by id"""
+    tasks = await schedule_fields({"id": {"$in": task_ids}})
+    frontier = list(tasks)
+    while frontier:
+        found = await schedule_fields({"depends_on": {"$in": frontier}})
+        frontier = [task_id for task_id in found if task_id not in tasks]
+        tasks.update({task_id: found[task_id] for task_id in frontier})
+    return tasks
+
+async def upstream_tasks(task_ids: list) -> dict:
+    """The tasks and everything they transitively depend on, by id"""
+    tasks = {}
+    frontier = list(task_ids)
+    while frontier:
+        found = await schedule_fields({"id": {"$in": frontier}})
+        tasks.update(found)
+        frontier = list({dep for task in found.values() for dep in task.get("depends_on", []) if dep not in tasks})
+    return tasks
+
+async def recompute_forecasts(task_ids: list) -> int:
+    """forecast_finish and path_end for the tasks and their downstream subgraph"""
+    affected = await downstream_tasks(task_ids)
+    order, _ = topological_order(affected)
+    # Dependencies outside the subgraph keep their stored forecasts
+    outside = list({dep for task in affected.values() for dep in task.get("depends_on", []) if dep not in affected})
+    finishes = {task_id: task.get("forecast_finish") for task_id, task in (await schedule_fields({"id": {"$in": outside}})).items()} if outside else {}
+    updates = []
+    for task in order:
+        finishes[task["id"]] = task_forecast(task, [finishes[dep] for dep in task.get("depends_on", []) if finishes.get(dep)])
+        updates.append(schedule_update(task, finishes[task["id"]], task.get("tail_days", 0.0)))
+    return await save_schedule(updates)
+
+async def recompute_tails(task_ids: list) -> int:
+    """tail_days and path_end for the tasks and everything upstream of them"""
+    affected = await upstream_tasks(task_ids)
+    order, _ = topological_order(affected)
+    # Every direct dependent, including those outside the subgraph with their stored tails
+    children = await schedule_fields({"depends_on": {"$in": list(affected)}})
+    dependents = {}
+    for child in children.values():
+        for dep in child.get("depends_on", []):
+            dependents.setdefault(dep, []).append(child)
+    tails = {}
+    updates = []
+    for task in reversed(order):
+        tails[task["id"]] = max((task_duration(child) + tails.get(child["id"], child.get("tail_days", 0.0)) for child in dependents.get(task["id"], [])), default=0.0)
+        updates.append(schedule_update(task, task.get("forecast_finish"), tails[task["id"]]))
+    return await save_schedule(updates)
+
+async def rebuild_contract_schedule(contract_id: str) -> int:
+    """Both passes over a whole contract, for tasks written before schedules were stored"""
+    tasks = await contract_schedule(contract_id)
+    order, dependents = topological_order(tasks)
+    finishes, tails = {}, {}
+    for task in order:
+        finishes[task["id"]] = task_forecast(task, [finishes[dep] for dep in task.get("depends_on", []) if dep in finishes])
+    for task in reversed(order):
+        tails[task["id"]] = max((task_duration(tasks[child]) + tails[child] for child in dependents.get(task["id"], [])), default=0.0)
+    return await save_schedule([schedule_update(task, finishes[task["id"]], tails[task["id"]]) for task in order])
+
+async def validate_dependencies(task_id: Optional[str], contract_id: str, depends_on: list) -> list:
+    depends_on = list(dict.fromkeys(depends_on))
+    if task_id in depends_on:
+        raise HTTPException(status_code=400, detail="A task cannot depend on itself")
+    if depends_on and await db.tasks.count_documents({"id": {"$in": depends_on}, "contract_id": contract_id}) != len(depends_on):
+        raise HTTPException(status_code=400, detail="Dependencies must be existing tasks of the same contract")
+    if task_id and depends_on:
+        # A new edge closes a cycle when the dependency is already downstream of this task
+        if set(depends_on) & (await downstream_tasks([task_id])).keys():
+            raise HTTPException(status_code=400, detail="Dependencies would create a cycle")
+    return depends_on
+
+async def backfill_task_schedules():
+    """One-off migration: contracts with tasks created before schedules were stored"""
+    while True:
+        task = await db.tasks.find_one({"forecast_finish": {"$exists": False}}, {"contract_id": 1})
+        if not task:
+            return
+        await rebuild_contract_schedule(task["contract_id"])
+        await asyncio.sleep(REAPER_BATCH_PAUSE_SECONDS)
+
+# ==================== SCHEMA MIGRATIONS ====================
+
+# Documents carry schema_version; a missing field means version 1. New writes are stamped
+# with the current version, and older documents are upgraded online in throttled batches
+# by a single leased runner that records its _id cursor in schema_migrations so a restart
+# resumes where it stopped. Readers keep tolerating old shapes until a migration finishes.
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "200"))
+MIGRATION_BATCH_PAUSE_SECONDS = float(os.environ.get("MIGRATION_BATCH_PAUSE_SECONDS", "0.1"))
+MIGRATION_LEASE_SECONDS = 60
+
+def migrate_contract_dates(contract: dict) -> dict:
+    """v2: project dates stored as datetimes instead of ISO strings"""
+    return {
+        "project_start_date": parse_datetime(contract.get("project_start_date")),
+        "project_end_date": parse_datetime(contract.get("project_end_date"))
+    }
+
+def migrate_task_due_date(task: dict) -> dict:
+    """v2: due_date always present and a datetime, with is_overdue derived from it"""
+    due_date = parse_datetime(task.get("due_date"))
+    return {
+        "due_date": due_date,
+        "is_overdue": task_is_overdue(due_date, task.get("status")) if "is_overdue" not in task else task["is_overdue"]
+    }
+
+def rescore_newly_overdue(task: dict, changes: dict):
+    # Deriving is_overdue changes the contract's overdue risk factor
+    if changes["is_overdue"] and not task.get("is_overdue"):
+        enqueue_risk_refresh(task["contract_id"])
+
+# Applied in order; each entry lifts documents of its collection to `version`, then calls
+# its optional `after` hook with each document it rewrote and its changes
+MIGRATIONS = [
+    {"name": "contracts_v2_dates", "collection": "contracts", "version": 2, "migrate": migrate_contract_dates},
+    {"name": "tasks_v2_due_date", "collection": "tasks", "version": 2, "migrate": migrate_task_due_date, "after": rescore_newly_overdue},
+]
+SCHEMA_VERSIONS = {"contracts": 1, "tasks": 1}
+for migration in MIGRATIONS:
+    SCHEMA_VERSIONS[migration["collection"]] = max(SCHEMA_VERSIONS.get(migration["collection"], 1), migration["version"])
+
+def below_version(version: int) -> dict:
+    return {"$or": [{"schema_version": {"$lt": version}}, {"schema_version": {"$exists": False}}]}
+
+async def run_migration(migration: dict) -> int:
+    """Upgrade one collection batch by batch; returns how many documents were rewritten"""
+    collection = db[migration["collection"]]
+    state = await db.schema_migrations.find_one({"_id": tenant_key(migration["name"])}) or {}
+    if state.get("status") == "done":
+        return 0
+    await db.schema_migrations.update_one({"_id": tenant_key(migration["name"])}, {
+        "$set": {"status": "running", "version": migration["version"], "collection": migration["collection"]},
+        "$setOnInsert": {"started_at": datetime.utcnow(), "migrated": 0, "conflicts": 0}
+    }, upsert=True)
+    
+    last_id = state.get("last_id")
+    migrated = 0
+    while True:
+        query = below_version(migration["version"])
+        if last_id is not None:
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+        batch = await collection.find(query).sort("_id", 1).to_list(MIGRATION_BATCH_SIZE)
+        if not batch:
+            break
+        
+        requests = []
+        migrated_docs = []
+        for doc in batch:
+            changes = migration["migrate"](doc)
+            migrated_docs.append((doc, changes))
+            # Only rewrite if the migrated fields still hold what we read, so a concurrent
+            # app write is never clobbered; such documents are picked up by the next pass.
+            guard = {"_id": doc["_id"], **below_version(migration["version"])}
+            for field in changes:
+                guard[field] = doc.get(field)
+            requests.append(UpdateOne(guard, {"$set": {**changes, "schema_version": migration["version"]}}))
+        result = await collection.bulk_write(requests, ordered=False, stamp=False)
+        migrated += result.modified_count
+        last_id = batch[-1]["_id"]
+        if migration.get("after") and result.modified_count:
+            # App updates never set schema_version, so the batch ids now at this version are exactly
+            # the documents the guarded updates rewrote; conflicted ones get the hook on a later pass
+            rewritten = {
+                row["_id"] async for row in collection.find(
+                    {"_id": {"$in": [doc["_id"] for doc in batch]}, "schema_version": migration["version"]}, {"_id": 1}
+                )
+            }
+            for doc, changes in migrated_docs:
+                if doc["_id"] in rewritten:
+                    migration["after"](doc, changes)
+        
+        await db.schema_migrations.update_one({"_id": tenant_key(migration["name"])}, {
+            "$set": {"last_id": last_id, "updated_at": datetime.utcnow()},
+            "$inc": {"migrated": result.modified_count, "conflicts": len(batch) - result.matched_count}
+        })
+        await db.scheduler_state.update_one({"_id": tenant_key("schema_migrations")}, {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=MIGRATION_LEASE_SECONDS)}})
+        await asyncio.sleep(MIGRATION_BATCH_PAUSE_SECONDS)
+    
+    if await collection.count_documents(below_version(migration["version"]), limit=1):
+        # Conflicted or concurrently inserted legacy documents: rescan from the start next run
+        await db.schema_migrations.update_one({"_id": tenant_key(migration["name"])}, {"$set": {"status": "pending"}, "$unset": {"last_id": ""}})
+    else:
+        await db.schema_migrations.update_one({"_id": tenant_key(migration["name"])}, {"$set": {"status": "done", "finished_at": datetime.utcnow()}, "$unset": {"last_id": ""}})
+    return migrated
+
+async def run_migrations() -> Optional[int]:
+    """Run the current tenant's pending migrations in order under a lease; None if another worker holds it"""
+    if await claim_scheduler_tick("schema_migrations", MIGRATION_LEASE_SECONDS) is None:
+        return None
+    migrated = 0
+    try:
+        for migration in MIGRATIONS:
+            migrated += await run_migration(migration)
+    finally:
+        await db.scheduler_state.update_one({"_id": tenant_key("schema_migrations")}, {"$set": {"lease_until": datetime.utcnow()}})
+    return migrated
+
+async def migration_runner():
+    """Retry until every tenant's migrations are done; the lease keeps other workers out meanwhile"""
+    while True:
+        pending = False
+        for tenant_id in active_tenants():
+            with tenant_context(tenant_id):
+                try:
+                    await run_migrations()
+                    done = await db.schema_migrations.count_documents({"_id": {"$in": [tenant_key(m["name"]) for m in MIGRATIONS]}, "status": "done"})
+                    pending = pending or done < len(MIGRATIONS)
+                except Exception as e:
+                    pending = True
+                    print(f"Schema migration failed for tenant {tenant_id}: {e}")
+        if not pending:
+            return
+        await asyncio.sleep(MIGRATION_LEASE_SECONDS)
+
+# ==================== REPORT JOBS ====================
+
+# Portfolio-wide reports run outside the request. POST /api/reports stores a job document,
+# REPORT_WORKERS loops per process claim jobs atomically, and results are written as JSON
+# files under REPORT_DIR. A job whose worker dies is reclaimed once its lease lapses.
+REPORT_DIR = os.environ.get("REPORT_DIR", "reports")
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+REPORT_POLL_SECONDS = float(os.environ.get("REPORT_POLL_SECONDS", "2"))
+REPORT_LEASE_SECONDS = float(os.environ.get("REPORT_LEASE_SECONDS", "120"))
+REPORT_MAX_ATTEMPTS = int(os.environ.get("REPORT_MAX_ATTEMPTS", "3"))
+REPORT_BATCH_SIZE = int(os.environ.get("REPORT_BATCH_SIZE", "200"))
+REPORT_WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+class ReportRequest(BaseModel):
+    type: str
+    params: dict = {}
+
+class ReportCancelled(Exception):
+    pass
+
+class ReportProgress:
+    """Handed to report handlers; every update also renews the job lease"""
+    
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+    
+    async def update(self, done: int, total: int):
+        result = await db.report_jobs.update_one(
+            {"id": self.job_id, "status": "running", "worker": REPORT_WORKER_ID},
+            {"$set": {"progress": {"done": done, "total": total}, "lease_until": datetime.utcnow() + timedelta(seconds=REPORT_LEASE_SECONDS)}}
+        )
+        if not result.matched_count:
+            raise ReportCancelled()
+
+def report_period(params: dict) -> dict:
+    """Normalize {"quarter": "2026-Q3"} or {"start", "end"} dates; defaults to the current quarter"""
+    if params.get("start") or params.get("end"):
+        start = date.fromisoformat(params["start"])
+        end = date.fromisoformat(params["end"])
+    else:
+        today = datetime.utcnow().date()
+        quarter = params.get("quarter") or f"{today.year}-Q{(today.month - 1) // 3 + 1}"
+        match = re.fullmatch(r"(\d{4})-Q([1-4])", quarter)
+        if not match:
+            raise ValueError("quarter must look like 2026-Q3")
+        start = date(int(match.group(1)), (int(match.group(2)) - 1) * 3 + 1, 1)
+        next_start = date(start.year + 1, 1, 1) if start.month == 10 else date(start.year, start.month + 3, 1)
+        end = next_start - timedelta(days=1)
+    if end < start:
+        raise ValueError("end must not be before start")
+    return {"start": start.isoformat(), "end": end.isoformat()}
+
+async def portfolio_report(params: dict, progress: ReportProgress) -> dict:
+    """Every contract with its profit breakdown, status and task progress"""
+    total = await analytics_db.contracts.count_documents({})
+    rows = []
+    last_id = None
+    while True:
+        with db_timeout():
+            batch = await analytics_db.contracts.find(
+                {"_id": {"$gt": last_id}} if last_id else {},
+                {"staff_list.user_id": 0, "staff_list.user_name": 0, "staff_list.user_avatar": 0}
+            ).sort("_id", 1).to_list(REPORT_BATCH_SIZE)
+            if not batch:
+                break
+            task_stats = await contract_task_stats(analytics_db, [contract["id"] for contract in batch])
+        last_id = batch[-1]["_id"]
+        for contract in batch:
+            costs = {field: contract.get(field) or 0 for field in COST_FIELDS}
+            target_profit, actual_profit, profit_status = calculate_profits(contract.get("contract_value") or 0, **costs)
+            stats = task_stats.get(contract["id"], {})
+            rows.append({
+                "id": contract["id"],
+                "contract_number": contract.get("contract_number"),
+                "client_name": contract.get("client_name"),
+                "project_name": contract.get("project_name"),
+                "project_status": calculate_contract_status(contract.get("project_start_date"), contract.get("project_end_date"), contract.get("manual_status")),
+                "contract_value": contract.get("contract_value") or 0,
+                "costs": costs,
+                "total_costs": sum(costs.values()),
+                "payroll_total": sum(staff.get("payment_amount") or 0 for staff in contract.get("staff_list", [])),
+                "target_profit": target_profit,
+                "actual_profit": actual_profit,
+                "profit_status": profit_status,
+                "tasks": {
+                    "total": stats.get("total", 0),
+                    "completed": stats.get("completed", 0),
+                    "overdue": stats.get("overdue", 0),
+                    "progress": round((stats.get("completed", 0) / stats["total"] * 100) if stats.get("total") else 0, 1)
+                }
+            })
+        await progress.update(len(rows), max(total, len(rows)))
+    
+    by_status = {"green": 0, "orange": 0, "red": 0}
+    for row in rows:
+        by_status[row["profit_status"]] += 1
+    return {
+        "generated_at": datetime.utcnow(),
+        "contracts": rows,
+        "totals": {
+            "contracts": len(rows),
+            "contract_value": sum(row["contract_value"] for row in rows),
+            "target_profit": sum(row["target_profit"] for row in rows),
+            "actual_profit": sum(row["actual_profit"] for row in rows),
+            "profit_status": by_status
         }
-        await db.users.insert_one(ceo_user)
+    }
+
+async def team_performance_report(params: dict, progress: ReportProgress) -> dict:
+    """Team performance over tasks created in the period"""
+    start = datetime.fromisoformat(params["start"])
+    end = datetime.fromisoformat(params["end"]) + timedelta(days=1)
+    with db_timeout(REPORT_LEASE_SECONDS):
+        team = await team_performance_rows(analytics_db, {"created_at": {"$gte": start, "$lt": end}})
+    await progress.update(1, 1)
+    return {"generated_at": datetime.utcnow(), "period": params, "team": team}
+
+REPORT_TYPES = {
+    "portfolio": {"handler": portfolio_report, "roles": ["ceo", "finance"], "params": lambda params: {}},
+    "team_performance": {"handler": team_performance_report, "roles": ["ceo", "operations"], "params": report_period},
+}
+
+def write_report_file(path: str, result: dict) -> int:
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    data = json.dumps(jsonable_encoder(result)).encode()
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    return len(data)
+
+async def claim_report_job() -> Optional[dict]:
+    now = datetime.utcnow()
+    return await db.report_jobs.find_one_and_update(
+        {"$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}], "attempts": {"$lt": REPORT_MAX_ATTEMPTS}},
+        {"$set": {"status": "running", "worker": REPORT_WORKER_ID, "started_at": now, "lease_until": now + timedelta(seconds=REPORT_LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_report_job(job: dict):
+    owned = {"id": job["id"], "status": "running", "worker": REPORT_WORKER_ID}
+    path = os.path.join(REPORT_DIR, f"{job['id']}.json")
+    try:
+        result = await REPORT_TYPES[job["type"]]["handler"](job["params"], ReportProgress(job["id"]))
+        size = await asyncio.to_thread(write_report_file, path, result)
+        finished = await db.report_jobs.update_one(owned, {"$set": {
+            "status": "done", "finished_at": datetime.utcnow(), "result_file": os.path.basename(path), "result_bytes": size, "error": None
+        }})
+        if not finished.matched_count:
+            # Cancelled while the file was being written
+            await asyncio.to_thread(lambda: os.path.exists(path) and os.remove(path))
+    except ReportCancelled:
+        pass
+    except Exception as e:
+        print(f"Report job {job['id']} failed: {e}")
+        await db.report_jobs.update_one(owned, {"$set": {
+            "status": "failed" if job["attempts"] >= REPORT_MAX_ATTEMPTS else "queued",
+            "error": str(e), "lease_until": None
+        }})
+
+async def run_next_report_job() -> bool:
+    job = await claim_report_job()
+    if job is None:
+        # Jobs whose workers died after their last allowed attempt
+        await db.report_jobs.update_many(
+            {"status": "running", "lease_until": {"$lt": datetime.utcnow()}, "attempts": {"$gte": REPORT_MAX_ATTEMPTS}},
+            {"$set": {"status": "failed", "error": "Worker lost", "finished_at": datetime.utcnow()}}
+        )
+        return False
+    await run_report_job(job)
+    return True
+
+async def report_worker():
+    while True:
+        # Round-robin over tenants so one tenant's backlog doesn't delay everyone's reports
+        ran = False
+        for tenant_id in active_tenants():
+            with tenant_context(tenant_id):
+                try:
+                    ran = await run_next_report_job() or ran
+                except Exception as e:
+                    print(f"Report worker error for tenant {tenant_id}: {e}")
+        if not ran:
+            await asyncio.sleep(REPORT_POLL_SECONDS)
+
+# ==================== PROFILING ====================
+
+# Sampled per-route profiling, switched on at runtime by the CEO. With no targets
+# registered the middleware is a single dict truthiness check per request.
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILERS = ["cprofile"] + (["pyinstrument"] if PyinstrumentProfiler else [])
+
+# (method, route template) -> target settings and counters
+profiling_targets = {}
+# One capture at a time: a second cProfile on the loop thread steals the hook (3.11) or raises (3.12+)
+profile_capture_active = False
+
+def profile_capture_name(method: str, route: str, extension: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_")
+    return f"{method.lower()}_{slug}_{datetime.utcnow():%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:8]}.{extension}"
+
+def write_profile_capture(name: str, data):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, name)
+    if isinstance(data, cProfile.Profile):
+        data.dump_stats(path)
+    else:
+        with open(path, "w") as f:
+            f.write(data)
+
+class ProfilingMiddleware:
+    """Plain ASGI middleware (not BaseHTTPMiddleware) so the disabled path adds no per-request task or body copying.
+
+    cprofile writes .prof files (snakeviz, flameprof, gprof2dot). It profiles the whole event
+    loop thread while the request runs, so concurrent requests show up in the capture.
+    pyinstrument, when installed, is async-aware and writes speedscope JSON flamegraphs."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        global profile_capture_active
+        if not profiling_targets or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        target = None
+        for (method, _), candidate in profiling_targets.items():
+            if method == scope["method"] and candidate["pattern"].match(scope["path"]):
+                target = candidate
+                break
+        if (target is None or profile_capture_active or target["captured"] >= target["max_captures"]
+                or random.random() >= target["sample_rate"]):
+            return await self.app(scope, receive, send)
+        
+        # Reserve the slot before the first await so overlapping requests pass straight through
+        profile_capture_active = True
+        target["captured"] += 1
+        try:
+            started = time.perf_counter()
+            if target["profiler"] == "pyinstrument":
+                profiler = PyinstrumentProfiler(async_mode="enabled")
+                profiler.start()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    profiler.stop()
+                    from pyinstrument.renderers import SpeedscopeRenderer
+                    name = profile_capture_name(target["method"], target["route"], "speedscope.json")
+                    await asyncio.to_thread(write_profile_capture, name, profiler.output(SpeedscopeRenderer()))
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    profiler.disable()
+                    name = profile_capture_name(target["method"], target["route"], "prof")
+                    await asyncio.to_thread(write_profile_capture, name, profiler)
+            target["last_capture"] = {"name": name, "duration_ms": round((time.perf_counter() - started) * 1000, 3)}
+        finally:
+            profile_capture_active = False
+
+app.add_middleware(ProfilingMiddleware)
+
+class ProfilingTarget(BaseModel):
+    route: str
+    method: str = "GET"
+    sample_rate: float = 0.1
+    profiler: str = "cprofile"
+    max_captures: int = 20
+
+# ==================== RATE LIMITING ====================
+
+def parse_rate_limit(route_class: str, default: str):
+    """RATE_LIMIT_<CLASS>="<requests per minute>:<burst>", e.g. RATE_LIMIT_HEAVY=30:10"""
+    per_minute, burst = os.environ.get(f"RATE_LIMIT_{route_class.upper()}", default).split(":")
+    return float(per_minute) / 60, int(burst)
+
+# Token bucket (refill rate per second, capacity) per route class
+RATE_LIMITS = {
+    "login_ip": parse_rate_limit("login_ip", "20:10"),
+    "login_account": parse_rate_limit("login_account", "10:5"),
+    "signup": parse_rate_limit("signup", "10:5"),
+    "heavy": parse_rate_limit("heavy", "30:10")
+}
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+# Only trust X-Forwarded-For when the app is known to sit behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Heavy aggregation routes admitted at once per worker, and per user
+HEAVY_ROUTE_CONCURRENCY = int(os.environ.get("HEAVY_ROUTE_CONCURRENCY", "8"))
+HEAVY_ROUTE_PER_USER_CONCURRENCY = int(os.environ.get("HEAVY_ROUTE_PER_USER_CONCURRENCY", "2"))
+HEAVY_ROUTE_QUEUE_SECONDS = float(os.environ.get("HEAVY_ROUTE_QUEUE_SECONDS", "2"))
+
+class MemoryRateLimitStore:
+    """Per-worker token buckets; limits are effectively multiplied by the worker count"""
+    
+    MAX_KEYS = 100000
+    
+    def __init__(self):
+        # Least recently used first, so a flood of new keys only evicts idle buckets
+        self.buckets = OrderedDict()
+    
+    def _tokens(self, key: str, rate: float, capacity: int, now: float) -> float:
+        tokens, updated = self.buckets.get(key, (capacity, now))
+        return min(capacity, tokens + (now - updated) * rate)
+    
+    async def peek(self, key: str, rate: float, capacity: int):
+        tokens = self._tokens(key, rate, capacity, time.monotonic())
+        return tokens >= 1, 0 if tokens >= 1 else (1 - tokens) / rate
+    
+    async def take(self, key: str, rate: float, capacity: int):
+        now = time.monotonic()
+        tokens = self._tokens(key, rate, capacity, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.MAX_KEYS:
+            self.buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+class MongoRateLimitStore:
+    """Token buckets shared by all workers, refilled and decremented in one atomic pipeline update"""
+    
+    async def peek(self, key: str, rate: float, capacity: int):
+        bucket = await db.rate_limits.find_one({"key": key}, {"tokens": 1, "updated_at": 1})
+        if not bucket:
+            return True, 0
+        elapsed = (datetime.utcnow() - bucket["updated_at"]).total_seconds()
+        tokens = min(capacity, bucket["tokens"] + max(0.0, elapsed) * rate)
+        return tokens >= 1, 0 if tokens >= 1 else (1 - tokens) / rate
+    
+    async def take(self, key: str, rate: float, capacity: int):
+        now = datetime.utcnow()
+        elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        bucket = await db.rate_limits.find_one_and_update(
+            {"key": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed_seconds, rate]}]}]},
+                    "updated_at": now
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return bucket["allowed"], 0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+rate_limit_store = MongoRateLimitStore() if RATE_LIMIT_BACKEND == "mongo" else MemoryRateLimitStore()
+heavy_route_semaphore = asyncio.Semaphore(HEAVY_ROUTE_CONCURRENCY)
+heavy_route_inflight = {}
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR and request.headers.get("x-forwarded-for"):
+        return request.headers["x-forwarded-for"].split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def rate_limited(retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail="Too many requests, slow down", headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+async def enforce_rate_limit(route_class: str, subject: str):
+    rate, capacity = RATE_LIMITS[route_class]
+    allowed, retry_after = await rate_limit_store.take(f"{route_class}:{subject}", rate, capacity)
+    if not allowed:
+        raise rate_limited(retry_after)
+
+async def check_rate_limit(route_class: str, subject: str):
+    """Reject when the bucket is empty without spending a token; pair with charge_rate_limit"""
+    rate, capacity = RATE_LIMITS[route_class]
+    allowed, retry_after = await rate_limit_store.peek(f"{route_class}:{subject}", rate, capacity)
+    if not allowed:
+        raise rate_limited(retry_after)
+
+async def charge_rate_limit(route_class: str, subject: str):
+    rate, capacity = RATE_LIMITS[route_class]
+    await rate_limit_store.take(f"{route_class}:{subject}", rate, capacity)
+
+def rate_limit_by_ip(route_class: str):
+    async def dependency(request: Request):
+        await enforce_rate_limit(route_class, client_ip(request))
+    return dependency
+
+async def heavy_route(current_user: dict = Depends(get_current_user)):
+    """Rate limit and admission control for expensive aggregation routes. Sheds load with 429
+    when a user exceeds their share and 503 when the worker is saturated, instead of queueing
+    unboundedly on the event loop and the Mongo pool."""
+    user_id = current_user["id"]
+    await enforce_rate_limit("heavy", user_id)
+    
+    if heavy_route_inflight.get(user_id, 0) >= HEAVY_ROUTE_PER_USER_CONCURRENCY:
+        raise HTTPException(status_code=429, detail="Too many concurrent requests", headers={"Retry-After": "1"})
+    heavy_route_inflight[user_id] = heavy_route_inflight.get(user_id, 0) + 1
+    try:
+        try:
+            await asyncio.wait_for(heavy_route_semaphore.acquire(), HEAVY_ROUTE_QUEUE_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": str(max(1, math.ceil(HEAVY_ROUTE_QUEUE_SECONDS)))})
+        try:
+            yield
+        finally:
+            heavy_route_semaphore.release()
+    finally:
+        heavy_route_inflight[user_id] -= 1
+        if heavy_route_inflight[user_id] <= 0:
+            heavy_route_inflight.pop(user_id, None)
+
+# ==================== INITIALIZATION ====================
+
+# (collection, keys, options). Reconciled in the background after startup; only missing
+# indexes are built, so restarts against an already-indexed database cost one listIndexes per collection.
+INDEX_SPECS = [
+    ("users", [("email", 1)], {"unique": True}),
+    ("users", [("id", 1)], {"unique": True}),
+    ("users", [("token_version_updated_at", 1)], {"sparse": True}),
+    ("contracts", [("id", 1)], {"unique": True}),
+    ("contracts", [("contract_number", 1)], {"unique": True}),
+    ("contracts", [("staff_list.user_id", 1)], {}),
+    ("contracts", [("risk_score", -1)], {}),
+    ("contracts", [("risk_as_of", 1)], {}),
+    ("tasks", [("id", 1)], {"unique": True}),
+    ("tasks", [("contract_id", 1)], {}),
+    ("tasks", [("contract_id", 1), ("created_at", -1)], {}),
+    ("tasks", [("assigned_to", 1), ("due_date", 1)], {}),
+    ("tasks", [("assigned_to", 1), ("created_at", -1)], {}),
+    ("tasks", [("due_date", 1)], {}),
+    # Reverse adjacency (a task's dependents) and the critical path range scan
+    ("tasks", [("depends_on", 1)], {}),
+    ("tasks", [("contract_id", 1), ("path_end", -1)], {}),
+    # Only overdue tasks are indexed, so overdue counts stay cheap regardless of task volume
+    ("tasks", [("is_overdue", 1), ("assigned_to", 1)], {"partialFilterExpression": {"is_overdue": True}}),
+    ("comments", [("task_id", 1)], {}),
+    ("comments", [("task_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ("activities", [("created_at", -1)], {}),
+    # Activity feed keyset indexes: every filter leads with its equality key and
+    # ends with (created_at, id) so cursor pages are a single index range scan.
+    ("activities", [("created_at", -1), ("id", -1)], {}),
+    ("activities", [("contract_id", 1), ("created_at", -1), ("id", -1)], {"partialFilterExpression": {"contract_id": {"$exists": True}}}),
+    ("activities", [("entity_type", 1), ("entity_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ("activities", [("user_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ("report_jobs", [("id", 1)], {"unique": True}),
+    ("report_jobs", [("status", 1), ("created_at", 1)], {}),
+    ("report_jobs", [("requested_by", 1), ("created_at", -1)], {}),
+    ("idempotency_keys", [("key", 1)], {"unique": True}),
+    ("idempotency_keys", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("tombstones", [("status", 1), ("claimed_until", 1), ("deleted_at", 1)], {}),
+    ("tombstones", [("entity_type", 1), ("entity_id", 1)], {}),
+    ("tombstones", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("cascade_deletes", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+]
+if RATE_LIMIT_BACKEND == "mongo":
+    INDEX_SPECS += [
+        ("rate_limits", [("key", 1)], {"unique": True}),
+        ("rate_limits", [("updated_at", 1)], {"expireAfterSeconds": 3600}),
+    ]
+# Tenant-scoped queries always carry tenant_id, so it leads every index (and makes unique
+# keys unique per tenant). TTL indexes must stay single-field.
+INDEX_SPECS = [
+    (collection_name, keys if "expireAfterSeconds" in options else [("tenant_id", 1), *keys], options)
+    for collection_name, keys, options in INDEX_SPECS
+]
+# cdc_export.py polls these across all tenants of a database
+INDEX_SPECS += [(collection_name, [("changed_at", 1)], {}) for collection_name in sorted(CHANGE_TRACKED_COLLECTIONS)]
+INDEX_SPECS += [("tombstones", [("deleted_at", 1)], {}), ("cascade_deletes", [("deleted_at", 1)], {})]
+
+READINESS_CACHE_SECONDS = float(os.environ.get("READINESS_CACHE_SECONDS", "2"))
+
+startup_state = {
+    "started_at": datetime.utcnow(),
+    "indexes": {"total": len(INDEX_SPECS), "existing": 0, "built": 0, "failed": [], "building": None, "done": False},
+    "seed": "pending",
+    "db_reachable": None,
+    "db_checked_at": 0.0
+}
+
+def index_name(keys) -> str:
+    # Same naming scheme as pymongo's create_index default
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def reconcile_indexes(database_name: str, progress: dict):
+    """Build missing indexes in one physical database, then drop the pre-tenancy index each
+    tenant-prefixed one replaces (a global unique email index would block other tenants)"""
+    existing_by_collection = {}
+    for collection_name, keys, options in INDEX_SPECS:
+        collection = client[database_name][collection_name]
+        if collection_name not in existing_by_collection:
+            existing_by_collection[collection_name] = set(await collection.index_information())
+        existing = existing_by_collection[collection_name]
+        name = index_name(keys)
+        if name in existing:
+            progress["existing"] += 1
+        else:
+            progress["building"] = f"{database_name}.{collection_name}.{name}"
+            try:
+                await collection.create_index(keys, **options)
+                existing.add(name)
+                progress["built"] += 1
+            except Exception as e:
+                progress["failed"].append({"index": f"{database_name}.{collection_name}.{name}", "error": str(e)})
+                print(f"Index build failed for {database_name}.{collection_name}.{name}: {e}")
+                continue
+        legacy = index_name(keys[1:]) if keys[0][0] == "tenant_id" else None
+        if legacy in existing and not any(c == collection_name and index_name(k) == legacy for c, k, _ in INDEX_SPECS):
+            await collection.drop_index(legacy)
+            existing.discard(legacy)
+    progress["building"] = None
+
+def tenant_databases() -> list:
+    return sorted({tenant["database"] for tenant in tenant_registry.values()})
+
+async def assign_legacy_tenant():
+    """Documents written before tenancy belong to the default tenant. Runs once; the default
+    tenant's registry entry records that it has."""
+    registry_entry = await control_db.tenants.find_one({"_id": DEFAULT_TENANT})
+    if registry_entry and registry_entry.get("legacy_assigned_at"):
+        return
+    for collection_name in await control_db.list_collection_names():
+        if collection_name != "tenants" and not collection_name.startswith("system."):
+            await control_db[collection_name].update_many({"tenant_id": {"$exists": False}}, {"$set": {"tenant_id": DEFAULT_TENANT}})
+    await control_db.tenants.update_one(
+        {"_id": DEFAULT_TENANT},
+        {"$set": {"legacy_assigned_at": datetime.utcnow()}, "$setOnInsert": {k: v for k, v in tenant_registry[DEFAULT_TENANT].items() if k != "_id"}},
+        upsert=True
+    )
+
+async def ensure_default_ceo():
+    # ONLY create default CEO - no other mock users. The bcrypt hash is only paid for on a fresh database.
+    existing_ceo = await db.users.find_one({"email": "ceo@arc.com"}, {"_id": 1})
+    if existing_ceo:
+        return
+    ceo_user = {
+        "id": str(uuid.uuid4()),
+        "email": "ceo@arc.com",
+        "password": get_password_hash("admin123"),
+        "name": "CEO Administrator",
+        "role": "ceo",
+        "department": "Executive",
+        "is_active": True,
+        "is_approved": True,
+        "created_at": datetime.utcnow(),
+        "avatar": f"https://ui-avatars.com/api/?name=CEO&background=B22222&color=fff&bold=true"
+    }
+    result = await db.users.update_one({"email": "ceo@arc.com"}, {"$setOnInsert": ceo_user}, upsert=True)
+    if result.upserted_id:
         print("Default CEO created: ceo@arc.com / admin123")
 
+async def initialize_database():
+    """Index reconciliation and seeding, run after the worker is already accepting traffic"""
+    progress = startup_state["indexes"]
+    while True:
+        try:
+            await refresh_tenants()
+            await assign_legacy_tenant()
+            databases = tenant_databases()
+            progress["total"] = len(INDEX_SPECS) * len(databases)
+            for database_name in databases:
+                await reconcile_indexes(database_name, progress)
+            progress["done"] = True
+            break
+        except Exception as e:
+            # Mongo not up yet; keep retrying without blocking boot
+            print(f"Index reconciliation deferred: {e}")
+            progress.update({"existing": 0, "built": 0, "failed": [], "building": None})
+            await asyncio.sleep(2)
+    try:
+        startup_state["seed"] = "running"
+        with tenant_context(DEFAULT_TENANT):
+            await ensure_default_ceo()
+        startup_state["seed"] = "done"
+    except Exception as e:
+        startup_state["seed"] = "failed"
+        print(f"Default CEO seed failed: {e}")
+    for tenant_id in active_tenants():
+        with tenant_context(tenant_id):
+            try:
+                await backfill_task_summaries()
+            except Exception as e:
+                print(f"Task summary backfill failed for tenant {tenant_id}: {e}")
+            try:
+                await backfill_comment_counters()
+            except Exception as e:
+                print(f"Comment counter backfill failed for tenant {tenant_id}: {e}")
+            try:
+                await backfill_task_schedules()
+            except Exception as e:
+                print(f"Task schedule backfill failed for tenant {tenant_id}: {e}")
+
+async def check_db_reachable() -> bool:
+    if time.monotonic() - startup_state["db_checked_at"] < READINESS_CACHE_SECONDS and startup_state["db_reachable"] is not None:
+        return startup_state["db_reachable"]
+    try:
+        with db_timeout(1):
+            await client.admin.command("ping")
+        startup_state["db_reachable"] = True
+    except Exception:
+        startup_state["db_reachable"] = False
+    startup_state["db_checked_at"] = time.monotonic()
+    return startup_state["db_reachable"]
+
+# How long shutdown waits for queued background writes after in-flight requests finish
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get("SHUTDOWN_DRAIN_SECONDS", "10"))
+
+@app.on_event("startup")
+async def startup_db_client():
+    start_background(initialize_database())
+    start_background(tenant_refresher())
+    if STATELESS_AUTH:
+        start_background(token_version_refresher())
+    start_background(tombstone_reaper())
+    start_background(summary_fanout_worker())
+    start_background(overdue_scheduler())
+    start_background(migration_runner())
+    for _ in range(REPORT_WORKERS):
+        start_background(report_worker())
+    if CONSISTENCY_SCAN_INTERVAL_SECONDS > 0:
+        start_background(consistency_scanner())
+
+async def drain_background_work():
+    """Flush queued summary fan-outs, then stop the periodic loops. Leased schedulers and
+    migrations interrupted here resume on the next worker once their lease lapses."""
+    try:
+        await asyncio.wait_for(summary_fanout_queue.join(), SHUTDOWN_DRAIN_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Shutdown drain timed out with {len(summary_fanout_pending)} summary fan-outs pending")
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    await drain_background_work()
+    client.close()
+    analytics_client.close()
+
 # ==================== API ROUTES ====================
 
-@app.get("/api/health")
-async def health_check():
-    return {"status": "healthy", "service": "ARC Project Management", "version": "2.0.0"}
+@app.get("/api/health")
+async def health_check():
+    return {
+        "status": "healthy",
+        "service": "ARC Project Management",
+        "version": "2.0.0",
+        "ready": await check_db_reachable(),
+        "startup": {
+            "uptime_seconds": round((datetime.utcnow() - startup_state["started_at"]).total_seconds(), 1),
+            "indexes": startup_state["indexes"],
+            "seed": startup_state["seed"]
+        }
+    }
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """The process and event loop are responsive; never touches the database"""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Mongo is reachable so requests can be served; index builds may still be running"""
+    ready = await check_db_reachable()
+    body = {"status": "ready" if ready else "not_ready", "indexes_done": startup_state["indexes"]["done"]}
+    if not ready:
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "1"})
+    return body
 
 # ==================== AUTH ROUTES ====================
 
-@app.post("/api/auth/signup")
+@app.post("/api/auth/signup", dependencies=[Depends(rate_limit_by_ip("signup"))])
 async def signup(user_data: UserSignup):
     """Anyone can sign up - they become workers pending CEO approval"""
     existing = await db.users.find_one({"email": user_data.email.lower()})
@@ -227,7 +2330,7 @@ async def signup(user_data: UserSignup):
     }
     await db.users.insert_one(user)
     
-    token = create_access_token({"sub": user_id})
+    token = create_access_token(token_claims(user))
     return {
         "access_token": token,
         "token_type": "bearer",
@@ -241,16 +2344,21 @@ async def signup(user_data: UserSignup):
         "message": "Account created! You can now log in."
     }
 
-@app.post("/api/auth/login")
-async def login(credentials: UserLogin):
+@app.post("/api/auth/login", dependencies=[Depends(rate_limit_by_ip("login_ip"))])
+async def login(credentials: UserLogin, request: Request):
+    # Failed attempts per (IP, account) on top of the per-IP bucket: guessing one account's
+    # password is throttled, but nobody elsewhere can lock its owner out with bad passwords
+    attempts_key = f"{current_tenant.get()}:{client_ip(request)}:{credentials.email.lower()}"
+    await check_rate_limit("login_account", attempts_key)
     user = await db.users.find_one({"email": credentials.email.lower()})
     if not user or not verify_password(credentials.password, user["password"]):
+        await charge_rate_limit("login_account", attempts_key)
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     if not user.get("is_active", True):
         raise HTTPException(status_code=403, detail="Account is deactivated. Contact your administrator.")
     
-    token = create_access_token({"sub": user["id"]})
+    token = create_access_token(token_claims(user))
     return {
         "access_token": token,
         "token_type": "bearer",
@@ -266,6 +2374,11 @@ async def login(credentials: UserLogin):
 
 @app.get("/api/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
+    if current_user.get("from_token"):
+        current_user = await db.users.find_one({"id": current_user["id"]})
+        if current_user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+    
     total_tasks = await db.tasks.count_documents({"assigned_to": current_user["id"]})
     completed_tasks = await db.tasks.count_documents({"assigned_to": current_user["id"], "status": "done"})
     
@@ -288,13 +2401,31 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 # ==================== USER MANAGEMENT ====================
 
-@app.get("/api/users")
+@app.get("/api/users", dependencies=[Depends(heavy_route)])
 async def get_users(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] not in USER_STATS_ROLES:
+        # Directory view only: no contact details, no per-user task aggregation
+        return await db.users.find({"is_active": True}, {"_id": 0, "id": 1, "name": 1, "role": 1, "department": 1, "avatar": 1}).sort("name", 1).to_list(None)
+    
+    # One grouped aggregation for every user's task stats instead of three counts per user
+    stats = {
+        row["_id"]: row
+        async for row in db.tasks.aggregate([
+            {"$match": {"assigned_to": {"$ne": None}}},
+            {"$group": {
+                "_id": "$assigned_to",
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": [{"$eq": ["$status", "done"]}, 1, 0]}},
+                "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", "in_progress"]}, 1, 0]}}
+            }}
+        ])
+    }
+    
     users = []
-    async for user in db.users.find({}):
-        total_tasks = await db.tasks.count_documents({"assigned_to": user["id"]})
-        completed_tasks = await db.tasks.count_documents({"assigned_to": user["id"], "status": "done"})
-        in_progress = await db.tasks.count_documents({"assigned_to": user["id"], "status": "in_progress"})
+    async for user in db.users.find({}, {"password": 0}):
+        user_stats = stats.get(user["id"], {})
+        total_tasks = user_stats.get("total", 0)
+        completed_tasks = user_stats.get("completed", 0)
         
         users.append({
             "id": user["id"],
@@ -309,7 +2440,7 @@ async def get_users(current_user: dict = Depends(get_current_user)):
             "stats": {
                 "total_tasks": total_tasks,
                 "completed_tasks": completed_tasks,
-                "in_progress": in_progress,
+                "in_progress": user_stats.get("in_progress", 0),
                 "completion_rate": round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
             }
         })
@@ -332,6 +2463,8 @@ async def assign_role(user_id: str, assignment: RoleAssignment, current_user: di
     new_avatar = f"https://ui-avatars.com/api/?name={user['name'].replace(' ', '+')}&background={avatar_colors[assignment.new_role]}&color=fff"
     
     await db.users.update_one({"id": user_id}, {"$set": {"role": assignment.new_role, "avatar": new_avatar}})
+    await bump_token_version(user_id)
+    enqueue_summary_fanout("user", user_id)
     
     await db.activities.insert_one({
         "id": str(uuid.uuid4()),
@@ -357,22 +2490,41 @@ async def toggle_user_status(user_id: str, current_user: dict = Depends(get_curr
     
     new_status = not user.get("is_active", True)
     await db.users.update_one({"id": user_id}, {"$set": {"is_active": new_status}})
+    await bump_token_version(user_id)
     return {"id": user_id, "is_active": new_status}
 
 # ==================== CONTRACT ROUTES ====================
 
+async def contract_task_stats(database, contract_ids: list) -> dict:
+    """Task totals per contract id from one grouped aggregation"""
+    return {
+        row["_id"]: row
+        async for row in database.tasks.aggregate([
+            {"$match": {"contract_id": {"$in": contract_ids}}},
+            {"$group": {
+                "_id": "$contract_id",
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": [{"$eq": ["$status", "done"]}, 1, 0]}},
+                "overdue": {"$sum": {"$cond": [{"$eq": ["$is_overdue", True]}, 1, 0]}}
+            }}
+        ])
+    }
+
 @app.get("/api/contracts")
 async def get_contracts(current_user: dict = Depends(get_current_user)):
-    contracts = []
-    async for contract in db.contracts.find({}).sort("created_at", -1):
+    contracts = await db.contracts.find(contract_scope(current_user), contract_projection(current_user["role"])).sort("created_at", -1).to_list(None)
+    
+    task_stats = await contract_task_stats(db, [contract["id"] for contract in contracts])
+    
+    for contract in contracts:
         contract["project_status"] = calculate_contract_status(
             contract.get("project_start_date"),
             contract.get("project_end_date"),
             contract.get("manual_status")
         )
         
-        total_tasks = await db.tasks.count_documents({"contract_id": contract["id"]})
-        completed_tasks = await db.tasks.count_documents({"contract_id": contract["id"], "status": "done"})
+        total_tasks = task_stats.get(contract["id"], {}).get("total", 0)
+        completed_tasks = task_stats.get(contract["id"], {}).get("completed", 0)
         
         contract["_id"] = str(contract["_id"])
         contract["task_stats"] = {
@@ -380,17 +2532,24 @@ async def get_contracts(current_user: dict = Depends(get_current_user)):
             "completed": completed_tasks,
             "progress": round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
         }
-        contracts.append(contract)
     return contracts
 
-@app.post("/api/contracts")
-async def create_contract(contract_data: ContractCreate, current_user: dict = Depends(get_current_user)):
-    """CEO creates contracts with client details"""
-    if current_user["role"] != "ceo":
-        raise HTTPException(status_code=403, detail="Only CEO can create contracts")
-    
+async def next_contract_sequence() -> int:
+    """Per-tenant contract counter; seeded from the existing contract count the first time,
+    which is what numbers were derived from before the counter existed"""
+    key = tenant_key("contract_number")
+    counter = await db.counters.find_one_and_update({"_id": key}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+    if counter is None:
+        try:
+            await db.counters.insert_one({"_id": key, "seq": await db.contracts.count_documents({})})
+        except DuplicateKeyError:
+            pass
+        counter = await db.counters.find_one_and_update({"_id": key}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+    return counter["seq"]
+
+async def insert_contract(contract_data: ContractCreate, current_user: dict):
     year = datetime.now().year
-    count = await db.contracts.count_documents({}) + 1
+    count = await next_contract_sequence()
     contract_number = f"ARC-{year}-{str(count).zfill(4)}"
     
     contract_id = str(uuid.uuid4())
@@ -412,8 +2571,8 @@ async def create_contract(contract_data: ContractCreate, current_user: dict = De
         "actual_profit": contract_data.contract_value,
         "profit_status": "green",
         "project_status": "Pending",
-        "project_start_date": contract_data.start_date,
-        "project_end_date": contract_data.end_date,
+        "project_start_date": parse_datetime(contract_data.start_date),
+        "project_end_date": parse_datetime(contract_data.end_date),
         "duration_type": "Non-Recurring",
         "manual_status": None,
         "inactive_reason": None,
@@ -422,9 +2581,11 @@ async def create_contract(contract_data: ContractCreate, current_user: dict = De
         "created_by_name": current_user["name"],
         "finance_allocated": False,
         "operations_configured": False,
+        "schema_version": SCHEMA_VERSIONS["contracts"],
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
+    contract.update(contract_risk(contract, {}))
     await db.contracts.insert_one(contract)
     
     await db.activities.insert_one({
@@ -435,11 +2596,52 @@ async def create_contract(contract_data: ContractCreate, current_user: dict = De
         "entity_type": "contract",
         "entity_id": contract_id,
         "entity_name": f"{contract_number} - {contract_data.client_name}",
+        "contract_id": contract_id,
         "created_at": datetime.utcnow()
     })
     
     return {"id": contract_id, "contract_number": contract_number, "message": "Contract created successfully"}
 
+@app.post("/api/contracts")
+async def create_contract(contract_data: ContractCreate, response: Response, idempotency_key: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """CEO creates contracts with client details"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can create contracts")
+    
+    return await run_idempotent(idempotency_key, "create_contract", contract_data, current_user, response,
+                                lambda: insert_contract(contract_data, current_user))
+
+@app.put("/api/contracts/{contract_id}")
+async def update_contract(contract_id: str, updates: ContractUpdate, current_user: dict = Depends(get_current_user)):
+    """CEO edits client and project details"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can edit contracts")
+    
+    contract = await db.contracts.find_one({"id": contract_id})
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    
+    update_data = {k: v for k, v in updates.dict().items() if v is not None}
+    update_data["updated_at"] = datetime.utcnow()
+    await db.contracts.update_one({"id": contract_id}, {"$set": update_data})
+    
+    if update_data.get("project_name", contract.get("project_name")) != contract.get("project_name"):
+        enqueue_summary_fanout("contract", contract_id)
+    
+    await db.activities.insert_one({
+        "id": str(uuid.uuid4()),
+        "user_id": current_user["id"],
+        "user_name": current_user["name"],
+        "action": "updated contract",
+        "entity_type": "contract",
+        "entity_id": contract_id,
+        "entity_name": contract["contract_number"],
+        "contract_id": contract_id,
+        "created_at": datetime.utcnow()
+    })
+    
+    return {"message": "Contract updated successfully"}
+
 @app.put("/api/contracts/{contract_id}/finance")
 async def allocate_finance(contract_id: str, finance_data: FinanceAllocation, current_user: dict = Depends(get_current_user)):
     """Finance Officer allocates costs"""
@@ -474,6 +2676,7 @@ async def allocate_finance(contract_id: str, finance_data: FinanceAllocation, cu
         "finance_officer_name": current_user["name"],
         "updated_at": datetime.utcnow()
     }})
+    enqueue_risk_refresh(contract_id)
     
     await db.activities.insert_one({
         "id": str(uuid.uuid4()),
@@ -483,6 +2686,7 @@ async def allocate_finance(contract_id: str, finance_data: FinanceAllocation, cu
         "entity_type": "contract",
         "entity_id": contract_id,
         "entity_name": contract["contract_number"],
+        "contract_id": contract_id,
         "created_at": datetime.utcnow()
     })
     
@@ -505,8 +2709,8 @@ async def update_operations(contract_id: str, ops_data: OperationsSetup, current
     )
     
     await db.contracts.update_one({"id": contract_id}, {"$set": {
-        "project_start_date": ops_data.project_start_date,
-        "project_end_date": ops_data.project_end_date,
+        "project_start_date": parse_datetime(ops_data.project_start_date),
+        "project_end_date": parse_datetime(ops_data.project_end_date),
         "duration_type": ops_data.duration_type,
         "manual_status": ops_data.manual_status,
         "inactive_reason": ops_data.inactive_reason if ops_data.manual_status == "inactive" else None,
@@ -516,6 +2720,7 @@ async def update_operations(contract_id: str, ops_data: OperationsSetup, current
         "operations_officer_name": current_user["name"],
         "updated_at": datetime.utcnow()
     }})
+    enqueue_risk_refresh(contract_id)
     
     await db.activities.insert_one({
         "id": str(uuid.uuid4()),
@@ -525,17 +2730,13 @@ async def update_operations(contract_id: str, ops_data: OperationsSetup, current
         "entity_type": "contract",
         "entity_id": contract_id,
         "entity_name": contract["contract_number"],
+        "contract_id": contract_id,
         "created_at": datetime.utcnow()
     })
     
     return {"message": "Operations configuration saved", "project_status": project_status}
 
-@app.post("/api/contracts/{contract_id}/assign-staff")
-async def assign_staff_to_contract(contract_id: str, assignment: StaffAssignment, current_user: dict = Depends(get_current_user)):
-    """Assign a worker to a contract"""
-    if current_user["role"] not in ["ceo", "operations"]:
-        raise HTTPException(status_code=403, detail="Only CEO or Operations can assign staff")
-    
+async def push_staff_assignment(contract_id: str, assignment: StaffAssignment):
     contract = await db.contracts.find_one({"id": contract_id})
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
@@ -558,6 +2759,153 @@ async def assign_staff_to_contract(contract_id: str, assignment: StaffAssignment
     
     return {"message": "Staff assigned successfully", "staff": staff_entry}
 
+@app.post("/api/contracts/{contract_id}/assign-staff")
+async def assign_staff_to_contract(contract_id: str, assignment: StaffAssignment, response: Response, idempotency_key: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """Assign a worker to a contract"""
+    if current_user["role"] not in ["ceo", "operations"]:
+        raise HTTPException(status_code=403, detail="Only CEO or Operations can assign staff")
+    
+    return await run_idempotent(idempotency_key, "assign_staff", {"contract_id": contract_id, **assignment.dict()}, current_user, response,
+                                lambda: push_staff_assignment(contract_id, assignment))
+
+@app.get("/api/contracts/{contract_id}/dashboard", dependencies=[Depends(heavy_route)])
+async def get_contract_dashboard(contract_id: str, activity_limit: int = 20, current_user: dict = Depends(get_current_user)):
+    """Everything the contract page needs in one round-trip: the contract, its profit
+    breakdown, task counts and recent activity. The contract is checked first, then the
+    task counts and activity are fetched concurrently"""
+    activity_limit = max(1, min(activity_limit, 100))
+    now = datetime.utcnow()
+    task_pipeline = [
+        {"$match": {"contract_id": contract_id}},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_priority": [{"$group": {"_id": "$priority", "count": {"$sum": 1}}}],
+            "overdue": [{"$match": {"is_overdue": True}}, {"$count": "count"}],
+            "upcoming": [
+                {"$match": {"due_date": {"$gte": now}, "status": {"$ne": "done"}}},
+                {"$sort": {"due_date": 1}},
+                {"$limit": 5},
+                {"$project": {"_id": 0, "id": 1, "title": 1, "status": 1, "priority": 1, "assigned_to": 1, "due_date": 1}}
+            ]
+        }}
+    ]
+    activity_query = build_activity_filter(contract_id, None, None, None)
+    
+    # Authorize before starting the task aggregation and activity scan
+    contract = await db.contracts.find_one({"id": contract_id}, {"_id": 0})
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    is_worker = current_user["role"] == "worker"
+    if is_worker and not any(staff["user_id"] == current_user["id"] for staff in contract.get("staff_list", [])):
+        raise HTTPException(status_code=403, detail="You are not staffed on this contract")
+    
+    task_facets, activities = await asyncio.gather(
+        db.tasks.aggregate(task_pipeline).to_list(1),
+        db.activities.find(activity_query, {"_id": 0}).sort([("created_at", -1), ("id", -1)]).to_list(activity_limit)
+    )
+    
+    contract["project_status"] = calculate_contract_status(
+        contract.get("project_start_date"),
+        contract.get("project_end_date"),
+        contract.get("manual_status")
+    )
+    staff_list = contract.pop("staff_list", [])
+    
+    costs = {key: contract.get(key, 0) or 0 for key in ["staff_cost", "commission", "tax", "admin_fee", "overhead_cost"]}
+    target_profit, actual_profit, profit_status = calculate_profits(contract["contract_value"], **costs)
+    
+    facets = task_facets[0] if task_facets else {}
+    by_status = {"todo": 0, "in_progress": 0, "done": 0}
+    by_status.update({row["_id"]: row["count"] for row in facets.get("by_status", []) if row["_id"]})
+    total_tasks = sum(by_status.values())
+    
+    dashboard = {
+        "contract": contract,
+        "profit": {
+            "contract_value": contract["contract_value"],
+            "costs": costs,
+            "total_costs": sum(costs.values()),
+            "target_profit": target_profit,
+            "actual_profit": actual_profit,
+            "profit_status": profit_status,
+            "margin": round((actual_profit / contract["contract_value"] * 100) if contract["contract_value"] else 0, 1)
+        },
+        "tasks": {
+            "total": total_tasks,
+            "by_status": by_status,
+            "by_priority": {row["_id"]: row["count"] for row in facets.get("by_priority", []) if row["_id"]},
+            "overdue": facets["overdue"][0]["count"] if facets.get("overdue") else 0,
+            "progress": round((by_status["done"] / total_tasks * 100) if total_tasks > 0 else 0, 1),
+            "upcoming": facets.get("upcoming", [])
+        },
+        "staff": {
+            "count": len(staff_list),
+            "total_payments": sum(staff.get("payment_amount", 0) or 0 for staff in staff_list),
+            "list": staff_list
+        },
+        "recent_activities": activities
+    }
+    if current_user["role"] in ["worker", "operations"]:
+        for field in OPERATIONS_CONTRACT_PROJECTION:
+            contract.pop(field, None)
+        dashboard["profit"].pop("costs")
+        dashboard["profit"].pop("total_costs")
+        for staff in staff_list:
+            staff.pop("payment_amount", None)
+        dashboard["staff"].pop("total_payments")
+    if is_worker:
+        dashboard["contract"] = {k: v for k, v in contract.items() if k in WORKER_CONTRACT_PROJECTION or k == "project_status"}
+        dashboard.pop("profit")
+    return dashboard
+
+@app.get("/api/contracts/{contract_id}/critical-path")
+async def get_critical_path(contract_id: str, max_slack_days: float = 0, limit: int = 200, current_user: dict = Depends(get_current_user)):
+    """Tasks that set the contract's projected end (or come within max_slack_days of it),
+    read off the stored schedule rather than recomputed"""
+    contract = await db.contracts.find_one({"id": contract_id, **contract_scope(current_user)}, {"_id": 0, "id": 1, "project_end_date": 1})
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    
+    # Walk the (contract_id, path_end) index down from the projected end and stop at the slack cutoff
+    tasks = await db.tasks.find(
+        {"contract_id": contract_id, "path_end": {"$ne": None}},
+        {"_id": 0, "id": 1, "title": 1, "status": 1, "assigned_user": 1, "due_date": 1, "depends_on": 1,
+         "duration_days": 1, "forecast_finish": 1, "path_end": 1, "is_overdue": 1}
+    ).sort("path_end", -1).limit(max(1, min(limit, 1000))).to_list(None)
+    if not tasks:
+        return {"contract_id": contract_id, "project_end_date": contract.get("project_end_date"), "projected_end": None, "delay_days": None, "tasks": []}
+    projected_end = tasks[0]["path_end"]
+    cutoff = projected_end - timedelta(days=max(0.0, max_slack_days)) - CRITICAL_PATH_TOLERANCE
+    tasks = [task for task in tasks if task["path_end"] >= cutoff]
+    for task in tasks:
+        task["slack_days"] = round((projected_end - task.pop("path_end")).total_seconds() / 86400, 3)
+    tasks.sort(key=lambda task: task["forecast_finish"])
+    
+    end = parse_datetime(contract.get("project_end_date"))
+    return {
+        "contract_id": contract_id,
+        "project_end_date": contract.get("project_end_date"),
+        "projected_end": projected_end,
+        # Positive when the critical path runs past the planned end date
+        "delay_days": round((projected_end - end).total_seconds() / 86400, 3) if end else None,
+        "tasks": tasks
+    }
+
+@app.delete("/api/contracts/{contract_id}")
+async def delete_contract(contract_id: str, current_user: dict = Depends(get_current_user)):
+    """CEO deletes a contract; its tasks, comments and activities are removed in the background"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can delete contracts")
+    
+    contract = await db.contracts.find_one({"id": contract_id})
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    
+    await create_tombstone("contract", contract_id, contract, current_user)
+    await db.contracts.delete_one({"id": contract_id})
+    
+    return {"message": "Contract deleted successfully"}
+
 # ==================== TASK ROUTES ====================
 
 @app.get("/api/tasks")
@@ -567,48 +2915,58 @@ async def get_tasks(contract_id: Optional[str] = None, assigned_to: Optional[str
         query["contract_id"] = contract_id
     if assigned_to:
         query["assigned_to"] = assigned_to
+    if current_user["role"] == "worker":
+        if assigned_to and assigned_to != current_user["id"]:
+            return []
+        query["assigned_to"] = current_user["id"]
     if status:
         query["status"] = status
     
     tasks = []
     async for task in db.tasks.find(query).sort("created_at", -1):
         task["_id"] = str(task["_id"])
-        
-        if task.get("assigned_to"):
-            user = await db.users.find_one({"id": task["assigned_to"]})
-            if user:
-                task["assigned_user"] = {"id": user["id"], "name": user["name"], "avatar": user.get("avatar")}
-        
-        contract = await db.contracts.find_one({"id": task["contract_id"]})
-        if contract:
-            task["contract_number"] = contract["contract_number"]
-            task["project_name"] = contract.get("project_name")
-        
-        task["comment_count"] = await db.comments.count_documents({"task_id": task["id"]})
+        if "comment_count" not in task:
+            # Not yet backfilled
+            task["comment_count"] = await db.comments.count_documents({"task_id": task["id"]})
         tasks.append(task)
+    await attach_missing_task_summaries(tasks)
     return tasks
 
-@app.post("/api/tasks")
-async def create_task(task_data: TaskCreate, current_user: dict = Depends(get_current_user)):
+async def insert_task(task_data: TaskCreate, current_user: dict):
     contract = await db.contracts.find_one({"id": task_data.contract_id})
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
     
+    assignee = await db.users.find_one({"id": task_data.assigned_to}) if task_data.assigned_to else None
+    # A new task has no dependents yet, so its dependencies can't close a cycle
+    depends_on = await validate_dependencies(None, task_data.contract_id, task_data.depends_on)
+    
     task_id = str(uuid.uuid4())
     task = {
         "id": task_id,
         "title": task_data.title,
         "description": task_data.description,
         "contract_id": task_data.contract_id,
+        **contract_summary(contract),
         "assigned_to": task_data.assigned_to,
+        "assigned_user": user_summary(assignee),
         "priority": task_data.priority,
         "status": "todo",
-        "due_date": task_data.due_date,
+        "due_date": parse_datetime(task_data.due_date),
+        "depends_on": depends_on,
+        "duration_days": task_data.duration_days,
+        "comment_count": 0,
+        "is_overdue": task_is_overdue(task_data.due_date, "todo"),
+        "schema_version": SCHEMA_VERSIONS["tasks"],
         "created_by": current_user["id"],
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
     await db.tasks.insert_one(task)
+    enqueue_risk_refresh(task_data.contract_id)
+    await recompute_forecasts([task_id])
+    if depends_on:
+        await recompute_tails(depends_on)
     
     await db.activities.insert_one({
         "id": str(uuid.uuid4()),
@@ -624,6 +2982,11 @@ async def create_task(task_data: TaskCreate, current_user: dict = Depends(get_cu
     
     return {"id": task_id, "message": "Task created successfully"}
 
+@app.post("/api/tasks")
+async def create_task(task_data: TaskCreate, response: Response, idempotency_key: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    return await run_idempotent(idempotency_key, "create_task", task_data, current_user, response,
+                                lambda: insert_task(task_data, current_user))
+
 @app.put("/api/tasks/{task_id}")
 async def update_task(task_id: str, updates: TaskUpdate, current_user: dict = Depends(get_current_user)):
     task = await db.tasks.find_one({"id": task_id})
@@ -632,6 +2995,8 @@ async def update_task(task_id: str, updates: TaskUpdate, current_user: dict = De
     
     update_data = {k: v for k, v in updates.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
+    if "due_date" in update_data:
+        update_data["due_date"] = parse_datetime(update_data["due_date"])
     
     old_status = task.get("status")
     new_status = update_data.get("status")
@@ -639,7 +3004,27 @@ async def update_task(task_id: str, updates: TaskUpdate, current_user: dict = De
     if new_status == "done" and old_status != "done":
         update_data["completed_at"] = datetime.utcnow()
     
+    if "status" in update_data or "due_date" in update_data:
+        update_data["is_overdue"] = task_is_overdue(update_data.get("due_date", task.get("due_date")), update_data.get("status", old_status))
+        if not update_data["is_overdue"]:
+            update_data["overdue_since"] = None
+    
+    if "assigned_to" in update_data and update_data["assigned_to"] != task.get("assigned_to"):
+        update_data["assigned_user"] = user_summary(await db.users.find_one({"id": update_data["assigned_to"]}))
+    
+    old_depends_on = task.get("depends_on", [])
+    if "depends_on" in update_data:
+        update_data["depends_on"] = await validate_dependencies(task_id, task["contract_id"], update_data["depends_on"])
+    
     await db.tasks.update_one({"id": task_id}, {"$set": update_data})
+    if "is_overdue" in update_data:
+        enqueue_risk_refresh(task["contract_id"])
+    
+    # Dependencies and durations change tail_days upstream; everything here moves forecasts downstream
+    if "depends_on" in update_data or "duration_days" in update_data:
+        await recompute_tails(list({*old_depends_on, *update_data.get("depends_on", old_depends_on)}))
+    if {"status", "due_date", "depends_on", "duration_days"} & update_data.keys():
+        await recompute_forecasts([task_id])
     
     action = "updated task"
     if new_status and new_status != old_status:
@@ -665,22 +3050,112 @@ async def delete_task(task_id: str, current_user: dict = Depends(get_current_use
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    await create_tombstone("task", task_id, task, current_user)
     await db.tasks.delete_one({"id": task_id})
-    await db.comments.delete_many({"task_id": task_id})
+    enqueue_risk_refresh(task["contract_id"])
+    
+    dependents = [dependent["id"] async for dependent in db.tasks.find({"depends_on": task_id}, {"id": 1})]
+    if dependents:
+        await db.tasks.update_many({"depends_on": task_id}, {"$pull": {"depends_on": task_id}})
+        await recompute_forecasts(dependents)
+    if task.get("depends_on"):
+        await recompute_tails(task["depends_on"])
     
     return {"message": "Task deleted successfully"}
 
 # ==================== COMMENT ROUTES ====================
 
+def encode_cursor(doc: dict) -> str:
+    """Opaque keyset cursor over (created_at, id)"""
+    raw = json.dumps({"t": doc["created_at"].isoformat(), "id": doc["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(raw["t"]), raw["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(cursor: str, older: bool) -> dict:
+    cursor_time, cursor_id = decode_cursor(cursor)
+    op, op_inclusive = ("$lt", "$lte") if older else ("$gt", "$gte")
+    # The inclusive bound on created_at gives the planner a tight index range;
+    # the $or only breaks ties between documents sharing a timestamp.
+    return {
+        "created_at": {op_inclusive: cursor_time},
+        "$or": [{"created_at": {op: cursor_time}}, {"id": {op: cursor_id}}]
+    }
+
+async def refresh_last_comment_at(task_id: str):
+    latest = await db.comments.find({"task_id": task_id}, {"created_at": 1}).sort([("created_at", -1), ("id", -1)]).to_list(1)
+    await db.tasks.update_one({"id": task_id}, {"$set": {"last_comment_at": latest[0]["created_at"] if latest else None}})
+
+async def recount_comment_counter(task_id: str):
+    """Set comment_count on a legacy task that has none yet, counting after the caller's write"""
+    latest = await db.comments.find({"task_id": task_id}, {"created_at": 1}).sort([("created_at", -1), ("id", -1)]).to_list(1)
+    await db.tasks.update_one({"id": task_id, "comment_count": {"$exists": False}}, {"$set": {
+        "comment_count": await db.comments.count_documents({"task_id": task_id}),
+        "last_comment_at": latest[0]["created_at"] if latest else None
+    }}, stamp=False)
+
+async def backfill_comment_counters():
+    """One-off migration: tasks created before comment_count was maintained on write"""
+    while True:
+        tasks = await db.tasks.find({"comment_count": {"$exists": False}}, {"_id": 1, "id": 1}).to_list(SUMMARY_FANOUT_BATCH_SIZE)
+        if not tasks:
+            return
+        counts = {
+            row["_id"]: row
+            async for row in db.comments.aggregate([
+                {"$match": {"task_id": {"$in": [task["id"] for task in tasks]}}},
+                {"$group": {"_id": "$task_id", "count": {"$sum": 1}, "last": {"$max": "$created_at"}}}
+            ])
+        }
+        await db.tasks.bulk_write([
+            UpdateOne({"_id": task["_id"], "comment_count": {"$exists": False}}, {"$set": {
+                "comment_count": counts.get(task["id"], {}).get("count", 0),
+                "last_comment_at": counts.get(task["id"], {}).get("last")
+            }})
+            for task in tasks
+        ], ordered=False, stamp=False)
+        await asyncio.sleep(REAPER_BATCH_PAUSE_SECONDS)
+
 @app.get("/api/tasks/{task_id}/comments")
-async def get_comments(task_id: str, current_user: dict = Depends(get_current_user)):
-    comments = []
-    async for comment in db.comments.find({"task_id": task_id}).sort("created_at", 1):
+async def get_comments(task_id: str, response: Response, limit: int = 100, before: Optional[str] = None, after: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """A window of comments in chronological order. Without a cursor this is the newest
+    `limit` comments; X-Prev-Cursor (as `before`) loads the older window, X-Next-Cursor
+    (as `after`) the newer one."""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    limit = max(1, min(limit, 500))
+    
+    query = {"task_id": task_id}
+    if before or after:
+        query.update(keyset_filter(before or after, older=bool(before)))
+    sort_dir = 1 if after else -1
+    
+    comments = await db.comments.find(query).sort([("created_at", sort_dir), ("id", sort_dir)]).to_list(limit + 1)
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+    if not after:
+        comments.reverse()
+    
+    # Resolve all authors in the window with one query
+    user_ids = list({comment["user_id"] for comment in comments})
+    users = {user["id"]: user_summary(user) async for user in db.users.find({"id": {"$in": user_ids}}, {"id": 1, "name": 1, "avatar": 1})}
+    for comment in comments:
         comment["_id"] = str(comment["_id"])
-        user = await db.users.find_one({"id": comment["user_id"]})
-        if user:
-            comment["user"] = {"id": user["id"], "name": user["name"], "avatar": user.get("avatar")}
-        comments.append(comment)
+        if comment["user_id"] in users:
+            comment["user"] = users[comment["user_id"]]
+    
+    if comments:
+        older_exists = has_more if not after else True
+        newer_exists = has_more if after else bool(before)
+        if older_exists:
+            response.headers["X-Prev-Cursor"] = encode_cursor(comments[0])
+        if newer_exists:
+            response.headers["X-Next-Cursor"] = encode_cursor(comments[-1])
     return comments
 
 @app.post("/api/tasks/{task_id}/comments")
@@ -698,74 +3173,335 @@ async def add_comment(task_id: str, comment_data: CommentCreate, current_user: d
         "created_at": datetime.utcnow()
     }
     await db.comments.insert_one(comment)
+    # Only $inc a counter that exists: on a legacy task it would start at 1 and the backfill would skip it
+    result = await db.tasks.update_one({"id": task_id, "comment_count": {"$exists": True}}, {"$inc": {"comment_count": 1}, "$max": {"last_comment_at": comment["created_at"]}})
+    if not result.matched_count:
+        await recount_comment_counter(task_id)
     
     return {"id": comment_id, "message": "Comment added successfully"}
 
+@app.delete("/api/tasks/{task_id}/comments/{comment_id}")
+async def delete_comment(task_id: str, comment_id: str, current_user: dict = Depends(get_current_user)):
+    comment = await db.comments.find_one({"id": comment_id, "task_id": task_id})
+    if not comment:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    if comment["user_id"] != current_user["id"] and current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only the author or CEO can delete a comment")
+    
+    result = await db.comments.delete_one({"id": comment_id})
+    if result.deleted_count:
+        task = await db.tasks.find_one_and_update({"id": task_id, "comment_count": {"$exists": True}}, {"$inc": {"comment_count": -1}}, projection={"last_comment_at": 1})
+        if not task:
+            await recount_comment_counter(task_id)
+        elif task.get("last_comment_at") == comment["created_at"]:
+            await refresh_last_comment_at(task_id)
+    
+    return {"message": "Comment deleted successfully"}
+
+# ==================== PAYROLL ROUTES ====================
+
+# Allocated staff_cost within this much of the summed staff payments counts as reconciled
+PAYROLL_MISMATCH_TOLERANCE = float(os.environ.get("PAYROLL_MISMATCH_TOLERANCE", "0.01"))
+COST_FIELDS = ["staff_cost", "commission", "tax", "admin_fee", "overhead_cost"]
+
+def worker_payroll_pipeline() -> list:
+    return [
+        {"$match": {"staff_list.0": {"$exists": True}}},
+        # Fixed contract order so $last picks the name from the most recently updated contract
+        {"$sort": {"updated_at": 1, "_id": 1}},
+        {"$unwind": "$staff_list"},
+        {"$group": {
+            "_id": "$staff_list.user_id",
+            "user_name": {"$last": "$staff_list.user_name"},
+            "total_payment": {"$sum": "$staff_list.payment_amount"},
+            "assignments": {"$sum": 1},
+            "contracts": {"$addToSet": "$id"}
+        }},
+        {"$project": {"_id": 0, "user_id": "$_id", "user_name": 1, "total_payment": 1, "assignments": 1, "contract_count": {"$size": "$contracts"}}},
+        {"$sort": {"total_payment": -1}}
+    ]
+
+def contract_payroll_pipeline() -> list:
+    return [
+        {"$project": {
+            "_id": 0, "id": 1, "contract_number": 1, "project_name": 1, "contract_value": 1,
+            **{field: 1 for field in COST_FIELDS},
+            "payroll_total": {"$sum": "$staff_list.payment_amount"},
+            "staff_assigned": {"$size": {"$ifNull": ["$staff_list", []]}}
+        }},
+        {"$sort": {"contract_number": 1}}
+    ]
+
+def reconcile_row(row: dict) -> dict:
+    allocated = row.get("staff_cost") or 0
+    row["difference"] = round(row["payroll_total"] - allocated, 2)
+    row["mismatch"] = abs(row["difference"]) > PAYROLL_MISMATCH_TOLERANCE
+    return row
+
+def require_payroll_access(current_user: dict):
+    if current_user["role"] not in ["ceo", "finance"]:
+        raise HTTPException(status_code=403, detail="Only CEO or Finance can view payroll")
+
+@app.get("/api/payroll/workers", dependencies=[Depends(heavy_route)])
+async def get_worker_payroll(current_user: dict = Depends(get_current_user)):
+    """Per-worker payout totals across every contract's staff_list"""
+    require_payroll_access(current_user)
+    with db_timeout():
+        workers = await analytics_db.contracts.aggregate(worker_payroll_pipeline()).to_list(None)
+    return {"workers": workers, "total_payment": sum(worker["total_payment"] for worker in workers)}
+
+@app.get("/api/payroll/contracts", dependencies=[Depends(heavy_route)])
+async def get_contract_payroll(mismatched_only: bool = False, current_user: dict = Depends(get_current_user)):
+    """Per-contract staff payments reconciled against the allocated staff_cost"""
+    require_payroll_access(current_user)
+    with db_timeout():
+        rows = [reconcile_row(row) async for row in analytics_db.contracts.aggregate(contract_payroll_pipeline())]
+    contracts = [row for row in rows if row["mismatch"]] if mismatched_only else rows
+    return {
+        "contracts": contracts,
+        "mismatched": sum(1 for row in rows if row["mismatch"]),
+        "payroll_total": sum(row["payroll_total"] for row in rows),
+        "allocated_total": sum(row.get("staff_cost") or 0 for row in rows)
+    }
+
+@app.post("/api/payroll/reconcile")
+async def reconcile_payroll(dry_run: bool = False, current_user: dict = Depends(get_current_user)):
+    """Set staff_cost to the summed staff payments on every mismatched contract and
+    recompute its profit in a single bulk write. Contracts with no staff assigned yet are
+    left alone: their allocation is a budget, not a payroll total to be zeroed."""
+    require_payroll_access(current_user)
+    
+    # Read from the primary: these rows drive writes
+    mismatched = [row for row in map(reconcile_row, await db.contracts.aggregate(contract_payroll_pipeline()).to_list(None)) if row["mismatch"]]
+    rows = [row for row in mismatched if row["staff_assigned"]]
+    now = datetime.utcnow()
+    updates = []
+    for row in rows:
+        row["previous_staff_cost"] = row.get("staff_cost")
+        row["staff_cost"] = row["payroll_total"]
+        costs = {field: row.get(field) or 0 for field in COST_FIELDS}
+        row["target_profit"], row["actual_profit"], row["profit_status"] = calculate_profits(row.get("contract_value") or 0, **costs)
+        updates.append(UpdateOne(
+            # Skip contracts whose allocation changed since we read it
+            {"id": row["id"], "staff_cost": row["previous_staff_cost"]},
+            {"$set": {
+                "staff_cost": row["payroll_total"],
+                "target_profit": row["target_profit"],
+                "actual_profit": row["actual_profit"],
+                "profit_status": row["profit_status"],
+                "payroll_reconciled_at": now,
+                "updated_at": now
+            }}
+        ))
+    
+    updated = 0
+    if updates and not dry_run:
+        result = await db.contracts.bulk_write(updates, ordered=False)
+        updated = result.modified_count
+        for row in rows:
+            enqueue_risk_refresh(row["id"])
+        await db.activities.insert_many([{
+            "id": str(uuid.uuid4()),
+            "user_id": current_user["id"],
+            "user_name": current_user["name"],
+            "action": "reconciled payroll for",
+            "entity_type": "contract",
+            "entity_id": row["id"],
+            "entity_name": row["contract_number"],
+            "contract_id": row["id"],
+            "created_at": now
+        } for row in rows])
+    return {"dry_run": dry_run, "mismatched": len(rows), "skipped_unstaffed": len(mismatched) - len(rows), "updated": updated, "contracts": rows}
+
 # ==================== DASHBOARD ROUTES ====================
 
+# Tenant-wide dashboard numbers are cached per tenant (per worker) for this long; 0 disables
+DASHBOARD_CACHE_SECONDS = float(os.environ.get("DASHBOARD_CACHE_SECONDS", "15"))
+
+# tenant_id -> (expires_at monotonic, task computing the stats); concurrent misses share one task
+dashboard_cache = {}
+dashboard_cache_stats = {}
+
+def build_activity_filter(contract_id: Optional[str], entity_type: Optional[str], entity_id: Optional[str], user_id: Optional[str]) -> dict:
+    clauses = []
+    if contract_id:
+        # Contract-level activities older than the contract_id field only carry entity_id;
+        # both branches are indexed on (..., created_at, id) so Mongo merge-sorts them.
+        clauses.append({"$or": [
+            {"contract_id": contract_id},
+            {"entity_type": "contract", "entity_id": contract_id}
+        ]})
+    if entity_type:
+        clauses.append({"entity_type": entity_type})
+    if entity_id:
+        clauses.append({"entity_id": entity_id})
+    if user_id:
+        clauses.append({"user_id": user_id})
+    return {"$and": clauses} if len(clauses) > 1 else (clauses[0] if clauses else {})
+
 @app.get("/api/activities")
-async def get_activities(limit: int = 50, current_user: dict = Depends(get_current_user)):
+async def get_activities(
+    response: Response,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    contract_id: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Newest-first activity feed. Pass X-Next-Cursor back as `before` for older
+    entries and X-Prev-Cursor as `after` to page back towards newer ones."""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    limit = max(1, min(limit, 500))
+    
+    query = build_activity_filter(contract_id, entity_type, entity_id, user_id)
+    if current_user["role"] == "worker":
+        # Workers see the activity of contracts they are staffed on
+        scope = {"contract_id": {"$in": await staffed_contract_ids(current_user["id"])}}
+        query = {"$and": [query, scope]} if query else scope
+    sort_dir = -1
+    cursor = before or after
+    if cursor:
+        keyset = keyset_filter(cursor, older=bool(before))
+        query = {"$and": [query, keyset]} if query else keyset
+        if after:
+            sort_dir = 1
+    
     activities = []
-    async for activity in db.activities.find({}).sort("created_at", -1).limit(limit):
+    # Fetch one extra row to learn whether another page exists without a count.
+    async for activity in db.activities.find(query).sort([("created_at", sort_dir), ("id", sort_dir)]).limit(limit + 1):
         activity["_id"] = str(activity["_id"])
         activities.append(activity)
+    
+    has_more = len(activities) > limit
+    activities = activities[:limit]
+    if after:
+        activities.reverse()
+    
+    if activities:
+        older_exists = bool(after) or has_more
+        newer_exists = has_more if after else bool(before)
+        if older_exists:
+            response.headers["X-Next-Cursor"] = encode_cursor(activities[-1])
+        if newer_exists:
+            response.headers["X-Prev-Cursor"] = encode_cursor(activities[0])
     return activities
 
-@app.get("/api/dashboard/stats")
-async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    total_contracts = await db.contracts.count_documents({})
-    active_contracts = await db.contracts.count_documents({"project_status": "Active"})
-    pending_contracts = await db.contracts.count_documents({"project_status": "Pending"})
-    
-    pipeline = [{"$group": {"_id": None, "total_value": {"$sum": "$contract_value"}, "total_target_profit": {"$sum": "$target_profit"}, "total_actual_profit": {"$sum": "$actual_profit"}}}]
-    financial = await db.contracts.aggregate(pipeline).to_list(1)
-    financial_data = financial[0] if financial else {"total_value": 0, "total_target_profit": 0, "total_actual_profit": 0}
+async def tenant_dashboard_stats() -> dict:
+    # Served from the analytics pool; counts may lag writes by the configured max staleness
+    with db_timeout():
+        total_contracts = await analytics_db.contracts.count_documents({})
+        active_contracts = await analytics_db.contracts.count_documents({"project_status": "Active"})
+        pending_contracts = await analytics_db.contracts.count_documents({"project_status": "Pending"})
     
-    green_count = await db.contracts.count_documents({"profit_status": "green"})
-    orange_count = await db.contracts.count_documents({"profit_status": "orange"})
-    red_count = await db.contracts.count_documents({"profit_status": "red"})
+        pipeline = [{"$group": {"_id": None, "total_value": {"$sum": "$contract_value"}, "total_target_profit": {"$sum": "$target_profit"}, "total_actual_profit": {"$sum": "$actual_profit"}}}]
+        financial = await analytics_db.contracts.aggregate(pipeline).to_list(1)
+        financial_data = financial[0] if financial else {"total_value": 0, "total_target_profit": 0, "total_actual_profit": 0}
     
-    total_tasks = await db.tasks.count_documents({})
-    completed_tasks = await db.tasks.count_documents({"status": "done"})
-    in_progress_tasks = await db.tasks.count_documents({"status": "in_progress"})
-    overdue_tasks = await db.tasks.count_documents({"due_date": {"$lt": datetime.utcnow()}, "status": {"$ne": "done"}})
+        green_count = await analytics_db.contracts.count_documents({"profit_status": "green"})
+        orange_count = await analytics_db.contracts.count_documents({"profit_status": "orange"})
+        red_count = await analytics_db.contracts.count_documents({"profit_status": "red"})
     
-    total_users = await db.users.count_documents({"is_active": True})
+        total_tasks = await analytics_db.tasks.count_documents({})
+        completed_tasks = await analytics_db.tasks.count_documents({"status": "done"})
+        in_progress_tasks = await analytics_db.tasks.count_documents({"status": "in_progress"})
+        overdue_tasks = await analytics_db.tasks.count_documents({"is_overdue": True})
     
-    my_tasks = await db.tasks.count_documents({"assigned_to": current_user["id"]})
-    my_completed = await db.tasks.count_documents({"assigned_to": current_user["id"], "status": "done"})
+        total_users = await analytics_db.users.count_documents({"is_active": True})
     
     return {
         "contracts": {"total": total_contracts, "active": active_contracts, "pending": pending_contracts, "total_value": financial_data.get("total_value", 0), "total_target_profit": financial_data.get("total_target_profit", 0), "total_actual_profit": financial_data.get("total_actual_profit", 0)},
         "profit_status": {"green": green_count, "orange": orange_count, "red": red_count},
         "tasks": {"total": total_tasks, "completed": completed_tasks, "in_progress": in_progress_tasks, "overdue": overdue_tasks, "completion_rate": round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)},
-        "team": {"total_users": total_users},
+        "team": {"total_users": total_users}
+    }
+
+async def cached_tenant_dashboard_stats() -> dict:
+    if DASHBOARD_CACHE_SECONDS <= 0:
+        return await tenant_dashboard_stats()
+    tenant_id = current_tenant.get()
+    stats = dashboard_cache_stats.setdefault(tenant_id, {"hits": 0, "misses": 0})
+    entry = dashboard_cache.get(tenant_id)
+    if entry is None or entry[0] <= time.monotonic():
+        stats["misses"] += 1
+        # The task copies the current context, so it computes for this tenant
+        entry = dashboard_cache[tenant_id] = (time.monotonic() + DASHBOARD_CACHE_SECONDS, asyncio.ensure_future(tenant_dashboard_stats()))
+    else:
+        stats["hits"] += 1
+    try:
+        return await asyncio.shield(entry[1])
+    except Exception:
+        if dashboard_cache.get(tenant_id) is entry:
+            dashboard_cache.pop(tenant_id)
+        raise
+
+@app.get("/api/dashboard/stats", dependencies=[Depends(heavy_route)])
+async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
+    tenant_stats = await cached_tenant_dashboard_stats()
+    with db_timeout():
+        my_tasks = await analytics_db.tasks.count_documents({"assigned_to": current_user["id"]})
+        my_completed = await analytics_db.tasks.count_documents({"assigned_to": current_user["id"], "status": "done"})
+    
+    return {
+        **tenant_stats,
         "my_stats": {"total_tasks": my_tasks, "completed": my_completed, "completion_rate": round((my_completed / my_tasks * 100) if my_tasks > 0 else 0, 1)}
     }
 
+AT_RISK_PROJECTION = {
+    "_id": 0, "id": 1, "contract_number": 1, "client_name": 1, "project_name": 1, "project_end_date": 1,
+    "manual_status": 1, "profit_status": 1, "risk_score": 1, "risk": 1, "risk_as_of": 1
+}
+
+@app.get("/api/dashboard/at-risk")
+async def get_contracts_at_risk(limit: int = 10, current_user: dict = Depends(get_current_user)):
+    """Contracts with the highest stored risk score, read straight off the risk_score index"""
+    if current_user["role"] not in ["ceo", "finance", "operations"]:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    with db_timeout():
+        return await analytics_db.contracts.find({"risk_score": {"$gt": 0}}, AT_RISK_PROJECTION).sort("risk_score", -1).limit(max(1, min(limit, 100))).to_list(None)
+
 @app.get("/api/dashboard/my-tasks")
 async def get_my_tasks(current_user: dict = Depends(get_current_user)):
     tasks = []
     async for task in db.tasks.find({"assigned_to": current_user["id"]}).sort("due_date", 1):
         task["_id"] = str(task["_id"])
-        contract = await db.contracts.find_one({"id": task["contract_id"]})
-        if contract:
-            task["contract_number"] = contract["contract_number"]
-            task["project_name"] = contract.get("project_name")
         tasks.append(task)
+    await attach_missing_task_summaries(tasks)
     return tasks
 
-@app.get("/api/dashboard/team-performance")
+@app.get("/api/dashboard/team-performance", dependencies=[Depends(heavy_route)])
 async def get_team_performance(current_user: dict = Depends(get_current_user)):
     if current_user["role"] not in ["ceo", "operations"]:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    with db_timeout():
+        return await team_performance_rows(analytics_db)
+
+async def team_performance_rows(database, task_match: Optional[dict] = None) -> list:
+    """Per-user task counts for active users, optionally over a subset of tasks"""
+    stats = {
+        row["_id"]: row
+        async for row in database.tasks.aggregate([
+            {"$match": {**(task_match or {}), "assigned_to": {"$ne": None}}},
+            {"$group": {
+                "_id": "$assigned_to",
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": [{"$eq": ["$status", "done"]}, 1, 0]}},
+                "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", "in_progress"]}, 1, 0]}},
+                "overdue": {"$sum": {"$cond": [{"$eq": ["$is_overdue", True]}, 1, 0]}}
+            }}
+        ])
+    }
+    
     team_stats = []
-    async for user in db.users.find({"is_active": True}):
-        total = await db.tasks.count_documents({"assigned_to": user["id"]})
-        completed = await db.tasks.count_documents({"assigned_to": user["id"], "status": "done"})
-        in_progress = await db.tasks.count_documents({"assigned_to": user["id"], "status": "in_progress"})
-        overdue = await db.tasks.count_documents({"assigned_to": user["id"], "due_date": {"$lt": datetime.utcnow()}, "status": {"$ne": "done"}})
+    async for user in database.users.find({"is_active": True}, {"id": 1, "name": 1, "role": 1, "avatar": 1}):
+        user_stats = stats.get(user["id"], {})
+        total = user_stats.get("total", 0)
+        completed = user_stats.get("completed", 0)
         
         team_stats.append({
             "id": user["id"],
@@ -774,13 +3510,413 @@ async def get_team_performance(current_user: dict = Depends(get_current_user)):
             "avatar": user.get("avatar"),
             "total_tasks": total,
             "completed": completed,
-            "in_progress": in_progress,
-            "overdue": overdue,
+            "in_progress": user_stats.get("in_progress", 0),
+            "overdue": user_stats.get("overdue", 0),
             "completion_rate": round((completed / total * 100) if total > 0 else 0, 1)
         })
     
     return sorted(team_stats, key=lambda x: x["completion_rate"], reverse=True)
 
+WORKLOAD_MAX_BUCKETS = 400
+
+def workload_buckets(start: date, end: date, bucket: str):
+    """Period start dates covering [start, end]; weeks are aligned to Mondays"""
+    if bucket == "week":
+        start = start - timedelta(days=start.weekday())
+    step = 7 if bucket == "week" else 1
+    count = (end - start).days // step + 1
+    return start, step, [start + timedelta(days=i * step) for i in range(count)]
+
+def sweep_interval_loads(intervals, origin: date, step: int, count: int):
+    """Per-bucket count of overlapping intervals via a difference array: each interval adds
+    +1 at its first bucket and -1 after its last, and a prefix sum yields the load. O(n + buckets)."""
+    diff = [0] * (count + 1)
+    for first_day, last_day in intervals:
+        first = max(0, (first_day - origin).days // step)
+        last = min(count - 1, (last_day - origin).days // step)
+        if first > last:
+            continue
+        diff[first] += 1
+        diff[last + 1] -= 1
+    loads = []
+    running = 0
+    for i in range(count):
+        running += diff[i]
+        loads.append(running)
+    return loads
+
+@app.get("/api/dashboard/workload", dependencies=[Depends(heavy_route)])
+async def get_workload(start: date, end: date, bucket: str = "week", user_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Open tasks and contract staff assignments per user per day/week between start and end"""
+    if current_user["role"] not in ["ceo", "operations"]:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    if bucket not in ["day", "week"]:
+        raise HTTPException(status_code=400, detail="bucket must be day or week")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    
+    origin, step, periods = workload_buckets(start, end, bucket)
+    if len(periods) > WORKLOAD_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range too large: at most {WORKLOAD_MAX_BUCKETS} {bucket}s")
+    
+    range_start = datetime(start.year, start.month, start.day)
+    range_end = datetime(end.year, end.month, end.day) + timedelta(days=1)
+    
+    user_query = {"is_active": True}
+    if user_id:
+        user_query["id"] = user_id
+    task_query = {
+        "assigned_to": {"$ne": None},
+        "created_at": {"$lt": range_end},
+        "$or": [{"due_date": {"$gte": range_start}}, {"due_date": None}]
+    }
+    if user_id:
+        task_query["assigned_to"] = user_id
+    contract_query = {"staff_list.0": {"$exists": True}, "project_start_date": {"$ne": None}, "project_end_date": {"$ne": None}}
+    if user_id:
+        contract_query["staff_list.user_id"] = user_id
+    
+    task_intervals = {}
+    contract_intervals = {}
+    users = []
+    with db_timeout():
+        async for user in analytics_db.users.find(user_query, {"id": 1, "name": 1, "role": 1, "avatar": 1}):
+            users.append(user)
+        
+        async for task in analytics_db.tasks.find(task_query, {"assigned_to": 1, "status": 1, "created_at": 1, "due_date": 1, "completed_at": 1}):
+            task_start = parse_datetime(task.get("created_at")) or range_start
+            # A task occupies its assignee from creation until it is due, or until it was finished
+            task_end = parse_datetime(task.get("due_date")) or range_end
+            completed_at = parse_datetime(task.get("completed_at"))
+            if task.get("status") == "done" and completed_at:
+                task_end = min(task_end, completed_at)
+            if task_end < range_start:
+                continue
+            task_intervals.setdefault(task["assigned_to"], []).append((task_start.date(), task_end.date()))
+        
+        async for contract in analytics_db.contracts.find(contract_query, {"project_start_date": 1, "project_end_date": 1, "staff_list.user_id": 1}):
+            project_start = parse_datetime(contract.get("project_start_date"))
+            project_end = parse_datetime(contract.get("project_end_date"))
+            if not project_start or not project_end or project_end < range_start or project_start >= range_end:
+                continue
+            for staff_user_id in {staff["user_id"] for staff in contract.get("staff_list", [])}:
+                contract_intervals.setdefault(staff_user_id, []).append((project_start.date(), project_end.date()))
+    
+    workload = []
+    for user in users:
+        task_loads = sweep_interval_loads(task_intervals.get(user["id"], []), origin, step, len(periods))
+        contract_loads = sweep_interval_loads(contract_intervals.get(user["id"], []), origin, step, len(periods))
+        loads = [t + c for t, c in zip(task_loads, contract_loads)]
+        workload.append({
+            "id": user["id"],
+            "name": user["name"],
+            "role": user["role"],
+            "avatar": user.get("avatar"),
+            "tasks": task_loads,
+            "contracts": contract_loads,
+            "load": loads,
+            "peak_load": max(loads) if loads else 0
+        })
+    
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "periods": [period.isoformat() for period in periods],
+        "users": sorted(workload, key=lambda x: x["peak_load"], reverse=True)
+    }
+
+# ==================== REPORT ROUTES ====================
+
+def report_view(job: dict) -> dict:
+    progress = job.get("progress") or {"done": 0, "total": 0}
+    return {
+        **{k: v for k, v in job.items() if k not in ("_id", "worker", "lease_until")},
+        "progress": {**progress, "percent": round(progress["done"] / progress["total"] * 100, 1) if progress["total"] else 0.0}
+    }
+
+async def find_report_job(job_id: str, current_user: dict) -> dict:
+    job = await db.report_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job or (job["requested_by"] != current_user["id"] and current_user["role"] != "ceo"):
+        raise HTTPException(status_code=404, detail="Report not found")
+    return job
+
+@app.post("/api/reports", status_code=status.HTTP_202_ACCEPTED)
+async def create_report(request: ReportRequest, current_user: dict = Depends(get_current_user)):
+    """Queue a report; poll GET /api/reports/{id} and download the result when done"""
+    report_type = REPORT_TYPES.get(request.type)
+    if not report_type:
+        raise HTTPException(status_code=400, detail=f"Unknown report type. Use one of: {', '.join(REPORT_TYPES)}")
+    if current_user["role"] not in report_type["roles"]:
+        raise HTTPException(status_code=403, detail="Insufficient permissions for this report")
+    try:
+        params = report_type["params"](request.params)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid report parameters: {e}")
+    
+    # The same report already in flight for this user is returned instead of queued twice
+    existing = await db.report_jobs.find_one(
+        {"type": request.type, "params": params, "requested_by": current_user["id"], "status": {"$in": ["queued", "running"]}},
+        {"_id": 0}
+    )
+    if existing:
+        return report_view(existing)
+    
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": request.type,
+        "params": params,
+        "status": "queued",
+        "progress": {"done": 0, "total": 0},
+        "attempts": 0,
+        "requested_by": current_user["id"],
+        "requested_by_name": current_user["name"],
+        "created_at": datetime.utcnow()
+    }
+    await db.report_jobs.insert_one(job)
+    return report_view(job)
+
+@app.get("/api/reports")
+async def list_reports(limit: int = 50, current_user: dict = Depends(get_current_user)):
+    query = {} if current_user["role"] == "ceo" else {"requested_by": current_user["id"]}
+    jobs = await db.report_jobs.find(query, {"_id": 0}).sort("created_at", -1).to_list(max(1, min(limit, 200)))
+    return [report_view(job) for job in jobs]
+
+@app.get("/api/reports/{job_id}")
+async def get_report(job_id: str, current_user: dict = Depends(get_current_user)):
+    return report_view(await find_report_job(job_id, current_user))
+
+@app.get("/api/reports/{job_id}/result")
+async def download_report(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await find_report_job(job_id, current_user)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Report is {job['status']}")
+    path = os.path.join(REPORT_DIR, job["result_file"])
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=410, detail="Report file is no longer available")
+    return FileResponse(path, media_type="application/json", filename=f"{job['type']}-{job['id']}.json")
+
+@app.delete("/api/reports/{job_id}")
+async def delete_report(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Cancel a queued or running report, or delete a finished one and its file"""
+    job = await find_report_job(job_id, current_user)
+    if job["status"] in ["queued", "running"]:
+        await db.report_jobs.update_one({"id": job_id, "status": job["status"]}, {"$set": {"status": "cancelled", "finished_at": datetime.utcnow()}})
+        return {"message": "Report cancelled"}
+    await db.report_jobs.delete_one({"id": job_id})
+    if job.get("result_file"):
+        path = os.path.join(REPORT_DIR, job["result_file"])
+        await asyncio.to_thread(lambda: os.path.exists(path) and os.remove(path))
+    return {"message": "Report deleted"}
+
+# ==================== SYSTEM ROUTES ====================
+
+@app.get("/api/system/consistency-scan", dependencies=[Depends(heavy_route)])
+async def consistency_scan(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can run consistency scans")
+    return await run_consistency_scan()
+
+@app.post("/api/system/consistency-scan", dependencies=[Depends(heavy_route)])
+async def repair_orphans(current_user: dict = Depends(get_current_user)):
+    """Scan and queue every orphan's missing parent for the reaper"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can run consistency scans")
+    return await run_consistency_scan(repair=True)
+
+@app.get("/api/system/tombstones")
+async def get_tombstones(status: Optional[str] = None, limit: int = 50, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can view deletions")
+    
+    query = {"status": status} if status else {}
+    tombstones = []
+    async for tombstone in db.tombstones.find(query, {"document": 0}).sort("deleted_at", -1).limit(min(limit, 500)):
+        tombstone["_id"] = str(tombstone["_id"])
+        tombstones.append(tombstone)
+    return tombstones
+
+@app.get("/api/system/migrations")
+async def get_migrations(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can view system metrics")
+    
+    states = {state["_id"]: state async for state in db.schema_migrations.find({})}
+    migrations = []
+    for migration in MIGRATIONS:
+        state = states.get(tenant_key(migration["name"]), {})
+        migrations.append({
+            "name": migration["name"],
+            "collection": migration["collection"],
+            "version": migration["version"],
+            "status": state.get("status", "pending"),
+            "migrated": state.get("migrated", 0),
+            "conflicts": state.get("conflicts", 0),
+            "remaining": await db[migration["collection"]].count_documents(below_version(migration["version"])),
+            "started_at": state.get("started_at"),
+            "finished_at": state.get("finished_at")
+        })
+    return {"schema_versions": SCHEMA_VERSIONS, "migrations": migrations}
+
+@app.post("/api/system/migrations/run")
+async def trigger_migrations(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can run migrations")
+    
+    migrated = await run_migrations()
+    if migrated is None:
+        raise HTTPException(status_code=409, detail="Migrations are already running on another worker")
+    return {"migrated": migrated}
+
+@app.get("/api/system/read-model")
+async def get_read_model_stats(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can view system metrics")
+    
+    def queue_stats(stats: dict, risk: bool) -> dict:
+        pending = [enqueued_at for (_, kind, _), enqueued_at in summary_fanout_pending.items() if (kind == "risk") == risk]
+        processed = stats["processed"]
+        return {
+            **{k: v for k, v in stats.items() if k != "total_lag_ms"},
+            "avg_lag_ms": round(stats["total_lag_ms"] / processed, 3) if processed else None,
+            "pending": len(pending),
+            "oldest_pending_ms": round((time.monotonic() - min(pending)) * 1000, 3) if pending else None
+        }
+    
+    return {**queue_stats(summary_fanout_stats, risk=False), "risk_refresh": queue_stats(risk_refresh_stats, risk=True)}
+
+@app.post("/api/system/overdue-sweep")
+async def trigger_overdue_sweep(current_user: dict = Depends(get_current_user)):
+    """Run an overdue tick now instead of waiting for the scheduler"""
+    if current_user["role"] not in ["ceo", "operations"]:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    marked = await run_overdue_tick()
+    state = await db.scheduler_state.find_one({"_id": tenant_key("overdue_sweep")})
+    return {"marked_overdue": marked, "last_tick": state.get("last_tick") if state else None}
+
+@app.get("/api/system/profiling")
+async def get_profiling(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can manage profiling")
+    
+    captures = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            stat = os.stat(os.path.join(PROFILE_DIR, name))
+            captures.append({"name": name, "size": stat.st_size, "created_at": datetime.utcfromtimestamp(stat.st_mtime)})
+    return {
+        "profilers": PROFILERS,
+        "py_spy_available": shutil.which("py-spy") is not None,
+        "targets": [{k: v for k, v in target.items() if k != "pattern"} for target in profiling_targets.values()],
+        "captures": captures
+    }
+
+@app.put("/api/system/profiling")
+async def set_profiling_target(target: ProfilingTarget, current_user: dict = Depends(get_current_user)):
+    """Sample a fraction of requests to one route, e.g. {"route": "/api/contracts", "sample_rate": 0.05}"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can manage profiling")
+    if target.profiler not in PROFILERS:
+        raise HTTPException(status_code=400, detail=f"Profiler must be one of {', '.join(PROFILERS)}")
+    if not 0 < target.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be in (0, 1]")
+    
+    method = target.method.upper()
+    route = next((r for r in app.routes if getattr(r, "path", None) == target.route and method in getattr(r, "methods", set())), None)
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No {method} route {target.route}")
+    
+    profiling_targets[(method, target.route)] = {
+        **target.dict(),
+        "method": method,
+        "pattern": route.path_regex,
+        "captured": 0,
+        "last_capture": None,
+        "enabled_at": datetime.utcnow()
+    }
+    return {"message": f"Profiling {method} {target.route} at {target.sample_rate:.0%}"}
+
+@app.delete("/api/system/profiling")
+async def clear_profiling_target(route: Optional[str] = None, method: str = "GET", current_user: dict = Depends(get_current_user)):
+    """Stop profiling one route, or all routes when none is given"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can manage profiling")
+    if route is None:
+        profiling_targets.clear()
+    else:
+        profiling_targets.pop((method.upper(), route), None)
+    return {"message": "Profiling disabled"}
+
+@app.get("/api/system/profiling/captures/{name}")
+async def download_profile_capture(name: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can manage profiling")
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return FileResponse(path, filename=os.path.basename(name))
+
+@app.post("/api/system/profiling/py-spy")
+async def capture_py_spy(duration: int = 10, current_user: dict = Depends(get_current_user)):
+    """Whole-process sampling capture of this worker via py-spy (needs the py-spy binary and ptrace permission)"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can manage profiling")
+    py_spy = shutil.which("py-spy")
+    if py_spy is None:
+        raise HTTPException(status_code=503, detail="py-spy is not installed")
+    
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = profile_capture_name("process", f"pid_{os.getpid()}", "speedscope.json")
+    process = await asyncio.create_subprocess_exec(
+        py_spy, "record", "--pid", str(os.getpid()), "--duration", str(max(1, min(duration, 120))),
+        "--format", "speedscope", "--output", os.path.join(PROFILE_DIR, name), "--nonblocking",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise HTTPException(status_code=500, detail=f"py-spy failed: {stderr.decode()[-500:]}")
+    return {"name": name}
+
+@app.get("/api/system/tenant")
+async def get_tenant_metrics(current_user: dict = Depends(get_current_user)):
+    """The caller's tenant: where its data lives and its query load on this worker"""
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can view system metrics")
+    
+    tenant_id = current_tenant.get()
+    tenant = tenant_registry[tenant_id]
+    queries = {}
+    for collection_name, stats in sorted(tenant_query_stats.get(tenant_id, {}).items()):
+        queries[collection_name] = {
+            **stats,
+            "total_ms": round(stats["total_ms"], 3),
+            "max_ms": round(stats["max_ms"], 3),
+            "avg_ms": round(stats["total_ms"] / stats["ops"], 3) if stats["ops"] else 0.0
+        }
+    return {
+        "tenant": {"id": tenant_id, "name": tenant.get("name", tenant_id), "database": tenant["database"], "status": tenant["status"]},
+        "worker_pid": os.getpid(),
+        "queries": queries,
+        "slow_query_ms": TENANT_SLOW_QUERY_MS,
+        "dashboard_cache": {**dashboard_cache_stats.get(tenant_id, {"hits": 0, "misses": 0}), "ttl_seconds": DASHBOARD_CACHE_SECONDS}
+    }
+
+@app.get("/api/system/db-pool")
+async def get_db_pool_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Only CEO can view system metrics")
+    
+    return {
+        "primary": {**pool_metrics.snapshot(), "read_preference": mongo_options["readPreference"]},
+        "analytics": {
+            **analytics_pool_metrics.snapshot(),
+            "read_preference": analytics_mongo_options["readPreference"],
+            "max_staleness_seconds": analytics_mongo_options.get("maxStalenessSeconds")
+        },
+        "op_timeout_seconds": DB_OP_TIMEOUT_SECONDS
+    }
+
 if __name__ == "__main__":
+    # Single-process development server; production runs launcher.py
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,173 @@
+"""Tenant registry and relocation tooling, run against the same MONGO_URL as the API:
+
+    python tenants.py list
+    python tenants.py create acme "Acme Ltd" --ceo-email ceo@acme.com --ceo-password secret
+    python tenants.py sizes acme
+    python tenants.py relocate acme --database arc_tenant_acme
+
+Relocation moves one tenant's documents out of the shared database into its own. The
+tenant is marked "relocating" first: workers pick that up within TENANT_REFRESH_SECONDS
+and answer its requests with 503 + Retry-After and skip it in background loops, so the
+copy sees no concurrent writes. Documents are copied in batches (re-running after a
+failure is safe), indexes are built, counts are verified and only then is the registry
+flipped to the new database. The source copy is deleted last unless --keep-source is given.
+"""
+import argparse
+import asyncio
+import uuid
+from datetime import datetime
+
+from pymongo import ReplaceOne
+
+import server
+from server import client, control_db
+
+COPY_BATCH_SIZE = 1000
+
+async def tenant_collections(database_name: str) -> list:
+    names = await client[database_name].list_collection_names()
+    return sorted(name for name in names if name != "tenants" and not name.startswith("system."))
+
+async def load_tenant(tenant_id: str) -> dict:
+    await server.refresh_tenants()
+    tenant = server.tenant_registry.get(tenant_id)
+    if tenant is None:
+        raise SystemExit(f"Unknown tenant {tenant_id}")
+    return tenant
+
+async def list_tenants(args):
+    await server.refresh_tenants()
+    for tenant_id, tenant in sorted(server.tenant_registry.items()):
+        print(f"{tenant_id:<24} {tenant['status']:<12} {tenant['database']:<32} {tenant.get('name', '')}")
+
+async def create_tenant(args):
+    now = datetime.utcnow()
+    result = await control_db.tenants.update_one({"_id": args.tenant_id}, {"$setOnInsert": {
+        "name": args.name,
+        "database": server.CONTROL_DB_NAME,
+        "status": "active",
+        "created_at": now
+    }}, upsert=True)
+    if not result.upserted_id:
+        raise SystemExit(f"Tenant {args.tenant_id} already exists")
+    await server.refresh_tenants()
+    with server.tenant_context(args.tenant_id):
+        # A new tenant has no documents in old shapes, so its migrations start out done
+        for migration in server.MIGRATIONS:
+            await server.db.schema_migrations.insert_one({
+                "_id": server.tenant_key(migration["name"]), "status": "done", "version": migration["version"],
+                "collection": migration["collection"], "migrated": 0, "conflicts": 0, "started_at": now, "finished_at": now
+            })
+        await server.db.users.insert_one({
+            "id": str(uuid.uuid4()),
+            "email": args.ceo_email.lower(),
+            "password": server.get_password_hash(args.ceo_password),
+            "name": args.ceo_name,
+            "role": "ceo",
+            "department": "Executive",
+            "is_active": True,
+            "is_approved": True,
+            "created_at": now,
+            "avatar": f"https://ui-avatars.com/api/?name={args.ceo_name.replace(' ', '+')}&background=B22222&color=fff&bold=true"
+        })
+    print(f"Created tenant {args.tenant_id}; its CEO logs in as {args.ceo_email} with X-Tenant-ID: {args.tenant_id}")
+
+async def tenant_sizes(args):
+    """Document counts per collection, to spot tenants worth relocating"""
+    tenant = await load_tenant(args.tenant_id)
+    for name in await tenant_collections(tenant["database"]):
+        count = await client[tenant["database"]][name].count_documents({"tenant_id": args.tenant_id})
+        if count:
+            print(f"{name:<24} {count:>12}")
+
+async def copy_collection(source, target, tenant_id: str) -> int:
+    copied = 0
+    last_id = None
+    while True:
+        query = {"tenant_id": tenant_id}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await source.find(query).sort("_id", 1).to_list(COPY_BATCH_SIZE)
+        if not batch:
+            return copied
+        await target.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch], ordered=False)
+        copied += len(batch)
+        last_id = batch[-1]["_id"]
+
+async def delete_source(source, tenant_id: str) -> int:
+    deleted = 0
+    while True:
+        ids = [doc["_id"] async for doc in source.find({"tenant_id": tenant_id}, {"_id": 1}).limit(COPY_BATCH_SIZE)]
+        if not ids:
+            return deleted
+        deleted += (await source.delete_many({"_id": {"$in": ids}})).deleted_count
+        await asyncio.sleep(server.REAPER_BATCH_PAUSE_SECONDS)
+
+async def set_status(tenant_id: str, fields: dict):
+    await control_db.tenants.update_one(
+        {"_id": tenant_id},
+        {"$set": fields, "$setOnInsert": {"name": tenant_id, "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def relocate_tenant(args):
+    tenant = await load_tenant(args.tenant_id)
+    source_name, target_name = tenant["database"], args.database or f"arc_tenant_{args.tenant_id}"
+    if source_name == target_name:
+        raise SystemExit(f"Tenant {args.tenant_id} already lives in {target_name}")
+    source, target = client[source_name], client[target_name]
+
+    await set_status(args.tenant_id, {"status": "relocating", "database": source_name})
+    wait = server.TENANT_REFRESH_SECONDS * 2 + server.DB_OP_TIMEOUT_SECONDS
+    print(f"Tenant {args.tenant_id} is offline from now; waiting {wait:.0f}s for in-flight requests")
+    await asyncio.sleep(wait)
+    try:
+        collections = await tenant_collections(source_name)
+        for name in collections:
+            copied = await copy_collection(source[name], target[name], args.tenant_id)
+            print(f"Copied {copied} {name}")
+        progress = {"existing": 0, "built": 0, "failed": [], "building": None}
+        await server.reconcile_indexes(target_name, progress)
+        if progress["failed"]:
+            raise RuntimeError(f"Index builds failed: {progress['failed']}")
+        for name in collections:
+            expected = await source[name].count_documents({"tenant_id": args.tenant_id})
+            actual = await target[name].count_documents({"tenant_id": args.tenant_id})
+            if expected != actual:
+                raise RuntimeError(f"{name}: {expected} documents in {source_name} but {actual} in {target_name}")
+    except BaseException:
+        await set_status(args.tenant_id, {"status": "active", "database": source_name})
+        print(f"Relocation aborted; tenant {args.tenant_id} is back online in {source_name}")
+        raise
+
+    await set_status(args.tenant_id, {"status": "active", "database": target_name, "relocated_from": source_name, "relocated_at": datetime.utcnow()})
+    print(f"Tenant {args.tenant_id} now lives in {target_name}")
+    if not args.keep_source:
+        for name in collections:
+            await delete_source(source[name], args.tenant_id)
+        print(f"Removed tenant {args.tenant_id} documents from {source_name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list").set_defaults(handler=list_tenants)
+    create = commands.add_parser("create")
+    create.add_argument("tenant_id")
+    create.add_argument("name")
+    create.add_argument("--ceo-email", required=True)
+    create.add_argument("--ceo-password", required=True)
+    create.add_argument("--ceo-name", default="CEO Administrator")
+    create.set_defaults(handler=create_tenant)
+    sizes = commands.add_parser("sizes")
+    sizes.add_argument("tenant_id")
+    sizes.set_defaults(handler=tenant_sizes)
+    relocate = commands.add_parser("relocate")
+    relocate.add_argument("tenant_id")
+    relocate.add_argument("--database")
+    relocate.add_argument("--keep-source", action="store_true")
+    relocate.set_defaults(handler=relocate_tenant)
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import axios from 'axios';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL || '';
+// Picks the tenant for login/signup; authenticated requests use the tenant in the token
+const TENANT_ID = process.env.REACT_APP_TENANT_ID || '';
 
 const api = axios.create({
   baseURL: API_URL,
@@ -10,6 +12,7 @@ const api = axios.create({
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('arc_token');
   if (token) config.headers.Authorization = `Bearer ${token}`;
+  if (TENANT_ID) config.headers['X-Tenant-ID'] = TENANT_ID;
   return config;
 });
 
@@ -39,6 +42,8 @@ export const usersAPI = {
 export const contractsAPI = {
   getAll: () => api.get('/api/contracts'),
   getOne: (id) => api.get(`/api/contracts/${id}`),
+  getDashboard: (id, params) => api.get(`/api/contracts/${id}/dashboard`, { params }),
+  getCriticalPath: (id, params) => api.get(`/api/contracts/${id}/critical-path`, { params }),
   create: (data) => api.post('/api/contracts', data),
   allocateFinance: (id, data) => api.put(`/api/contracts/${id}/finance`, data),
   updateOperations: (id, data) => api.put(`/api/contracts/${id}/operations`, data),
@@ -58,7 +63,22 @@ export const dashboardAPI = {
   getStats: () => api.get('/api/dashboard/stats'),
   getMyTasks: () => api.get('/api/dashboard/my-tasks'),
   getTeamPerformance: () => api.get('/api/dashboard/team-performance'),
+  getAtRisk: (limit = 10) => api.get('/api/dashboard/at-risk', { params: { limit } }),
   getActivities: (params) => api.get('/api/activities', { params }),
 };
 
+export const payrollAPI = {
+  getWorkers: () => api.get('/api/payroll/workers'),
+  getContracts: (params) => api.get('/api/payroll/contracts', { params }),
+  reconcile: (params) => api.post('/api/payroll/reconcile', null, { params }),
+};
+
+export const reportsAPI = {
+  create: (type, params = {}) => api.post('/api/reports', { type, params }),
+  getAll: () => api.get('/api/reports'),
+  getById: (id) => api.get(`/api/reports/${id}`),
+  download: (id) => api.get(`/api/reports/${id}/result`, { responseType: 'blob' }),
+  remove: (id) => api.delete(`/api/reports/${id}`),
+};
+
 export default api;